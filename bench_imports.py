@@ -0,0 +1,71 @@
+# Import time guard of the data readers and solvers
+# Every module is imported in a fresh interpreter, the import fails the check when it pulls in the plotting stack
+# (geopandas, matplotlib) or takes longer than its time limit
+
+import argparse
+import subprocess
+import sys
+
+MODULES = [
+    'utils', 'heuristics', 'matrix_model', 'frontier', 'sweep', 'presolve', 'knearest', 'lagrangian', 'geo',
+    'metrics', 'scenarios', 'weighted_sum', 'result_cache', 'portfolio',
+    'fitness_cache', 'parallel_eval',
+    'warehouse_1', 'warehouse_2', 'warehouse_3', 'warehouse_4',
+    'warehouse_1_pymoo', 'warehouse_2_pymoo', 'warehouse_3_pymoo', 'warehouse_pareto_pymoo',
+]
+
+# Default time limit in seconds: the data readers and MILP solver scripts load numpy and pulp only, the GA scripts also
+# pay for pymoo and are only checked for the plotting stack
+TIME_LIMIT = 0.2
+NO_TIME_LIMIT = ['warehouse_2_pymoo', 'warehouse_3_pymoo', 'warehouse_pareto_pymoo']
+
+# Modules only plotting.py may load
+PLOTTING = ['geopandas', 'matplotlib', 'shapely', 'fiona', 'pyogrio']
+
+PROBE = '''
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+loaded = [name for name in {plotting!r} if name in sys.modules]
+print(elapsed, ','.join(loaded))
+'''
+
+def timeImport(module):
+    # Returns (seconds, plotting modules loaded by the import)
+    result = subprocess.run([sys.executable, '-c', PROBE.format(module=module, plotting=PLOTTING)],
+                            capture_output=True, text=True, check=True)
+    elapsed, loaded = result.stdout.split('\n')[0].split(' ')
+    return float(elapsed), [name for name in loaded.split(',') if name]
+
+if __name__ == '__main__':
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description='Import time guard')
+    parser.add_argument('-m', '--modules', nargs='+', default=MODULES,
+                        help='Modules to import')
+    parser.add_argument('-t', '--time-limit', type=float, default=None,
+                        help=f'Fail when an import takes longer than this many seconds, by default {TIME_LIMIT} s '
+                             f'for every module but {", ".join(NO_TIME_LIMIT)}')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='Number of imports per module, the fastest one is reported')
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules:
+        runs = [timeImport(module) for _ in range(args.repeat)]
+        elapsed = min(seconds for seconds, _ in runs)
+        loaded = runs[0][1]
+
+        time_limit = args.time_limit
+        if time_limit is None and module not in NO_TIME_LIMIT:
+            time_limit = TIME_LIMIT
+
+        problems = []
+        if loaded:
+            problems.append(f"loads {', '.join(loaded)}")
+        if time_limit is not None and elapsed > time_limit:
+            problems.append(f"slower than {time_limit:.2f} s")
+        failed |= bool(problems)
+        print(f"{module:24s} {elapsed * 1000:8.1f} ms  {'; '.join(problems) or 'ok'}")
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,365 @@
+# Benchmark suite of the warehouse placement entry points on synthetic instances (generate_instance.py)
+# Every (entry point, instance) pair runs in a fresh process with a fixed seed, a time limit and optionally a memory
+# limit, the load, build, solve and evaluate phases are timed and the peak memory of the process is recorded
+# Runs are appended to a JSON history and compared against a stored baseline to flag regressions
+
+import argparse
+import contextlib
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import traceback
+import numpy as np
+from generate_instance import KINDS, ensureInstance
+
+ENTRY_POINTS = ['warehouse_1', 'warehouse_2', 'warehouse_3', 'warehouse_4', 'warehouse_4_lagrangian',
+                'warehouse_1_pymoo', 'warehouse_2_pymoo', 'warehouse_3_pymoo']
+
+# Entry points that optimize the same objective on the same constraints, used for the gap to the best known objective
+FAMILIES = {
+    'warehouse_1': 'pcenter', 'warehouse_1_pymoo': 'pcenter',
+    'warehouse_2': 'capacitated', 'warehouse_2_pymoo': 'capacitated',
+    'warehouse_3': 'budget', 'warehouse_3_pymoo': 'budget',
+    'warehouse_4': 'variable_capacity', 'warehouse_4_lagrangian': 'variable_capacity',
+}
+
+@contextlib.contextmanager
+def phase(timings, name):
+    start = time.perf_counter()
+    yield
+    timings[name] = time.perf_counter() - start
+
+def instanceParameters(instance):
+    # Warehouse count and budgets that keep every formulation feasible, scaled like the Rajasthan defaults
+    # Enough warehouses to hold 125% of the total demand at the mean supply, budgets for that many warehouses
+    N = instance.n_cities
+    total_demand = float(np.sum(instance.demand))
+    n_warehouses = int(min(max(np.ceil(1.25 * total_demand / np.mean(instance.supply)), 2), N))
+    mean_fixed = float(np.mean(instance.fixedCost))
+    return {
+        "n_warehouses": n_warehouses,
+        "budget_3": 1.25 * n_warehouses * mean_fixed,
+        "budget_4": float(np.mean(instance.scalingCost)) * total_demand + max(2, n_warehouses // 2) * mean_fixed,
+    }
+
+def _maxDistance(instance, assignment):
+    return float(np.asarray(instance.distances)[np.arange(instance.n_cities), assignment].max())
+
+def _solveMatrix(instance, params, timings, options, build, evaluate, check):
+    # build(I, p, arcs) returns the model, check(I, p) the optimality check of the k-nearest mode (knearest.py)
+    if options['nearest'] is not None:
+        from knearest import solveNearest
+        # Every round builds and solves its own model, the time limit holds for each solve
+        with phase(timings, 'solve'):
+            model, status, obj, x, rounds = solveNearest(lambda arcs: build(instance, params, arcs),
+                                                         instance.distances, options['nearest'],
+                                                         check(instance, params), options['backend'],
+                                                         time_limit=options['time_limit'])
+    else:
+        with phase(timings, 'build'):
+            model = build(instance, params, None)
+            model.matrix()
+        with phase(timings, 'solve'):
+            status, obj, x = model.solve(options['backend'], time_limit=options['time_limit'])
+    result = {"status": int(status), "objective": None, "gap": model.solve_stats.get("mip_gap"),
+              "n_vars": model.n_vars, "n_constraints": model.n_rows, "nonzeros": int(model.matrix().nnz)}
+    if options['nearest'] is not None:
+        result["rounds"] = len(rounds)
+    if x is not None and status != -1:
+        with phase(timings, 'evaluate'):
+            result["objective"] = evaluate(instance, params, model.assignment(x), x)
+    return result
+
+def _pCenter(instance, params, timings, options):
+    from matrix_model import buildPCenter
+    from knearest import radiusCheck
+    return _solveMatrix(instance, params, timings, options,
+                        lambda I, p, arcs: buildPCenter(I.distances, p["n_warehouses"], arcs),
+                        lambda I, p, a, x: _maxDistance(I, a),
+                        lambda I, p: radiusCheck(I.distances))
+
+def _capacitated(instance, params, timings, options):
+    from matrix_model import buildCapacitatedPCenter
+    from knearest import radiusCheck
+    return _solveMatrix(instance, params, timings, options,
+                        lambda I, p, arcs: buildCapacitatedPCenter(I.distances, I.supply, I.demand,
+                                                                   p["n_warehouses"], arcs),
+                        lambda I, p, a, x: _maxDistance(I, a),
+                        lambda I, p: radiusCheck(I.distances))
+
+def _budget(instance, params, timings, options):
+    from matrix_model import buildBudgetPCenter
+    from knearest import radiusCheck
+    return _solveMatrix(instance, params, timings, options,
+                        lambda I, p, arcs: buildBudgetPCenter(I.distances, I.supply, I.demand, I.fixedCost,
+                                                              p["budget_3"], arcs),
+                        lambda I, p, a, x: _maxDistance(I, a),
+                        lambda I, p: radiusCheck(I.distances))
+
+def _variableCapacity(instance, params, timings, options):
+    from matrix_model import buildVariableCapacity
+    from knearest import lagrangianCheck
+    def operatingCost(I, p, assignment, x):
+        return float(np.asarray(I.demand) @ np.asarray(I.distances)[np.arange(I.n_cities), assignment])
+    return _solveMatrix(instance, params, timings, options,
+                        lambda I, p, arcs: buildVariableCapacity(I.distances, I.demand, I.fixedCost,
+                                                                 I.scalingCost, p["budget_4"], arcs),
+                        operatingCost,
+                        lambda I, p: lagrangianCheck(I.distances, I.demand, I.fixedCost, I.scalingCost,
+                                                     p["budget_4"]))
+
+def _variableCapacityLagrangian(instance, params, timings, options):
+    from lagrangian import lagrangianRelaxation
+    with phase(timings, 'solve'):
+        assignment, obj, lower, stats = lagrangianRelaxation(instance.distances, instance.demand, instance.fixedCost,
+                                                             instance.scalingCost, params["budget_4"],
+                                                             time_limit=options['time_limit'])
+    return {"status": 1 if assignment is not None else 0, "objective": obj if assignment is not None else None,
+            "gap": stats["gap"], "lower_bound": lower, "iterations": stats["iterations"]}
+
+def _geneticAlgorithm(instance, timings, options, build):
+    from pymoo.core.mixed import MixedVariableGA
+    from pymoo.optimize import minimize
+    from pymoo.termination.collection import TerminationCollection
+    from pymoo.termination.default import DefaultSingleObjectiveTermination
+    from pymoo.termination.max_time import TimeBasedTermination
+    from fitness_cache import CachedProblem
+
+    with phase(timings, 'build'):
+        problem = build()
+        cached = CachedProblem(problem)
+    termination = TerminationCollection(
+        DefaultSingleObjectiveTermination(xtol=1e-8, cvtol=1e-6, ftol=1e-6, period=100,
+                                          n_max_gen=options['generations']),
+        TimeBasedTermination(options['time_limit']),
+    )
+    with phase(timings, 'solve'):
+        res = minimize(cached, MixedVariableGA(pop_size=100), termination, seed=options['seed'], verbose=False)
+    result = {"status": 1 if res.X is not None else 0, "objective": None, "gap": None,
+              "n_vars": len(problem.vars), "evaluations": int(res.algorithm.evaluator.n_eval),
+              "generations": int(res.algorithm.n_gen), "cache": cached.stats()}
+    if res.X is not None:
+        with phase(timings, 'evaluate'):
+            X = np.empty(1, dtype=object)
+            X[0] = res.X
+            result["objective"] = float(problem.evaluate(X, return_as_dictionary=True)["F"][0, 0])
+    return result
+
+def _gaDistances(instance, options):
+    # (distances, coordinates) of the batch problems, with --coordinates no distance matrix is touched
+    return (None, instance.coordinates) if options['coordinates'] else (instance.distances, None)
+
+def _pCenterGA(instance, params, timings, options):
+    from warehouse_1_pymoo import WarehousePlacementBatch
+    distances, coordinates = _gaDistances(instance, options)
+    return _geneticAlgorithm(instance, timings, options, lambda: WarehousePlacementBatch(
+        instance.cities, distances, n_warehouses=params["n_warehouses"], coordinates=coordinates))
+
+def _capacitatedGA(instance, params, timings, options):
+    from warehouse_2_pymoo import WarehousePlacementBatch
+    distances, coordinates = _gaDistances(instance, options)
+    return _geneticAlgorithm(instance, timings, options, lambda: WarehousePlacementBatch(
+        instance.cities, distances, instance.supply, instance.demand, n_warehouses=params["n_warehouses"],
+        coordinates=coordinates))
+
+def _budgetGA(instance, params, timings, options):
+    from warehouse_3_pymoo import WarehousePlacementBatch
+    distances, coordinates = _gaDistances(instance, options)
+    return _geneticAlgorithm(instance, timings, options, lambda: WarehousePlacementBatch(
+        instance.cities, distances, instance.supply, instance.demand, instance.fixedCost,
+        budget=params["budget_3"], coordinates=coordinates))
+
+CASES = {
+    'warehouse_1': _pCenter,
+    'warehouse_2': _capacitated,
+    'warehouse_3': _budget,
+    'warehouse_4': _variableCapacity,
+    'warehouse_4_lagrangian': _variableCapacityLagrangian,
+    'warehouse_1_pymoo': _pCenterGA,
+    'warehouse_2_pymoo': _capacitatedGA,
+    'warehouse_3_pymoo': _budgetGA,
+}
+
+def _runCase(entry, directory, options, queue):
+    # Child process: run one entry point on one instance and put the result on the queue
+    from utils import loadInstance
+    if options['max_memory'] is not None:
+        limit = int(options['max_memory'] * 2**30)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    np.random.seed(options['seed'])
+
+    timings = {}
+    result = {"status": None}
+    try:
+        with phase(timings, 'load'):
+            instance = loadInstance(directory, coordinates=options['coordinates'])
+        params = instanceParameters(instance)
+        result = CASES[entry](instance, params, timings, options)
+        result["parameters"] = params
+    except MemoryError:
+        result = {"status": "memory"}
+    except Exception:
+        result = {"status": "error", "error": traceback.format_exc(limit=3)}
+    result["times"] = timings
+    result["peak_memory_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    queue.put(result)
+
+def runCase(entry, directory, options):
+    # Run a case in a fresh process, killed when it overruns the time limit by far
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_runCase, args=(entry, directory, options, queue))
+    start = time.perf_counter()
+    process.start()
+    try:
+        result = queue.get(timeout=2 * options['time_limit'] + 120)
+    except Exception:
+        result = {"status": "killed", "times": {}}
+    process.join(timeout=10)
+    if process.is_alive():
+        process.kill()
+        process.join()
+    result["times"]["total"] = time.perf_counter() - start
+    return result
+
+def _addGaps(results):
+    # Gap of every objective to the best one of its family on the same instance
+    best = {}
+    for r in results:
+        if r.get("objective") is not None:
+            key = (FAMILIES[r["entry"]], r["instance"])
+            best[key] = min(best.get(key, np.inf), r["objective"])
+    for r in results:
+        b = best.get((FAMILIES[r["entry"]], r["instance"]))
+        r["gap_to_best"] = None if r.get("objective") is None or not b else (r["objective"] - b) / b
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def appendHistory(filename, run):
+    # The history is a JSON list of runs, rewritten through a temporary file
+    history = []
+    if os.path.exists(filename):
+        with open(filename) as f:
+            history = json.load(f)
+    history.append(run)
+    os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+    with open(f'{filename}.{os.getpid()}.tmp', 'w') as f:
+        json.dump(history, f, indent=1)
+    os.replace(f'{filename}.{os.getpid()}.tmp', filename)
+
+def findRegressions(run, baseline, tolerance=0.25, min_seconds=0.1):
+    # Compare every result with the baseline result of the same entry point and instance
+    # Slower or larger by more than the tolerance, a worse objective, or no longer solved is a regression
+    previous = {(r["entry"], r["instance"]): r for r in baseline["results"]}
+    regressions = []
+    for r in run["results"]:
+        base = previous.get((r["entry"], r["instance"]))
+        if base is None:
+            continue
+        name = f"{r['entry']} on {r['instance']}"
+        if base.get("objective") is not None:
+            if r.get("objective") is None:
+                regressions.append(f"{name}: no solution (status {r['status']}), baseline {base['objective']:.4f}")
+            elif r["objective"] > base["objective"] + 1e-6 * max(1.0, abs(base["objective"])):
+                regressions.append(f"{name}: objective {r['objective']:.4f} > baseline {base['objective']:.4f}")
+        for key in ('load', 'build', 'solve', 'evaluate', 'total'):
+            now, before = r["times"].get(key), base["times"].get(key)
+            if now is not None and before is not None and now > before * (1 + tolerance) + min_seconds:
+                regressions.append(f"{name}: {key} {now:.2f} s > baseline {before:.2f} s")
+        if base.get("peak_memory_mb") and r.get("peak_memory_mb", 0) > base["peak_memory_mb"] * (1 + tolerance):
+            regressions.append(f"{name}: peak memory {r['peak_memory_mb']:.0f} MB > "
+                               f"baseline {base['peak_memory_mb']:.0f} MB")
+    return regressions
+
+def _format(value, spec):
+    return '-'.rjust(int(spec.split('.')[0])) if value is None else format(value, spec)
+
+if __name__ == '__main__':
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description='Warehouse placement benchmark suite')
+    parser.add_argument('-n', '--cities', type=int, nargs='+', default=[50, 200, 1000, 5000],
+                        help='Instance sizes')
+    parser.add_argument('-k', '--kind', choices=KINDS, nargs='+', default=KINDS,
+                        help='Uniform or clustered city coordinates')
+    parser.add_argument('-e', '--entries', choices=ENTRY_POINTS, nargs='+', default=ENTRY_POINTS,
+                        help='Entry points to run')
+    parser.add_argument('-s', '--seed', type=int, default=0,
+                        help='Seed of the instances and the genetic algorithms')
+    parser.add_argument('-t', '--time-limit', type=float, default=60.0,
+                        help='Time limit of every solve in seconds')
+    parser.add_argument('-g', '--generations', type=int, default=200,
+                        help='Maximum number of generations of the genetic algorithms')
+    parser.add_argument('--backend', choices=['highs', 'cbc'], default='highs',
+                        help='Solver of the MILP entry points')
+    parser.add_argument('--nearest', type=int, default=None,
+                        help='Solve the MILP entry points over the K nearest sites of every city, grown until optimal')
+    parser.add_argument('--coordinates', action='store_true',
+                        help='Evaluate the genetic algorithms on the city coordinates with KD-tree nearest warehouse queries')
+    parser.add_argument('--max-memory', type=float, default=None,
+                        help='Address space limit of every case in GB')
+    parser.add_argument('--instances', default='./Benchmarks/instances',
+                        help='Directory of the generated instances')
+    parser.add_argument('--history', default='./Benchmarks/history.json',
+                        help='JSON history every run is appended to')
+    parser.add_argument('--baseline', default='./Benchmarks/baseline.json',
+                        help='Run the results are compared against')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Store this run as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Relative slowdown or memory growth reported as a regression')
+    args = parser.parse_args()
+
+    options = {"time_limit": args.time_limit, "seed": args.seed, "generations": args.generations,
+               "backend": args.backend, "max_memory": args.max_memory, "coordinates": args.coordinates,
+               "nearest": args.nearest}
+    run = {
+        "timestamp": datetime.datetime.now().isoformat(timespec='seconds'),
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "machine": platform.node(),
+        "options": options,
+        "results": [],
+    }
+
+    print(f"{'entry':22s} {'instance':16s} {'status':>7s} {'objective':>12s} {'gap':>7s} "
+          f"{'load':>7s} {'build':>7s} {'solve':>8s} {'eval':>7s} {'MB':>7s}")
+    for kind in args.kind:
+        for n in args.cities:
+            directory = ensureInstance(args.instances, n, kind, args.seed)
+            for entry in args.entries:
+                result = runCase(entry, directory, options)
+                result.update(entry=entry, instance=os.path.basename(directory), kind=kind, n_cities=n)
+                run["results"].append(result)
+                t = result["times"]
+                print(f"{entry:22s} {result['instance']:16s} {str(result['status']):>7s} "
+                      f"{_format(result.get('objective'), '12.4f')} {_format(result.get('gap'), '7.4f')} "
+                      f"{_format(t.get('load'), '7.2f')} {_format(t.get('build'), '7.2f')} "
+                      f"{_format(t.get('solve'), '8.2f')} {_format(t.get('evaluate'), '7.3f')} "
+                      f"{_format(result.get('peak_memory_mb'), '7.0f')}")
+                sys.stdout.flush()
+
+    _addGaps(run["results"])
+    appendHistory(args.history, run)
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            regressions = findRegressions(run, json.load(f), args.tolerance)
+        for regression in regressions:
+            print("Regression:", regression)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(run, f, indent=1)
+
+    sys.exit(1 if regressions else 0)
@@ -1,24 +1,19 @@
-import subprocess, os, sys
 import matplotlib.pyplot as plt
 from tqdm import tqdm
+from utils import loadInstance
+from sweep import sweepWarehouses
 
 N_MAX = 32
 
-def sanitize(x):
-    return x.decode('utf-8').replace('\n', '').replace('\r', '')
+# Load the data once, each formulation keeps its model and warm starts from the previous warehouse count
+instance = loadInstance('./Rajasthan')
+bar_format = '{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}]'
 
-for n in tqdm(range(1, N_MAX+1), bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}]'):
-    output1 = sanitize(subprocess.check_output([sys.executable, 'warehouse_1.py', '-n', str(n), '-p']))
-    if output1 == "Infeasible":
-        plt.plot(n, float('inf'), 'ro')
-    else:
-        plt.plot(n, float(output1), 'ro')
-
-    output2 = sanitize(subprocess.check_output([sys.executable, 'warehouse_2.py', '-n', str(n), '-p']))
-    if output2 == "Infeasible":
-        plt.plot(n, float('inf'), 'bo')
-    else:
-        plt.plot(n, float(output2), 'bo')
+for formulation, marker in [('pcenter', 'ro'), ('capacitated', 'bo')]:
+    objectives = []
+    for n, status, obj, _ in tqdm(sweepWarehouses(instance, formulation, range(1, N_MAX+1)), total=N_MAX, bar_format=bar_format):
+        objectives.append(obj if status == 1 else float('inf'))
+    plt.plot(range(1, N_MAX+1), objectives, marker)
 
 plt.title('Max Delivery Distance vs Number of Warehouses')
 plt.legend(['Without Demand and Supply Constraints', 'With Demand and Supply Constraints'])
@@ -26,4 +21,4 @@ plt.xlabel('Number of Warehouses')
 plt.ylabel('Max Delivery Distance')
 plt.xticks(range(1, N_MAX+1, 5))
 plt.savefig('./Plots/compare_v1_v2.png')
-plt.show()
\ No newline at end of file
+plt.show()
@@ -0,0 +1,108 @@
+# Memoize fitness evaluations of the pymoo warehouse placement problems
+# The integer encoding (w_0 .. w_{k-1}) makes every permutation of the same warehouse set a different genome,
+# so genomes are keyed on their sorted warehouse indices and every permutation shares one cache entry
+# Binary genomes (x_0 .. x_{n-1}) are already canonical and are keyed on their packed bits
+
+from collections import OrderedDict
+import numpy as np
+from pymoo.core.problem import Problem
+from pymoo.core.variable import Integer
+from utils import populationMatrix
+
+class CachedProblem(Problem):
+    def __init__(self, problem, max_size=100000):
+        self.problem = problem
+        self.max_size = max_size # Least recently used entries are evicted beyond this size
+        self.entries = OrderedDict() # Not named "cache", pymoo stores its pareto front cache under that attribute
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.n_vars = len(problem.vars)
+        self.prefix = next(iter(problem.vars)).split('_')[0]
+        # Warehouse index genomes are permutation invariant
+        self.canonical = all(isinstance(var, Integer) for var in problem.vars.values())
+        # One constraint per warehouse slot (warehouse_2_pymoo), these follow the warehouse when the genome is sorted
+        self.slot_constraints = self.canonical and problem.n_ieq_constr == self.n_vars
+
+        # Forward the attributes the scripts read from the problem
+        for name in ('cities', 'n_cities', 'n_warehouses'):
+            if hasattr(problem, name):
+                setattr(self, name, getattr(problem, name))
+
+        super().__init__(vars=problem.vars, n_obj=problem.n_obj, n_eq_constr=problem.n_eq_constr,
+                         n_ieq_constr=problem.n_ieq_constr)
+
+    def __deepcopy__(self, memo):
+        # save_history deep copies the algorithm with its problem every generation, the snapshots share the entries
+        return self
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self.entries),
+            "hit_rate": self.hits / total if total > 0 else 0.0,
+        }
+
+    def _evaluate(self, X, out, *args, **kwargs):
+        W = populationMatrix(X, self.n_vars, self.prefix)
+        n_pop = len(W)
+
+        if self.canonical:
+            # Stable sort, so duplicated warehouses keep their original order and the first copy still gets the demand
+            perm = np.argsort(W, axis=1, kind='stable')
+            W = np.take_along_axis(W, perm, axis=1)
+            keys = [row.tobytes() for row in W]
+        else:
+            keys = [row.tobytes() for row in np.packbits(W.astype(bool), axis=1)]
+
+        F = np.empty((n_pop, self.n_obj))
+        G = np.empty((n_pop, self.n_ieq_constr))
+
+        # Look up every individual, evaluating each missing canonical genome only once
+        missing = OrderedDict()
+        for i, key in enumerate(keys):
+            entry = self.entries.get(key)
+            if entry is None:
+                missing.setdefault(key, []).append(i)
+                continue
+            self.entries.move_to_end(key)
+            self.hits += 1
+            F[i], G[i] = entry
+
+        if missing:
+            self.misses += len(missing)
+            first = [indices[0] for indices in missing.values()]
+            if self.canonical:
+                # Evaluate the sorted genomes, so constraints are stored in canonical slot order
+                X_missing = np.empty(len(first), dtype=object)
+                X_missing[:] = [{f"{self.prefix}_{j}": W[i, j] for j in range(self.n_vars)} for i in first]
+            else:
+                X_missing = np.asarray(X)[first]
+            result = self.problem.evaluate(X_missing, return_as_dictionary=True)
+            F_missing = np.asarray(result["F"]).reshape(len(first), self.n_obj)
+            G_missing = np.asarray(result["G"]).reshape(len(first), self.n_ieq_constr) if self.n_ieq_constr > 0 \
+                else np.empty((len(first), 0))
+
+            for (key, indices), f, g in zip(missing.items(), F_missing, G_missing):
+                self.entries[key] = (f, g)
+                F[indices], G[indices] = f, g
+                # Duplicates within the same population count as hits
+                self.hits += len(indices) - 1
+
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+        if self.slot_constraints:
+            # Move the constraints back from the sorted slot order to the order of the genome
+            G_ordered = np.empty_like(G)
+            np.put_along_axis(G_ordered, perm, G, axis=1)
+            G = G_ordered
+
+        out["F"] = F
+        if self.n_ieq_constr > 0:
+            out["G"] = G
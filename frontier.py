@@ -0,0 +1,37 @@
+# Optimal objective as a function of the budget (warehouse_3.py, warehouse_4.py)
+# The optimum is a non-increasing step function of the budget, so it is enough to visit its breakpoints:
+# solve for the best objective below the current budget, then for the smallest budget that still reaches it.
+# Every budget between that breakpoint and the current one gives the same answer and is skipped,
+# the next search starts just below the breakpoint, with the objective bounded below by the one just found
+
+import numpy as np
+
+def budgetFrontier(model, backend='highs', tolerance=1e-6, time_limit=None):
+    # model is a MatrixModel with a named 'budget' row, its objective is the one traded off against the budget
+    # Yields (budget, objective, x) from the largest budget down, the objective is optimal on [budget, previous budget)
+    primary = model.c.copy()
+    cost = model.rowVector('budget')
+
+    # Row holding the primary objective, bounded from above while the budget is minimized
+    columns = np.flatnonzero(primary)
+    model.addRows(np.zeros(len(columns)), columns, primary[columns], -np.inf, np.inf, name='objective')
+
+    budget, lower = np.inf, -np.inf
+    while True:
+        # Best objective within the budget, it can't be better than the one found at the larger budget
+        model.setObjective(primary)
+        model.setBounds('budget', -np.inf, budget)
+        model.setBounds('objective', lower, np.inf)
+        status, obj, _ = model.solve(backend, time_limit=time_limit)
+        if status != 1:
+            return
+
+        # Smallest budget reaching that objective, this is the breakpoint
+        model.setObjective(cost)
+        model.setBounds('objective', -np.inf, obj + tolerance * max(1, abs(obj)))
+        status, spent, x = model.solve(backend, time_limit=time_limit)
+        if status != 1:
+            return
+        yield spent, obj, x
+
+        budget, lower = spent - tolerance * max(1, abs(spent)), obj
@@ -0,0 +1,84 @@
+# Synthetic warehouse placement instances in the csv schema of ./Rajasthan
+# Cities are points in a square region, either uniform or in gaussian clusters, distances are euclidean in km
+# Demand, supply and costs are drawn around the values of the Rajasthan instance, so the same scripts apply
+
+import argparse
+import csv
+import os
+import numpy as np
+from utils import loadInstance
+
+KINDS = ['uniform', 'clustered']
+
+def generateCoordinates(n_cities, kind='uniform', size=800.0, n_clusters=None, rng=None):
+    # (n_cities, 2) coordinates in km inside a size x size square
+    rng = np.random.default_rng(rng)
+    if kind == 'uniform':
+        return rng.uniform(0, size, (n_cities, 2))
+    n_clusters = n_clusters or max(2, int(np.sqrt(n_cities) / 2))
+    centers = rng.uniform(0.1 * size, 0.9 * size, (n_clusters, 2))
+    # Cluster sizes follow a power law, a few large metro areas and many small towns
+    weights = rng.pareto(1.5, n_clusters) + 1
+    labels = rng.choice(n_clusters, n_cities, p=weights / weights.sum())
+    points = centers[labels] + rng.normal(0, size / (4 * np.sqrt(n_clusters)), (n_cities, 2))
+    return np.clip(points, 0, size)
+
+def generateInstance(directory, n_cities, kind='uniform', seed=0, size=800.0):
+    # Write distances.csv, demand.csv, supply.csv, cost.csv and coordinates.csv, returns the coordinates
+    rng = np.random.default_rng(seed)
+    points = generateCoordinates(n_cities, kind, size, rng=rng)
+    cities = [f"City_{k:05d}" for k in range(n_cities)]
+
+    demand = np.round(rng.lognormal(0, 0.3, n_cities), 3)
+    variance = np.round(0.1 * demand, 4)
+    supply = np.round(rng.uniform(5, 15, n_cities), 2)
+    fixed_cost = np.round(rng.uniform(1, 2, n_cities), 2)
+    scaling_cost = np.full(n_cities, 0.5)
+
+    os.makedirs(directory, exist_ok=True)
+    # loadInstance fills in the symmetric half, so every pair is written once
+    with open(os.path.join(directory, 'distances.csv'), 'w', newline='') as f:
+        f.write('start_city,end_city,distance_km\n')
+        for i in range(n_cities - 1):
+            d = np.sqrt(((points[i + 1:] - points[i]) ** 2).sum(axis=1))
+            f.write(''.join(f"{cities[i]},{cities[j]},{dist:.6f}\n" for j, dist in zip(range(i + 1, n_cities), d)))
+
+    def writeColumns(name, header, *columns):
+        with open(os.path.join(directory, name), 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(zip(cities, *columns))
+
+    writeColumns('demand.csv', ['city', 'mean_demand', 'variance_demand'], demand, variance)
+    writeColumns('supply.csv', ['city', 'supply'], supply)
+    writeColumns('cost.csv', ['city', 'fixed_cost', 'scaling_cost'], fixed_cost, scaling_cost)
+    writeColumns('coordinates.csv', ['city', 'x_km', 'y_km'], points[:, 0], points[:, 1])
+    return points
+
+def instanceDirectory(root, n_cities, kind, seed):
+    return os.path.join(root, f"{kind}_{n_cities}_{seed}")
+
+def ensureInstance(root, n_cities, kind='uniform', seed=0):
+    # Generate the instance once and build its binary cache, later calls only return the directory
+    directory = instanceDirectory(root, n_cities, kind, seed)
+    if not os.path.exists(os.path.join(directory, 'coordinates.csv')):
+        generateInstance(directory, n_cities, kind, seed)
+        loadInstance(directory)
+    return directory
+
+if __name__ == '__main__':
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description='Synthetic instance generator')
+    parser.add_argument('-n', '--cities', type=int, nargs='+', default=[50, 200, 1000, 5000],
+                        help='Number of cities of every instance')
+    parser.add_argument('-k', '--kind', choices=KINDS, nargs='+', default=KINDS,
+                        help='Uniform or clustered city coordinates')
+    parser.add_argument('-s', '--seed', type=int, default=0,
+                        help='Random seed')
+    parser.add_argument('-o', '--output', default='./Benchmarks/instances',
+                        help='Directory the instances are written to')
+    args = parser.parse_args()
+
+    for kind in args.kind:
+        for n in args.cities:
+            print(ensureInstance(args.output, n, kind, args.seed))
@@ -0,0 +1,94 @@
+# Coordinate based distances, for instances given as one point per city instead of the pairwise distances.csv
+# Geographic points are (latitude, longitude) in degrees with haversine distances in km, planar points are (x, y) in km
+# with euclidean distances. Distances are computed on demand and nearest warehouse queries go through a KD-tree over
+# the open sites, so nothing of size N x N has to be stored
+
+import csv
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+def haversine(lat1, lon1, lat2, lon2):
+    # Great circle distance in km between points given in degrees, the arguments broadcast against each other
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(x, dtype=float)) for x in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+class Coordinates:
+    def __init__(self, points, geographic=True):
+        self.points = np.asarray(points, dtype=float).reshape(-1, 2) # (lat, lon) or (x_km, y_km) of every city
+        self.geographic = geographic
+        self.n_cities = len(self.points)
+        if geographic:
+            # Points on a sphere of the earth radius, the straight line (chord) between two of them grows with their
+            # great circle distance, so the nearest point of a euclidean KD-tree is also the nearest by haversine
+            lat, lon = np.radians(self.points).T
+            self.xyz = EARTH_RADIUS_KM * np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon),
+                                                          np.sin(lat)])
+        else:
+            self.xyz = self.points
+
+    def pairDistances(self, i, j):
+        # Distance between cities i[k] and j[k], the index arrays broadcast against each other
+        a, b = self.points[i], self.points[j]
+        if self.geographic:
+            return haversine(a[..., 0], a[..., 1], b[..., 0], b[..., 1])
+        return np.sqrt(((a - b) ** 2).sum(axis=-1))
+
+    def distances(self, rows=None, cols=None):
+        # (len(rows), len(cols)) block of the distance matrix, every city by default
+        rows = np.arange(self.n_cities) if rows is None else np.asarray(rows)
+        cols = np.arange(self.n_cities) if cols is None else np.asarray(cols)
+        return self.pairDistances(rows[:, None], cols[None, :])
+
+    def matrix(self, dtype=np.float64, max_elements=2**22):
+        # Full distance matrix, computed one block of rows at a time
+        N = self.n_cities
+        distances = np.empty((N, N), dtype=dtype)
+        step = max(1, max_elements // max(N, 1))
+        for start in range(0, N, step):
+            distances[start:start + step] = self.distances(np.arange(start, min(start + step, N)))
+        return distances
+
+    def nearest(self, sites, rows=None):
+        # Nearest of the given sites for every city, or for the cities in rows: (position in sites, distance)
+        from scipy.spatial import cKDTree
+        sites = np.asarray(sites, dtype=np.int64).ravel()
+        rows = np.arange(self.n_cities) if rows is None else np.asarray(rows)
+        _, position = cKDTree(self.xyz[sites]).query(self.xyz[rows])
+        return position, self.pairDistances(rows, sites[position])
+
+    def diameterBound(self):
+        # Upper bound on the distance between any two cities: twice the largest distance from the first one
+        return 2 * float(self.distances([0]).max()) if self.n_cities > 0 else 0.0
+
+def readCoordinates(filename):
+    # Cities and Coordinates of a csv with a city column and either lat, lon in degrees or x_km, y_km columns
+    with open(filename, newline='') as csvfile:
+        reader = csv.DictReader(csvfile)
+        if {'lat', 'lon'} <= set(reader.fieldnames):
+            columns, geographic = ('lat', 'lon'), True
+        elif {'x_km', 'y_km'} <= set(reader.fieldnames):
+            columns, geographic = ('x_km', 'y_km'), False
+        else:
+            raise ValueError(f"{filename} needs lat, lon or x_km, y_km columns")
+        rows = [(row['city'], float(row[columns[0]]), float(row[columns[1]])) for row in reader]
+    cities = [row[0] for row in rows]
+    return cities, Coordinates(np.array([row[1:] for row in rows], dtype=float).reshape(-1, 2), geographic)
+
+def alignCoordinates(cities, coordinate_cities, coordinates):
+    # Reorder coordinates read for coordinate_cities to the order of cities
+    index = {city: k for k, city in enumerate(coordinate_cities)}
+    missing = [city for city in cities if city not in index]
+    if missing:
+        raise ValueError(f"No coordinates for {missing[0]}")
+    return Coordinates(coordinates.points[[index[city] for city in cities]], coordinates.geographic)
+
+def shapefileCoordinates(filename, cities):
+    # District centroids of a shapefile as geographic Coordinates aligned with cities
+    # The centroids are (longitude, latitude), they are cached next to the shapefile by plotting.districtCentroids
+    from plotting import districtCentroids
+    centroids = districtCentroids(filename)
+    districts = list(centroids)
+    points = np.array([centroids[district][::-1] for district in districts], dtype=float)
+    return alignCoordinates(cities, districts, Coordinates(points, geographic=True))
@@ -0,0 +1,248 @@
+# Fast heuristics for the warehouse placement problems
+# They work on the dense arrays of utils.loadInstance and return warehouse indices into instance.cities
+
+import numpy as np
+
+def farthestFirst(distances, n_warehouses, start=None):
+    # Gonzalez farthest-first traversal, a 2-approximation of the p-center problem (warehouse_1.py)
+    # Starts from the 1-center unless a start city is given, returns the warehouses and their max delivery distance
+    distances = np.asarray(distances)
+    if start is None:
+        start = int(distances.max(axis=1).argmin())
+    warehouses = [start]
+    nearest = distances[:, start].copy()
+    while len(warehouses) < min(n_warehouses, len(distances)):
+        j = int(nearest.argmax())
+        warehouses.append(j)
+        np.minimum(nearest, distances[:, j], out=nearest)
+    return warehouses, float(nearest.max())
+
+def assignNearest(distances, warehouses):
+    # Index of the nearest warehouse of every city, ties go to the first warehouse in the list
+    warehouses = np.asarray(warehouses)
+    return warehouses[np.asarray(distances)[:, warehouses].argmin(axis=1)]
+
+def assignCapacitated(distances, supply, demand, warehouses):
+    # Greedy capacitated assignment to a fixed set of warehouses, a warehouse city always serves itself
+    # The other cities are assigned by decreasing demand to the nearest warehouse with enough capacity left
+    # Returns the warehouse index of every city, or None when the greedy runs out of capacity
+    distances = np.asarray(distances)
+    warehouses = np.asarray(warehouses)
+    remaining = np.asarray(supply, dtype=float)[warehouses].copy()
+    demand = np.asarray(demand)
+    assignment = np.full(len(distances), -1)
+
+    for k, j in enumerate(warehouses):
+        assignment[j] = j
+        remaining[k] -= demand[j]
+    if (remaining < 0).any():
+        return None
+
+    for i in np.argsort(-demand, kind='stable'):
+        if assignment[i] >= 0:
+            continue
+        for k in np.argsort(distances[i, warehouses], kind='stable'):
+            if remaining[k] >= demand[i]:
+                assignment[i] = warehouses[k]
+                remaining[k] -= demand[i]
+                break
+        else:
+            return None
+    return assignment
+
+def budgetPlacement(distances, supply, demand, fixedCost, budget):
+    # Farthest-first placement with a budget on the fixed cost of the warehouses (warehouse_3.py)
+    # Only sites that fit in the budget and can serve their own demand are used, the farthest city gets the usable
+    # site nearest to it, warehouses are added until the budget runs out and every prefix is assigned greedily
+    # Returns the assignment with the smallest max delivery distance, or None when no prefix can be assigned
+    distances = np.asarray(distances)
+    fixedCost = np.asarray(fixedCost, dtype=float)
+    usable = np.flatnonzero((fixedCost <= budget) & (np.asarray(demand) <= np.asarray(supply)))
+    if len(usable) == 0:
+        return None
+
+    best, best_distance = None, np.inf
+    warehouses = [int(usable[distances[:, usable].max(axis=0).argmin()])]
+    cost = fixedCost[warehouses[0]]
+    nearest = distances[:, warehouses[0]].copy()
+    while True:
+        assignment = assignCapacitated(distances, supply, demand, warehouses)
+        if assignment is not None:
+            max_distance = distances[np.arange(len(distances)), assignment].max()
+            if max_distance < best_distance:
+                best, best_distance = assignment, max_distance
+
+        candidates = usable[~np.isin(usable, warehouses)]
+        if len(candidates) == 0:
+            break
+        j = int(candidates[distances[nearest.argmax(), candidates].argmin()])
+        if cost + fixedCost[j] > budget:
+            break
+        warehouses.append(j)
+        cost += fixedCost[j]
+        np.minimum(nearest, distances[:, j], out=nearest)
+    return best
+
+def _blocks(n_rows, n_columns, max_elements=2**22):
+    # Column slices of an (n_rows, n_columns) matrix with at most max_elements entries each
+    step = max(1, max_elements // max(n_rows, 1))
+    for start in range(0, n_columns, step):
+        yield slice(start, min(start + step, n_columns))
+
+def placementCost(distances, demand, warehouses, fixedCost=None, scalingCost=None):
+    # Nearest assignment of a placement, returns (assignment, operating cost, spent budget)
+    # The operating cost is the demand weighted distance of warehouse_4.py, every warehouse gets exactly the capacity
+    # of the demand it serves, so the budget spent is its fixed cost plus the scaling cost of that demand
+    distances = np.asarray(distances)
+    demand = np.asarray(demand, dtype=float)
+    assignment = assignNearest(distances, warehouses)
+    operating_cost = float(demand @ distances[np.arange(len(distances)), assignment])
+    spent = 0.0
+    if fixedCost is not None:
+        spent += float(np.asarray(fixedCost, dtype=float)[np.unique(assignment)].sum())
+    if scalingCost is not None:
+        spent += float(demand @ np.asarray(scalingCost, dtype=float)[assignment])
+    return assignment, operating_cost, spent
+
+def greedyAdd(distances, demand, n_warehouses=None, fixedCost=None, scalingCost=None, budget=None):
+    # ADD heuristic for the demand weighted distance (p-median, warehouse_4.py)
+    # Opens the site that lowers the operating cost the most, until n_warehouses are open or, with a budget, until no
+    # further site fits. Returns the warehouses, or None when not even a single site fits in the budget
+    distances = np.asarray(distances, dtype=float)
+    N = len(distances)
+    w = np.asarray(demand, dtype=float)
+    fixed = np.zeros(N) if fixedCost is None else np.asarray(fixedCost, dtype=float)
+    scaling = np.zeros(N) if scalingCost is None else np.asarray(scalingCost, dtype=float)
+    limit = np.inf if budget is None else budget
+    n_max = N if n_warehouses is None else min(n_warehouses, N)
+
+    warehouses = []
+    d1 = np.full(N, np.inf)
+    s1 = np.zeros(N) # Scaling cost of the warehouse serving each city
+    spent_fixed = 0.0
+    while len(warehouses) < n_max:
+        best, best_cost = None, np.inf
+        for block in _blocks(N, N):
+            A = distances[:, block]
+            closer = A < d1[:, None]
+            cost = w @ np.where(closer, A, d1[:, None])
+            spent = spent_fixed + fixed[block] + w @ np.where(closer, scaling[block][None, :], s1[:, None])
+            cost[(spent > limit + 1e-9) | np.isin(np.arange(N)[block], warehouses)] = np.inf
+            k = int(cost.argmin())
+            if cost[k] < best_cost:
+                best, best_cost = block.start + k, cost[k]
+        # With a budget and no fixed count, stop once no site is worth opening
+        current = w @ d1 if warehouses else np.inf
+        if best is None or (n_warehouses is None and best_cost >= current):
+            break
+        warehouses.append(best)
+        spent_fixed += fixed[best]
+        closer = distances[:, best] < d1
+        d1[closer] = distances[closer, best]
+        s1[closer] = scaling[best]
+    return warehouses if warehouses else None
+
+def _twoNearest(distances, rows, warehouses):
+    # Nearest and second nearest warehouse of the given cities, the second is -1 at inf with a single warehouse
+    sub = distances[np.ix_(rows, warehouses)]
+    if len(warehouses) == 1:
+        return (np.full(len(rows), warehouses[0]), sub[:, 0],
+                np.full(len(rows), -1), np.full(len(rows), np.inf))
+    order = np.argpartition(sub, 1, axis=1)[:, :2]
+    d = np.take_along_axis(sub, order, axis=1)
+    swap = d[:, 1] < d[:, 0]
+    order[swap] = order[swap][:, ::-1]
+    d[swap] = d[swap][:, ::-1]
+    return warehouses[order[:, 0]], d[:, 0], warehouses[order[:, 1]], d[:, 1]
+
+def vertexSubstitution(distances, warehouses, demand=None, objective='sum', fixedCost=None, scalingCost=None,
+                       budget=None, max_iter=1000):
+    # Teitz-Bart vertex substitution with Whitaker's fast interchange: every iteration swaps the open warehouse and the
+    # closed site that improve the placement the most. The nearest and second nearest open warehouse of every city is
+    # kept up to date, so a candidate site is scored against all open warehouses at once in O(N)
+    # objective 'sum' is the demand weighted distance (p-median, warehouse_4.py), 'max' the max delivery distance
+    # (p-center, warehouse_1.py) with the weighted distance as tie break. With a budget a swap must keep the fixed plus
+    # scaling cost of the nearest assignment within it. Returns (warehouses, objective value)
+    distances = np.asarray(distances, dtype=float)
+    N = len(distances)
+    w = np.ones(N) if demand is None else np.asarray(demand, dtype=float)
+    fixed = np.zeros(N) if fixedCost is None else np.asarray(fixedCost, dtype=float)
+    scaling = np.zeros(N) if scalingCost is None else np.asarray(scalingCost, dtype=float)
+    limit = np.inf if budget is None else budget + 1e-9
+    scaling_ext = np.append(scaling, 0.0) # index -1, no second warehouse
+
+    warehouses = np.array(sorted(set(int(j) for j in warehouses)))
+    cities = np.arange(N)
+    near1, d1, near2, d2 = _twoNearest(distances, cities, warehouses)
+
+    def score():
+        return (d1.max(), w @ d1) if objective == 'max' else (w @ d1, 0.0)
+
+    current = score()
+    for _ in range(max_iter):
+        is_open = np.zeros(N, dtype=bool)
+        is_open[warehouses] = True
+        # groups[r, i] if city i is served by the r-th open warehouse
+        groups = (near1[None, :] == warehouses[:, None]).astype(float)
+        spent_fixed = fixed[warehouses].sum()
+
+        best = None
+        for block in _blocks(N, N):
+            candidates = cities[block][~is_open[block]]
+            if len(candidates) == 0:
+                continue
+            A = distances[:, candidates]
+            # Distance of every city after inserting a candidate, when its nearest warehouse stays or is removed
+            new1 = np.minimum(A, d1[:, None])
+            new2 = np.minimum(A, d2[:, None])
+            weighted = w @ new1 + groups @ (w[:, None] * (new2 - new1))
+            if objective == 'max':
+                group_max1 = np.stack([np.where(g[:, None] > 0, new1, -np.inf).max(axis=0) for g in groups])
+                group_max2 = np.stack([np.where(g[:, None] > 0, new2, -np.inf).max(axis=0) for g in groups])
+                # Max over the cities of the other groups: the largest group maximum, or the second one for its group
+                top = np.sort(group_max1, axis=0)
+                first, second = top[-1], top[-2] if len(top) > 1 else np.full(len(candidates), -np.inf)
+                others = np.where(group_max1 == first[None, :], second[None, :], first[None, :])
+                primary, secondary = np.maximum(others, group_max2), weighted
+            else:
+                primary, secondary = weighted, np.zeros_like(weighted)
+
+            if budget is not None:
+                sk = scaling[candidates][None, :]
+                cost1 = np.where(A < d1[:, None], sk, scaling[near1][:, None])
+                cost2 = np.where(A < d2[:, None], sk, scaling_ext[near2][:, None])
+                spent = (spent_fixed - fixed[warehouses][:, None] + fixed[candidates][None, :]
+                         + w @ cost1 + groups @ (w[:, None] * (cost2 - cost1)))
+                primary = np.where(spent <= limit, primary, np.inf)
+
+            # Lexicographic minimum over (removed warehouse, candidate)
+            r, k = np.unravel_index(np.lexsort((secondary.ravel(), primary.ravel()))[0], primary.shape)
+            value = (primary[r, k], secondary[r, k])
+            if best is None or value < best[0]:
+                best = (value, r, int(candidates[k]))
+
+        # A swap must lower the objective, or keep it and lower the tie break
+        if best is None:
+            break
+        (primary, secondary), (current_primary, current_secondary) = best[0], current
+        if not (primary < current_primary - 1e-9
+                or (abs(primary - current_primary) <= 1e-9 and secondary < current_secondary - 1e-9)):
+            break
+        (value, r, k) = best
+        removed = warehouses[r]
+        warehouses[r] = k
+
+        # Update the nearest and second nearest warehouse of every city
+        affected = (near1 == removed) | (near2 == removed)
+        A = distances[:, k]
+        closer1 = ~affected & (A < d1)
+        closer2 = ~affected & ~closer1 & (A < d2)
+        near2[closer1], d2[closer1] = near1[closer1], d1[closer1]
+        near1[closer1], d1[closer1] = k, A[closer1]
+        near2[closer2], d2[closer2] = k, A[closer2]
+        rows = np.flatnonzero(affected)
+        if len(rows) > 0:
+            near1[rows], d1[rows], near2[rows], d2[rows] = _twoNearest(distances, rows, warehouses)
+        current = score()
+
+    return sorted(warehouses.tolist()), float(current[0])
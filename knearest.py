@@ -0,0 +1,103 @@
+# k-nearest sparse assignment for the MILPs of matrix_model.py
+# Every city may only be served by its k nearest sites, which shrinks the N^2 supplier block to about N * k columns.
+# The reduced optimum is feasible for the full model, a check then proves that no removed arc leads to a better one:
+# - min-max models (warehouse_1.py to warehouse_3.py): a solution using arc (i, j) has a max delivery distance of at
+#   least d_ij, so the reduced optimum z is optimal once every arc shorter than z is in the model
+# - min-sum model (warehouse_4.py): the LP duals of the reduced model price the assignment rows and the budget of the
+#   Lagrangian relaxation of lagrangian.py over every arc. Forcing arc (i, j) into the site subproblem of j bounds
+#   every solution that uses it from below, arcs whose bound reaches the reduced optimum are never needed
+# A check returns how many nearest sites every city needs, cities above their k get at most twice as many and the
+# model is built and solved again until the check passes
+
+import numpy as np
+from heuristics import _blocks
+from lagrangian import _siteSubproblems
+
+def nearestArcs(distances, k):
+    # Sorted keys i*N + j of the k[i] nearest sites of every city i and of the diagonal, ties go to the lower index
+    distances = np.asarray(distances)
+    N = len(distances)
+    k = np.broadcast_to(k, N)
+    keys = [np.arange(N) * (N + 1)]
+    for block in _blocks(N, N):
+        rows = np.arange(N)[block]
+        order = np.argsort(distances[rows], axis=1, kind='stable')
+        take = np.arange(N)[None, :] < k[rows][:, None]
+        keys.append((rows[:, None] * N + order)[take])
+    return np.unique(np.concatenate(keys))
+
+def radiusCheck(distances):
+    # Min-max models: every arc shorter than the reduced optimum has to be in the model
+    distances = np.asarray(distances)
+    N = len(distances)
+
+    def check(model, status, obj, x):
+        if status != 1:
+            return np.full(N, N)
+        z = distances[np.arange(N), model.assignment(x)].max()
+        return (distances < z).sum(axis=1)
+
+    return check
+
+def lagrangianCheck(distances, demand, fixedCost, scalingCost, budget, tol=1e-9):
+    # Min-sum model of warehouse_4.py: every arc whose forced Lagrangian bound stays below the reduced optimum has to be
+    # in the model, a city needs every site up to its farthest such arc
+    distances = np.asarray(distances, dtype=float)
+    demand = np.asarray(demand, dtype=float)
+    fixed = np.asarray(fixedCost, dtype=float)
+    scaling = np.asarray(scalingCost, dtype=float)
+    N = len(distances)
+
+    def check(model, status, obj, x):
+        if status != 1:
+            return np.full(N, N)
+        _, y = model.relaxationDuals()
+        if y is None:
+            return np.full(N, N)
+        u = y[model.names['assignment']]
+        lam = max(0.0, -y[model.names['budget']][0])
+        v, _, _, _ = _siteSubproblems(distances, demand, fixed, scaling, u, lam)
+
+        # Bound of the relaxation with site j open and serving city i, against the reduced optimum
+        base = u.sum() - lam * budget + np.minimum(v, 0.0).sum()
+        limit = obj - tol * max(1.0, abs(obj))
+        in_model = np.zeros(N * N, dtype=bool)
+        in_model[model.arcs if model.arcs is not None else np.arange(N * N)] = True
+        in_model = in_model.reshape(N, N)
+        farthest = np.full(N, -np.inf)
+        for block in _blocks(N, N):
+            R = distances[:, block] * demand[:, None] - u[:, None] + lam * demand[:, None] * scaling[block][None, :]
+            forced = base - np.minimum(v[block], 0.0) + v[block] + np.maximum(R, 0.0)
+            failed = (forced < limit) & ~in_model[:, block]
+            farthest = np.maximum(farthest, np.where(failed, distances[:, block], -np.inf).max(axis=1))
+        return (distances <= farthest[:, None]).sum(axis=1)
+
+    return check
+
+def solveNearest(build, distances, k, check, backend='highs', time_limit=None, msg=False, start=None,
+                 log_path=None):
+    # build(arcs) returns the MatrixModel over the given arcs, check(model, status, obj, x) the number of nearest sites
+    # every city needs, start is an (assignment, extra) MIP start passed to every round
+    # Returns (model, status, objective, x, rounds) of the last round, rounds holds the size and result of each one
+    distances = np.asarray(distances)
+    N = len(distances)
+    k = np.minimum(np.broadcast_to(np.asarray(k, dtype=np.int64), N), N)
+    rounds = []
+    while True:
+        model = build(nearestArcs(distances, k))
+        status, obj, x = model.solve(backend, time_limit=time_limit, msg=msg, log_path=log_path,
+                                     start=None if start is None else model.startVector(*start))
+        # The full model needs no check, a reduced one stopped by the time limit can't be checked
+        needed = check(model, status, obj, x) if (k < N).any() and status in (1, -1) else k
+        grow = needed > k
+        rounds.append({"arcs": int(model.n_arcs), "status": int(status), "objective": obj if status == 1 else None,
+                       "cities_grown": int(grow.sum())})
+        if not grow.any():
+            return model, status, obj, x, rounds
+        k = np.where(grow, np.minimum(2 * k, needed), k)
+
+def nearestSummary(rounds, n_cities):
+    # One line report of the rounds and the size of the last model
+    return (f"Nearest sites: {len(rounds)} round{'s' if len(rounds) > 1 else ''}, "
+            f"kept {rounds[-1]['arcs']} of {n_cities * n_cities} supplier variables "
+            f"({100 * rounds[-1]['arcs'] / (n_cities * n_cities):.1f}%)")
@@ -0,0 +1,150 @@
+# Lagrangian relaxation of the variable capacity model of warehouse_4.py
+# min sum_ij c_ij a_ij with c_ij = d_ij * demand_i, every city served once, a_ij <= a_jj, and fixed plus capacity
+# scaling cost within the budget. The capacity of an open site is exactly the demand it serves, so the budget reads
+# sum_j f_j a_jj + sum_ij g_j demand_i a_ij <= B
+# Relaxing the assignment rows with multipliers u_i and the budget with lam >= 0 leaves one subproblem per site:
+# open site j at reduced cost v_j = lam f_j + r_jj + sum_{i != j} min(0, r_ij), r_ij = c_ij - u_i + lam g_j demand_i,
+# and open it when v_j < 0. L(u, lam) = sum_i u_i - lam B + sum_j min(0, v_j) bounds the optimum from below
+# The multipliers follow subgradient steps, the sites open in the subproblem seed a budget feasible placement
+
+import time
+import numpy as np
+from heuristics import _blocks, greedyAdd, placementCost, vertexSubstitution
+
+def _siteSubproblems(distances, demand, fixed, scaling, u, lam):
+    # Solve every site subproblem for the multipliers (u, lam), one block of sites at a time
+    # Returns (v, is_open, served, spent): reduced cost of every site, the open sites, how many open sites take each
+    # city and the fixed plus scaling cost of the subproblem solution
+    N = len(distances)
+    v = np.empty(N)
+    served = np.zeros(N)
+    spent = 0.0
+    for block in _blocks(N, N):
+        sites = np.arange(N)[block]
+        R = distances[:, block] * demand[:, None] - u[:, None] + lam * demand[:, None] * scaling[block][None, :]
+        # A site always serves its own city, every other city joins when its reduced cost is negative
+        take = R < 0
+        take[sites, np.arange(len(sites))] = True
+        v[block] = lam * fixed[block] + np.where(take, R, 0.0).sum(axis=0)
+        opened = v[block] < 0
+        served += take[:, opened].sum(axis=1)
+        spent += fixed[block][opened].sum() + scaling[block][opened] @ (demand @ take[:, opened])
+    is_open = v < 0
+
+    # At least one site holds a warehouse, without any negative site the cheapest one opens
+    if not is_open.any():
+        j = int(v.argmin())
+        R = distances[:, j] * demand - u + lam * demand * scaling[j]
+        take = R < 0
+        take[j] = True
+        is_open[j] = True
+        served += take
+        spent += fixed[j] + scaling[j] * (demand @ take)
+    return v, is_open, served, spent
+
+def _lagrangianPlacement(distances, demand, fixed, scaling, budget, sites):
+    # Lagrangian heuristic: open the subproblem sites in order of reduced cost while the nearest assignment stays in
+    # the budget, returns the warehouses or None when no site fits
+    N = len(distances)
+    warehouses = []
+    d1 = np.full(N, np.inf)
+    s1 = np.zeros(N) # Scaling cost of the warehouse serving each city
+    spent_fixed = 0.0
+    for j in sites:
+        closer = distances[:, j] < d1
+        if spent_fixed + fixed[j] + demand @ np.where(closer, scaling[j], s1) > budget + 1e-9:
+            continue
+        warehouses.append(int(j))
+        spent_fixed += fixed[j]
+        d1[closer] = distances[closer, j]
+        s1[closer] = scaling[j]
+    return warehouses if warehouses else None
+
+def lagrangianRelaxation(distances, demand, fixedCost, scalingCost, budget, max_iter=5000, tol=1e-4,
+                         time_limit=None, step=2.0, patience=50, min_step=1e-4, heuristic_every=5):
+    # Subgradient optimization of the Lagrangian dual with Polyak steps towards the best placement found, the step
+    # factor halves after patience iterations without a better bound. Stops at a relative gap of tol, a step factor
+    # below min_step, max_iter iterations or time_limit seconds
+    # Returns (assignment, operating cost, lower bound, stats), the assignment is None and the cost inf when no
+    # placement fits the budget. A bound above the cost of serving every city from its farthest site proves that
+    # the budget is infeasible
+    start_time = time.perf_counter()
+    distances = np.asarray(distances, dtype=float)
+    demand = np.asarray(demand, dtype=float)
+    fixed = np.asarray(fixedCost, dtype=float)
+    scaling = np.asarray(scalingCost, dtype=float)
+    N = len(distances)
+
+    # Incumbent of the ADD heuristic with vertex substitution, as for the MIP start of warehouse_4.py
+    best, upper = None, np.inf
+    warehouses = greedyAdd(distances, demand, fixedCost=fixed, scalingCost=scaling, budget=budget)
+    if warehouses is not None:
+        warehouses, _ = vertexSubstitution(distances, warehouses, demand, fixedCost=fixed, scalingCost=scaling,
+                                           budget=budget)
+        best, upper, _ = placementCost(distances, demand, warehouses, fixed, scaling)
+
+    # Every city starts priced at what it costs to serve it in the incumbent, or at its cheapest other site
+    if best is not None:
+        u = distances[np.arange(N), best] * demand
+    else:
+        u = np.where(np.eye(N, dtype=bool), np.inf, distances).min(axis=1) * demand if N > 1 else np.zeros(N)
+    lam = 0.0
+    lower, theta, stall = -np.inf, step, 0
+    worst = demand @ distances.max(axis=1)
+    scale = max(1.0, np.sqrt(N) / 2)
+    heuristic_value = np.inf
+
+    iteration = 0
+    for iteration in range(1, max_iter + 1):
+        v, is_open, served, spent = _siteSubproblems(distances, demand, fixed, scaling, u, lam)
+        bound = u.sum() - lam * budget + np.minimum(v, 0.0).sum() + (v[is_open].min() if (v >= 0).all() else 0.0)
+        if not np.isfinite(lower) or bound > lower + 1e-9 * max(1.0, abs(lower)):
+            lower, stall = bound, 0
+        else:
+            stall += 1
+            if stall >= patience:
+                theta, stall = theta / 2, 0
+
+        # Lagrangian heuristic on the sites open in the subproblem
+        if iteration % heuristic_every == 1 or heuristic_every == 1:
+            order = np.flatnonzero(is_open)[np.argsort(v[is_open])]
+            warehouses = _lagrangianPlacement(distances, demand, fixed, scaling, budget, order)
+            if warehouses is not None:
+                assignment, value, _ = placementCost(distances, demand, warehouses, fixed, scaling)
+                if value < heuristic_value:
+                    # Polish only placements that beat every earlier Lagrangian placement
+                    heuristic_value = value
+                    warehouses, _ = vertexSubstitution(distances, warehouses, demand, fixedCost=fixed,
+                                                       scalingCost=scaling, budget=budget)
+                    assignment, value, _ = placementCost(distances, demand, warehouses, fixed, scaling)
+                if value < upper - 1e-9:
+                    best, upper = assignment, value
+
+        gap = (upper - lower) / max(abs(upper), 1e-9) if np.isfinite(upper) else np.inf
+        if gap <= tol or lower > worst or theta < min_step or \
+                (time_limit is not None and time.perf_counter() - start_time > time_limit):
+            break
+
+        # Subgradient of the relaxed assignment rows and budget, the step aims at the incumbent value
+        # The budget row sums over every city, it is scaled down by sqrt(N) / 2 so lam does not swing with every step
+        g_u = 1.0 - served
+        g_lam = (spent - budget) / scale if lam > 0 or spent > budget else 0.0
+        norm = g_u @ g_u + g_lam ** 2
+        if norm == 0:
+            # The subproblem solution is feasible and complementary, so the bound is optimal
+            break
+        target = upper if np.isfinite(upper) else lower + max(abs(lower), 1.0)
+        t = theta * (target - bound) / norm
+        u = u + t * g_u
+        lam = max(0.0, lam + t * g_lam / scale)
+
+    stats = {
+        "iterations": iteration,
+        "lower_bound": float(lower),
+        "upper_bound": float(upper),
+        "gap": float(max(upper - lower, 0.0) / max(abs(upper), 1e-9)) if np.isfinite(upper) else None,
+        "infeasible": bool(lower > worst),
+        "budget_multiplier": float(lam),
+        "time": time.perf_counter() - start_time,
+    }
+    return best, float(upper), float(lower), stats
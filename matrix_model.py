@@ -0,0 +1,323 @@
+# Sparse matrix form of the warehouse placement MILPs
+# The constraint matrix is assembled directly as a scipy sparse array from the dense instance arrays,
+# then solved in memory by HiGHS (scipy.optimize.milp), with PuLP + CBC as the fallback backend
+
+# Variable layout: supplier[i][j] is column i*N + j, extra continuous columns follow the N^2 assignment block
+# A model built over a subset of the arcs (i, j) only has their supplier columns, in increasing order of i*N + j
+# Constraint rows are stored as lower <= A x <= upper
+# scipy is imported where a matrix is assembled or solved, scripts that only import a builder load numpy and pulp
+
+import numpy as np
+from pulp import LpProblem, LpVariable, LpAffineExpression, LpMinimize, PULP_CBC_CMD
+
+class MatrixModel:
+    def __init__(self, n_cities, n_extra=0, arcs=None):
+        # arcs are the sorted keys i*N + j of the supplier columns, every pair when None. They must hold the diagonal,
+        # a warehouse always serves its own city
+        self.n_cities = n_cities
+        self.arcs = None if arcs is None else np.asarray(arcs, dtype=np.int64)
+        self.n_arcs = n_cities * n_cities if arcs is None else len(self.arcs)
+        self.n_vars = self.n_arcs + n_extra
+        self.c = np.zeros(self.n_vars)
+        self.lb = np.zeros(self.n_vars)
+        self.ub = np.ones(self.n_vars)
+        self.integrality = np.zeros(self.n_vars, dtype=np.int8)
+        self.integrality[:self.n_arcs] = 1
+        self.blocks = [] # (rows, cols, values, lower, upper) of every constraint block
+        self.names = {} # Named blocks, their bounds can be changed in place with setBounds
+        self.n_rows = 0
+        self.A = None
+        self.prob = None # PuLP problem, built once by the cbc backend and kept for re-solves
+        self.solve_stats = {} # Gap, dual bound and node count of the last solve, when the backend reports them
+
+    def supplierIndex(self, i, j):
+        # Column of supplier[i][j], the arc has to be in the model
+        keys = np.asarray(i) * self.n_cities + np.asarray(j)
+        return keys if self.arcs is None else np.searchsorted(self.arcs, keys)
+
+    def arcPairs(self):
+        # (i, j) of every supplier column
+        return np.divmod(np.arange(self.n_arcs) if self.arcs is None else self.arcs, self.n_cities)
+
+    def addRows(self, rows, cols, values, lower, upper, name=None):
+        # rows are numbered from 0 within the block, lower and upper have one entry per row of the block
+        lower, upper = np.atleast_1d(lower).astype(float), np.atleast_1d(upper).astype(float)
+        self.blocks.append((np.asarray(rows) + self.n_rows, np.asarray(cols), np.asarray(values, dtype=float), lower, upper))
+        if name is not None:
+            self.names[name] = slice(self.n_rows, self.n_rows + len(lower))
+        self.n_rows += len(lower)
+        self.A = None
+        self.prob = None
+
+    def matrix(self):
+        if self.A is None:
+            import scipy.sparse as sp
+            rows, cols, values, self.lower, self.upper = (np.concatenate(part) for part in zip(*self.blocks))
+            self.A = sp.csr_array((values, (rows, cols)), shape=(self.n_rows, self.n_vars))
+        return self.A
+
+    def setBounds(self, name, lower, upper):
+        # Change the right hand side of a named block without rebuilding the model
+        self.matrix()
+        rows = self.names[name]
+        self.lower[rows], self.upper[rows] = lower, upper
+        if self.prob is None:
+            return
+        for r in range(rows.start, rows.stop):
+            for constraint, side in self.pulp_rows[r]:
+                bound = self.upper[r] if side == 'up' else self.lower[r]
+                if not np.isfinite(bound) or (side == 'eq') != (self.lower[r] == self.upper[r]):
+                    self.prob = None # The row changes its sense, rebuild on the next solve
+                    return
+                constraint.constant = -bound
+
+    def setObjective(self, c):
+        # Replace the objective vector, the PuLP problem keeps its constraints
+        self.c = np.asarray(c, dtype=float)
+        if self.prob is not None:
+            self.prob.setObjective(LpAffineExpression((self.pulp_vars[k], self.c[k]) for k in np.flatnonzero(self.c)))
+
+    def rowVector(self, name):
+        # Coefficients of the first row of a named block as a dense vector
+        return self.matrix()[[self.names[name].start]].toarray()[0]
+
+    def solve(self, backend='highs', time_limit=None, msg=False, start=None, log_path=None, gap=None, options=None):
+        # Returns (status, objective, x) with PuLP status codes: 1 optimal, 0 not solved, -1 infeasible
+        # start is a (partial) solution vector used as MIP start by CBC, NaN entries are left to the solver
+        # log_path is the file CBC writes its log to, gap the relative gap at which the solver stops
+        # options are extra CBC command line options such as 'cuts off'
+        # scipy.optimize.milp has no MIP start, the highs backend ignores it
+        A = self.matrix()
+        try:
+            from scipy.optimize import milp, LinearConstraint, Bounds
+        except ImportError: # scipy < 1.9 has no milp
+            milp = None
+        if backend == 'highs' and milp is not None:
+            options = {"disp": msg}
+            if time_limit is not None:
+                options["time_limit"] = time_limit
+            if gap is not None:
+                options["mip_rel_gap"] = gap
+            res = milp(self.c, constraints=LinearConstraint(A, self.lower, self.upper),
+                       integrality=self.integrality, bounds=Bounds(self.lb, self.ub), options=options)
+            status = {0: 1, 2: -1, 3: -2}.get(res.status, 0)
+            self.solve_stats = {"mip_gap": getattr(res, 'mip_gap', None),
+                                "dual_bound": getattr(res, 'mip_dual_bound', None),
+                                "nodes": getattr(res, 'mip_node_count', None)}
+            return status, res.fun, res.x
+        return self._solvePulp(time_limit, msg, start, log_path, gap, options)
+
+    def relaxationDuals(self):
+        # LP relaxation solved by HiGHS, returns (objective, y) with y[r] the change of the optimum per unit change of
+        # the bounds of row r, or (None, None) when the relaxation is not solved
+        import scipy.sparse as sp
+        from scipy.optimize import linprog
+        A = self.matrix()
+        eq = self.lower == self.upper
+        up = ~eq & np.isfinite(self.upper)
+        lo = ~eq & np.isfinite(self.lower)
+        n_up = int(up.sum())
+        A_ub = sp.vstack([A[up], -A[lo]]) if up.any() or lo.any() else None
+        b_ub = np.concatenate([self.upper[up], -self.lower[lo]]) if A_ub is not None else None
+        res = linprog(self.c, A_ub=A_ub, b_ub=b_ub, A_eq=A[eq] if eq.any() else None,
+                      b_eq=self.lower[eq] if eq.any() else None, bounds=np.column_stack([self.lb, self.ub]),
+                      method='highs')
+        if res.status != 0:
+            return None, None
+        y = np.zeros(self.n_rows)
+        if eq.any():
+            y[eq] = res.eqlin.marginals
+        if A_ub is not None:
+            y[up] += res.ineqlin.marginals[:n_up]
+            y[lo] -= res.ineqlin.marginals[n_up:]
+        return res.fun, y
+
+    def _buildPulp(self):
+        prob = LpProblem("Warehouse_Placement", LpMinimize)
+        x = [LpVariable(f"x_{k}", lowBound=self.lb[k], upBound=self.ub[k] if np.isfinite(self.ub[k]) else None,
+                        cat='Binary' if self.integrality[k] and self.lb[k] == 0 and self.ub[k] == 1
+                        else 'Integer' if self.integrality[k] else 'Continuous')
+             for k in range(self.n_vars)]
+        prob += LpAffineExpression((x[k], self.c[k]) for k in np.flatnonzero(self.c))
+
+        A = self.A
+        self.pulp_rows = {}
+        for r in range(self.n_rows):
+            start, end = A.indptr[r], A.indptr[r+1]
+            expr = LpAffineExpression(zip((x[k] for k in A.indices[start:end]), A.data[start:end]))
+            if self.lower[r] == self.upper[r]:
+                sides = [(expr == self.lower[r], 'eq')]
+            else:
+                sides = []
+                if np.isfinite(self.lower[r]):
+                    sides.append((expr >= self.lower[r], 'lo'))
+                if np.isfinite(self.upper[r]):
+                    sides.append((expr <= self.upper[r], 'up'))
+            for constraint, side in sides:
+                prob += constraint
+            self.pulp_rows[r] = sides
+
+        self.prob, self.pulp_vars = prob, x
+
+    def _solvePulp(self, time_limit, msg, start, log_path=None, gap=None, options=None):
+        if self.prob is None:
+            self._buildPulp()
+        if start is not None:
+            # CBC reads the MIP start from the variable values, unset values are left to the solver
+            for v, value in zip(self.pulp_vars, start):
+                v.varValue = None if np.isnan(value) else value
+
+        self.prob.solve(PULP_CBC_CMD(msg=msg, timeLimit=time_limit, warmStart=start is not None, logPath=log_path,
+                                     gapRel=gap, options=options))
+        self.solve_stats = {}
+        values = np.array([v.value() or 0.0 for v in self.pulp_vars])
+        return self.prob.status, self.prob.objective.value(), values
+
+    def assignment(self, x):
+        # Warehouse index of every city from a solution vector
+        N = self.n_cities
+        if self.arcs is None:
+            return x[:N * N].reshape(N, N).argmax(axis=1)
+        import scipy.sparse as sp
+        i, j = self.arcPairs()
+        return np.asarray(sp.csr_array((x[:self.n_arcs], (i, j)), shape=(N, N)).argmax(axis=1)).ravel()
+
+    def startVector(self, assignment, extra=None):
+        # MIP start from an assignment array, the continuous columns are left to the solver unless extra gives them
+        # Cities assigned along an arc the model does not have are left to the solver as well
+        N = self.n_cities
+        start = np.full(self.n_vars, np.nan)
+        start[:self.n_arcs] = 0
+        cities = np.arange(N)
+        if self.arcs is not None:
+            cities = cities[np.isin(cities * N + np.asarray(assignment), self.arcs)]
+        start[self.supplierIndex(cities, np.asarray(assignment)[cities])] = 1
+        if extra is not None:
+            start[self.n_arcs:] = extra
+        return start
+
+def _addAssignment(model, n_warehouses=None, budget=None, fixedCost=None):
+    # Rows shared by every formulation
+    N = model.n_cities
+    i, j = model.arcPairs()
+    columns = np.arange(model.n_arcs)
+
+    # Constraint: Each city is covered by exactly one warehouse
+    model.addRows(i, columns, np.ones(model.n_arcs), np.ones(N), np.ones(N), name='assignment')
+
+    # Constraint: A city can supply if there exists a warehouse in that city
+    off = i != j
+    n_off = int(off.sum())
+    rows = np.arange(n_off)
+    model.addRows(np.concatenate([rows, rows]),
+                  np.concatenate([columns[off], model.supplierIndex(j[off], j[off])]),
+                  np.concatenate([np.ones(n_off), -np.ones(n_off)]), np.full(n_off, -np.inf), np.zeros(n_off))
+
+    diagonal = model.supplierIndex(np.arange(N), np.arange(N))
+    # Constraint: Number of warehouses
+    if n_warehouses is not None:
+        model.addRows(np.zeros(N), diagonal, np.ones(N), n_warehouses, n_warehouses, name='n_warehouses')
+    # Constraint: Total cost < Budget
+    if budget is not None:
+        model.addRows(np.zeros(N), diagonal, fixedCost, -np.inf, budget, name='budget')
+
+def _addMaxDistance(model, distances, column):
+    # Constraint: Max delivery distance of a city from the supplier
+    # Every city has exactly one supplier, so one row per city replaces the N^2 rows d_ij * a_ij <= max_distance
+    N = model.n_cities
+    i, j = model.arcPairs()
+    model.addRows(np.concatenate([i, np.arange(N)]), np.concatenate([np.arange(model.n_arcs), np.full(N, column)]),
+                  np.concatenate([np.asarray(distances, dtype=float)[i, j], -np.ones(N)]),
+                  np.full(N, -np.inf), np.zeros(N))
+    model.c[column] = 1
+    model.integrality[column] = 0
+    model.ub[column] = np.inf
+
+def _addCapacity(model, demand, capacity_values, capacity_columns):
+    # Constraint: Each wharehouse must meet the demand of the cities it serves
+    # sum_i demand_i * a_ij - capacity_j <= 0, capacity_j is supply_j * a_jj or a continuous capacity variable
+    N = model.n_cities
+    i, j = model.arcPairs()
+    model.addRows(np.concatenate([j, np.arange(N)]), np.concatenate([np.arange(model.n_arcs), capacity_columns]),
+                  np.concatenate([np.asarray(demand, dtype=float)[i], -np.asarray(capacity_values, dtype=float)]),
+                  np.full(N, -np.inf), np.zeros(N))
+
+# Every builder takes the arcs of a model over a subset of the supplier variables (knearest.py), all of them by default
+
+def buildPCenter(distances, n_warehouses, arcs=None):
+    # warehouse_1.py: minimize the max delivery distance with a fixed number of warehouses
+    N = len(distances)
+    model = MatrixModel(N, n_extra=1, arcs=arcs)
+    _addAssignment(model, n_warehouses=n_warehouses)
+    _addMaxDistance(model, distances, model.n_arcs)
+    return model
+
+def buildCapacitatedPCenter(distances, supply, demand, n_warehouses, arcs=None):
+    # warehouse_2.py: warehouse_1.py with demand and supply constraints
+    model = buildPCenter(distances, n_warehouses, arcs)
+    N = model.n_cities
+    _addCapacity(model, demand, supply, model.supplierIndex(np.arange(N), np.arange(N)))
+    return model
+
+def buildBudgetPCenter(distances, supply, demand, fixedCost, budget, arcs=None):
+    # warehouse_3.py: the number of warehouses is free, their fixed cost is limited by the budget
+    N = len(distances)
+    model = MatrixModel(N, n_extra=1, arcs=arcs)
+    _addAssignment(model, budget=budget, fixedCost=fixedCost)
+    _addMaxDistance(model, distances, model.n_arcs)
+    _addCapacity(model, demand, supply, model.supplierIndex(np.arange(N), np.arange(N)))
+    return model
+
+def buildVariableCapacity(distances, demand, fixedCost, scalingCost, budget, arcs=None):
+    # warehouse_4.py: minimize the operating cost, fixed plus capacity scaling cost is limited by the budget
+    N = len(distances)
+    model = MatrixModel(N, n_extra=N, arcs=arcs)
+    capacity = model.n_arcs + np.arange(N)
+    model.ub[capacity] = np.inf
+    model.integrality[capacity] = 0
+
+    # Objective: total operating cost, distance times demand of every assignment
+    i, j = model.arcPairs()
+    model.c[:model.n_arcs] = np.asarray(distances, dtype=float)[i, j] * np.asarray(demand, dtype=float)[i]
+
+    _addAssignment(model)
+    # Constraint: Budget constraint on fixed plus capacity scaling cost
+    diagonal = model.supplierIndex(np.arange(N), np.arange(N))
+    model.addRows(np.zeros(2 * N), np.concatenate([diagonal, capacity]),
+                  np.concatenate([fixedCost, scalingCost]), -np.inf, budget, name='budget')
+    _addCapacity(model, demand, np.ones(N), capacity)
+    return model
+
+def buildStochasticCapacity(distances, demand, scenarios, probabilities, fixedCost, scalingCost, budget, penalty,
+                            arcs=None):
+    # Sample average approximation of warehouse_4.py under random demand (scenarios.py)
+    # Capacities are bought within the budget before the demand is known, demand above the capacity of a warehouse in
+    # scenario s is unmet and costs penalty per unit, weighted by the probability of the scenario
+    # Column layout: supplier arcs, N capacities, then the unmet demand of every (scenario, warehouse)
+    N = len(distances)
+    scenarios = np.asarray(scenarios, dtype=float)
+    S = len(scenarios)
+    model = MatrixModel(N, n_extra=N + S * N, arcs=arcs)
+    capacity = model.n_arcs + np.arange(N)
+    unmet = model.n_arcs + N + np.arange(S * N)
+    model.ub[model.n_arcs:] = np.inf
+    model.integrality[model.n_arcs:] = 0
+
+    # Objective: expected operating cost, which only needs the mean demand, plus the expected penalty of unmet demand
+    i, j = model.arcPairs()
+    model.c[:model.n_arcs] = np.asarray(distances, dtype=float)[i, j] * np.asarray(demand, dtype=float)[i]
+    model.c[unmet] = penalty * np.repeat(np.asarray(probabilities, dtype=float), N)
+
+    _addAssignment(model)
+    # Constraint: Budget constraint on fixed plus capacity scaling cost
+    diagonal = model.supplierIndex(np.arange(N), np.arange(N))
+    model.addRows(np.zeros(2 * N), np.concatenate([diagonal, capacity]),
+                  np.concatenate([fixedCost, scalingCost]), -np.inf, budget, name='budget')
+    # Constraint: In every scenario a warehouse serves its demand from its capacity or leaves it unmet
+    # sum_i demand_si * a_ij - capacity_j - unmet_sj <= 0
+    s = np.repeat(np.arange(S), model.n_arcs)
+    model.addRows(np.concatenate([s * N + np.tile(j, S), np.arange(S * N), np.arange(S * N)]),
+                  np.concatenate([np.tile(np.arange(model.n_arcs), S), np.tile(capacity, S), unmet]),
+                  np.concatenate([scenarios[:, i].ravel(), -np.ones(S * N), -np.ones(S * N)]),
+                  np.full(S * N, -np.inf), np.zeros(S * N))
+    return model
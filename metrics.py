@@ -0,0 +1,147 @@
+# Phase timings, model sizes and solver / genetic algorithm statistics of a script run, written as JSON
+# The scripts create one Metrics object, call metrics.mark(...) where each phase starts and metrics.write() at the end
+# With --metrics unset every call is cheap and nothing is written
+
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+
+# CBC log lines of a new incumbent, "(... seconds)" is the wallclock time since the solve started
+_INCUMBENT = re.compile(r"(?:Integer solution of|improved solution from \S+ to) (\S+?)\s.*?\(([\d.]+) seconds\)")
+_NODES = re.compile(r"Enumerated nodes:\s+(\d+)")
+_GAP = re.compile(r"^Gap:\s+(\S+)", re.MULTILINE)
+_BEST_POSSIBLE = re.compile(r"best possible (\S+)")
+_RESULT = re.compile(r"^Result - (.+)$", re.MULTILINE)
+
+class Metrics:
+    def __init__(self, script, path=None):
+        self.path = path # JSON output file, '-' for stdout, None disables the output
+        self.start = time.perf_counter()
+        self.data = {"script": script, "argv": sys.argv[1:], "phases": {}, "model": {}, "solver": {}, "ga": {}}
+        self.current = None # Running phase and its start time
+        self.current_start = self.start
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def mark(self, name=None):
+        # Start the phase name and end the running one, a phase started twice adds up its wallclock time
+        now = time.perf_counter()
+        if self.current is not None:
+            phases = self.data["phases"]
+            phases[self.current] = phases.get(self.current, 0.0) + now - self.current_start
+        self.current, self.current_start = name, now
+
+    def set(self, section, **values):
+        self.data[section].update(values)
+
+    def pulpSize(self, prob):
+        # Number of variables, constraints and nonzeros of a PuLP problem
+        self.set("model", variables=len(prob.variables()), constraints=len(prob.constraints),
+                 nonzeros=sum(len(constraint) for constraint in prob.constraints.values()))
+
+    def matrixSize(self, model):
+        # Same counts for a matrix_model.MatrixModel
+        self.set("model", variables=model.n_vars, constraints=model.n_rows, nonzeros=int(model.matrix().nnz))
+
+    def cbcLogPath(self):
+        # Temporary file for the CBC log when metrics are enabled, read back by cbcLog()
+        if not self.enabled:
+            return None
+        fd, self.log_path = tempfile.mkstemp(suffix='.log', prefix='cbc_')
+        os.close(fd)
+        return self.log_path
+
+    def cbcSolver(self, msg=False, **options):
+        # PULP_CBC_CMD that logs to cbcLogPath()
+        from pulp import PULP_CBC_CMD
+        return PULP_CBC_CMD(msg=msg, logPath=self.cbcLogPath(), **options)
+
+    def cbcLog(self, log_path=None):
+        # Parse node count, gap, final bound and the incumbent timeline out of a CBC log
+        log_path = log_path or getattr(self, 'log_path', None)
+        if log_path is None or not os.path.exists(log_path):
+            return
+        with open(log_path) as f:
+            log = f.read()
+        if log_path == getattr(self, 'log_path', None):
+            os.remove(log_path)
+            self.log_path = None
+
+        incumbents = [{"time": float(t), "objective": float(obj)} for obj, t in _INCUMBENT.findall(log)]
+        stats = {"solver": "cbc", "incumbents": incumbents}
+        for key, pattern in (("nodes", _NODES), ("gap", _GAP)):
+            match = pattern.search(log)
+            if match:
+                stats[key] = float(match.group(1)) if key == "gap" else int(match.group(1))
+        bounds = _BEST_POSSIBLE.findall(log)
+        if bounds:
+            stats["dual_bound"] = float(bounds[-1].rstrip(','))
+        match = _RESULT.search(log)
+        if match:
+            stats["result"] = match.group(1).strip()
+        self.set("solver", **stats)
+
+    def matrixSolver(self, model, backend):
+        # Statistics of the last MatrixModel.solve, the cbc backend goes through the CBC log
+        if backend == 'cbc' or not model.solve_stats:
+            self.cbcLog()
+            return
+        if getattr(self, 'log_path', None) is not None and os.path.exists(self.log_path):
+            os.remove(self.log_path)
+        self.log_path = None
+        self.set("solver", solver="highs", **{key: value for key, value in model.solve_stats.items()
+                                               if value is not None})
+
+    def gaCallback(self):
+        # pymoo callback recording the best objective, evaluations and time of every generation
+        # Disabled metrics get the do-nothing base Callback, minimize calls whatever it is given
+        from pymoo.core.callback import Callback
+        metrics = self
+
+        class GenerationLog(Callback):
+            def notify(self, algorithm):
+                opt = algorithm.opt
+                feasible = opt is not None and len(opt) > 0 and opt.get("feasible").any()
+                entry = {
+                    "generation": int(algorithm.n_gen),
+                    "evaluations": int(algorithm.evaluator.n_eval),
+                    "time": time.perf_counter() - metrics.start,
+                }
+                if feasible and opt.get("F").shape[1] > 1:
+                    # Multi-objective runs record the size of the front and the best value of every objective
+                    entry["front_size"] = len(opt)
+                    entry["best"] = opt.get("F").min(axis=0).tolist()
+                else:
+                    entry["best"] = float(opt.get("F").min()) if feasible else None
+                metrics.data["ga"].setdefault("timeline", []).append(entry)
+
+        return GenerationLog() if self.enabled else Callback()
+
+    def gaResult(self, res, cache=None):
+        # Generations, evaluations per second and fitness cache statistics of a pymoo result, after the solve phase
+        # pymoo counts n_gen up after every finished generation, so it ends one past the last
+        n_eval = int(res.algorithm.evaluator.n_eval)
+        solve_time = self.data["phases"].get("solve", 0.0)
+        self.set("ga", generations=int(res.algorithm.n_gen) - 1, evaluations=n_eval,
+                 evaluations_per_second=n_eval / solve_time if solve_time > 0 else None)
+        if cache is not None:
+            self.set("ga", cache=cache.stats())
+
+    def write(self, **result):
+        # Write the collected metrics and the final result (objective, status, ...)
+        if not self.enabled:
+            return
+        self.mark(None)
+        self.data["result"] = result
+        self.data["phases"]["total"] = time.perf_counter() - self.start
+        text = json.dumps(self.data, indent=1, default=float)
+        if self.path == '-':
+            print(text)
+        else:
+            with open(self.path, 'w') as f:
+                f.write(text + '\n')
@@ -0,0 +1,93 @@
+# Evaluate the population of a batch warehouse placement problem on a process pool
+# The numpy arrays of the problem (distance matrix, supply, demand, ...) are copied once into shared memory,
+# every worker attaches to them at startup, so a task only sends the (chunk, n_vars) genome matrix
+
+import copy
+import multiprocessing
+import pickle
+from multiprocessing import shared_memory
+import numpy as np
+from pymoo.core.problem import ElementwiseProblem, Problem
+from utils import populationMatrix
+
+# State of a worker process, set once by _initWorker
+_worker_problem = None
+_worker_blocks = []
+
+def _initWorker(problem_bytes, specs):
+    global _worker_problem
+    problem = pickle.loads(problem_bytes)
+    for attr, (name, shape, dtype) in specs.items():
+        # Pool workers share the resource tracker of the parent, which unlinks the blocks in close()
+        block = shared_memory.SharedMemory(name=name)
+        _worker_blocks.append(block)
+        setattr(problem, attr, np.ndarray(shape, dtype=dtype, buffer=block.buf))
+    _worker_problem = problem
+
+def _evaluateChunk(W):
+    out = _worker_problem.evaluate(W, return_as_dictionary=True)
+    return out["F"], out.get("G")
+
+class ParallelProblem(Problem):
+    def __init__(self, problem, n_workers=None, min_chunk_size=16):
+        if isinstance(problem, ElementwiseProblem):
+            raise ValueError("Parallel evaluation needs a batch problem, not an ElementwiseProblem")
+
+        self.problem = problem
+        self.n_workers = n_workers or multiprocessing.cpu_count()
+        self.min_chunk_size = min_chunk_size # Smaller populations are split into fewer chunks
+
+        self.n_vars = len(problem.vars)
+        self.prefix = next(iter(problem.vars)).split('_')[0]
+
+        # Forward the attributes the scripts read from the problem
+        for name in ('cities', 'n_cities', 'n_warehouses'):
+            if hasattr(problem, name):
+                setattr(self, name, getattr(problem, name))
+
+        # Move every array of the problem into shared memory and pickle the rest once for the worker initializer
+        self.blocks = []
+        specs = {}
+        stripped = copy.copy(problem)
+        for attr, value in vars(problem).items():
+            if isinstance(value, np.ndarray) and value.dtype != object and value.size > 0:
+                block = shared_memory.SharedMemory(create=True, size=value.nbytes)
+                np.ndarray(value.shape, dtype=value.dtype, buffer=block.buf)[...] = value
+                self.blocks.append(block)
+                specs[attr] = (block.name, value.shape, value.dtype.str)
+                setattr(stripped, attr, None)
+
+        self.pool = multiprocessing.get_context().Pool(self.n_workers, initializer=_initWorker,
+                                                       initargs=(pickle.dumps(stripped), specs))
+
+        super().__init__(vars=problem.vars, n_obj=problem.n_obj, n_eq_constr=problem.n_eq_constr,
+                         n_ieq_constr=problem.n_ieq_constr)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+    def __deepcopy__(self, memo):
+        # save_history deep copies the algorithm with its problem every generation, the snapshots share the pool
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _evaluate(self, X, out, *args, **kwargs):
+        W = populationMatrix(X, self.n_vars, self.prefix)
+        n_chunks = max(1, min(self.n_workers, len(W) // self.min_chunk_size))
+        results = self.pool.map(_evaluateChunk, np.array_split(W, n_chunks))
+
+        out["F"] = np.concatenate([F for F, _ in results])
+        if self.n_ieq_constr > 0:
+            out["G"] = np.concatenate([G for _, G in results])
@@ -0,0 +1,140 @@
+# Plotting of the warehouse placements
+# Kept apart from utils so the solvers only load geopandas and matplotlib when they actually plot
+
+import datetime
+import hashlib
+import os
+import numpy as np
+import geopandas as gpd
+import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+
+# Shapefile parts that define the district polygons and names
+SHAPEFILE_PARTS = ('.shp', '.shx', '.dbf')
+
+def _value(x):
+    # Value of a PuLP variable, plain numbers are returned as they are
+    return x.value() if hasattr(x, 'value') else x
+
+def _shapefileHash(filename):
+    # sha1 of the geometry, index and attribute files of a shapefile
+    digest = hashlib.sha1()
+    base = os.path.splitext(filename)[0]
+    for part in SHAPEFILE_PARTS:
+        if os.path.exists(base + part):
+            with open(base + part, 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+def districtCentroids(filename):
+    # Centroid (x, y) of every district of the shapefile as {district: (x, y)}
+    # Stored in a sidecar cache next to the shapefile, keyed on the hash of its contents
+    cache_file = os.path.join(os.path.dirname(filename), '.cache',
+                              f'centroids_{_shapefileHash(filename)}.npz')
+    if os.path.exists(cache_file):
+        try:
+            with np.load(cache_file) as cache:
+                return dict(zip(cache['districts'].tolist(), cache['centroids'].tolist()))
+        except (OSError, ValueError, KeyError):
+            pass # Corrupt cache, rebuild it below
+
+    map = gpd.read_file(filename=filename)
+    districts = np.array(map['district'].tolist())
+    # Planar centroids of the lon/lat polygons, as the maps have always been drawn
+    points = np.array([geom.centroid.coords[0] for geom in map.geometry], dtype=float).reshape(-1, 2)
+
+    # Write to a temporary file first so concurrent runs never read a half written cache
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    tmp_file = f'{cache_file}.{os.getpid()}.tmp'
+    with open(tmp_file, 'wb') as f:
+        np.savez(f, districts=districts, centroids=points)
+    os.replace(tmp_file, cache_file)
+
+    return dict(zip(districts.tolist(), points.tolist()))
+
+def _supplierPairs(cities, supplier):
+    # (city, warehouse) of every assignment in a {city1: {city2: 0/1}} dict of numbers or PuLP variables
+    return [(city1, city2) for city1 in cities for city2 in cities if _value(supplier[city1][city2]) == 1]
+
+def _renderMap(cities, pairs, highlight, title, footer, filename, prefix):
+    # Draw the districts, the warehouses and every assignment edge in one LineCollection, save the figure
+    # A plain Figure is not attached to any GUI backend, so this renders headless and nothing is shown
+    centroids = districtCentroids(filename)
+    warehouses = {city2 for city1, city2 in pairs if city1 == city2}
+
+    fig = Figure()
+    ax = fig.subplots()
+    gpd.read_file(filename=filename).plot(ax=ax)
+
+    # Plot the selected cities and warehouses
+    for city in cities:
+        x, y = centroids[city]
+        if city in warehouses:
+            ax.text(x, y, city, ha='center', va='bottom', fontsize=10, color='white',
+                    fontweight='bold', bbox=dict(facecolor='black', alpha=0.4, boxstyle='round,pad=0.2'))
+        else:
+            ax.text(x, y, city, ha='center', va='bottom', fontsize=8)
+    points = np.array([centroids[city] for city in cities if city in warehouses])
+    if len(points) > 0:
+        ax.scatter(points[:, 0], points[:, 1], color='red', marker='s', label='Warehouse')
+
+    # Draw lines between warehouses and cities, the longest deliveries in red
+    segments = [(centroids[city1], centroids[city2]) for city1, city2 in pairs]
+    colors = ['red' if highlight[k] else 'black' for k in range(len(pairs))]
+    ax.add_collection(LineCollection(segments, colors=colors, linestyles='-', linewidths=1.5, alpha=0.5))
+
+    ax.set_title(title)
+    ax.axis('off')
+    ax.text(0.5, 0.01, footer,
+            fontsize=12, color='black',
+            fontweight='bold',
+            horizontalalignment='center',
+            verticalalignment='center',
+            transform=ax.transAxes)
+
+    # Add timestamp
+    path = './Plots/' + prefix + datetime.datetime.now().strftime("%Y%m%d_%H%M%S") + '.png'
+    fig.savefig(path)
+    return path
+
+def plotMap(cities, supplier, distances, obj, title, filename, label='Max Delivery Distance', highlight=True):
+    # Save the map of a MILP placement, supplier values are PuLP variables or numbers
+    # With highlight the assignments at the max delivery distance obj are drawn in red
+    pairs = _supplierPairs(cities, supplier)
+    longest = [highlight and abs(distances[city1][city2] - obj) < 1e-5 for city1, city2 in pairs]
+    return _renderMap(cities, pairs, longest, title, f"{label}: {obj:.2f}", filename, 'plot_MILP_')
+
+def plotMapPymoo(cities, supplier, distances, obj, title, filename):
+    # Save the map of a genetic algorithm placement
+    pairs = _supplierPairs(cities, supplier)
+    longest = [abs(distances[city1][city2] - obj) < 1e-5 for city1, city2 in pairs]
+    return _renderMap(cities, pairs, longest, title, f"Max Delivery Distance: {obj:.2f}", filename, 'plot_GA_')
+
+def plotFrontier(budgets, objectives, ylabel, title):
+    # Step plot of the optimal objective against the budget, objectives[k] holds from budgets[k] to budgets[k+1]
+    order = np.argsort(budgets)
+    budgets, objectives = np.asarray(budgets)[order], np.asarray(objectives)[order]
+    plt.figure()
+    plt.step(budgets, objectives, where='post')
+    plt.scatter(budgets, objectives, color='red', zorder=3)
+    plt.xlabel('Budget')
+    plt.ylabel(ylabel)
+    plt.title(title)
+    plt.savefig('./Plots/' + 'plot_frontier_' + datetime.datetime.now().strftime("%Y%m%d_%H%M%S") + '.png')
+    plt.show()
+
+def plotParetoFront(F, labels, title):
+    # Save a 3D scatter of a front of three objectives, colored by the third one, headless like _renderMap
+    F = np.asarray(F)
+    fig = Figure()
+    ax = fig.add_subplot(projection='3d')
+    points = ax.scatter(F[:, 0], F[:, 1], F[:, 2], c=F[:, 2], cmap='viridis')
+    ax.set_xlabel(labels[0])
+    ax.set_ylabel(labels[1])
+    ax.set_zlabel(labels[2])
+    fig.colorbar(points, ax=ax, label=labels[2], shrink=0.6)
+    ax.set_title(title)
+    path = './Plots/' + 'plot_pareto_' + datetime.datetime.now().strftime("%Y%m%d_%H%M%S") + '.png'
+    fig.savefig(path)
+    return path
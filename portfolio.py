@@ -0,0 +1,291 @@
+# Solver portfolio for the warehouse placement MILPs of matrix_model.py
+# Several solvers race on the same instance, each in its own process: HiGHS, CBC with different settings and a fast
+# heuristic that gives an incumbent and a lower bound within seconds. The best incumbent is shared, CBC members start
+# once the heuristics have reported and get it as MIP start. The portfolio returns as soon as one member proves
+# optimality (or infeasibility), or the best incumbent is within the target gap of the best lower bound, and kills the
+# other members with their solver subprocesses
+# Every member runs in its own process group so that killing it also stops the CBC binary it launched
+
+import argparse
+import multiprocessing as mp
+import os
+import queue
+import shutil
+import signal
+import tempfile
+import time
+import traceback
+import numpy as np
+from utils import loadInstance, supplierDict, writeAssignment
+from matrix_model import buildPCenter, buildCapacitatedPCenter, buildBudgetPCenter, buildVariableCapacity
+
+# Model of every formulation from the instance and its parameter (number of warehouses or budget)
+FORMULATIONS = {
+    'pcenter': lambda I, p: buildPCenter(I.distances, int(p)), # warehouse_1.py
+    'capacitated': lambda I, p: buildCapacitatedPCenter(I.distances, I.supply, I.demand, int(p)), # warehouse_2.py
+    'budget': lambda I, p: buildBudgetPCenter(I.distances, I.supply, I.demand, I.fixedCost, p), # warehouse_3.py
+    'variable': lambda I, p: buildVariableCapacity(I.distances, I.demand, I.fixedCost, I.scalingCost, p), # warehouse_4.py
+}
+
+# Members by name: kind is the solver, options the CBC command line options
+MEMBERS = {
+    'highs': {"kind": 'highs'},
+    'cbc': {"kind": 'cbc'},
+    'cbc-cuts-off': {"kind": 'cbc', "options": ['cuts off']},
+    'cbc-strong-0': {"kind": 'cbc', "options": ['strong 0']},
+    'heuristic': {"kind": 'heuristic'},
+}
+DEFAULT_MEMBERS = ['highs', 'cbc', 'cbc-strong-0', 'heuristic']
+
+def heuristicPlacement(instance, formulation, p):
+    # (assignment, objective, lower bound) of the fast heuristic of every formulation, assignment is None when it finds
+    # no placement
+    from heuristics import farthestFirst, assignNearest, assignCapacitated, budgetPlacement, vertexSubstitution
+    from presolve import budgetBounds
+    distances = np.asarray(instance.distances, dtype=float)
+    N = len(distances)
+    if formulation == 'variable':
+        from lagrangian import lagrangianRelaxation
+        assignment, cost, lower, _ = lagrangianRelaxation(distances, instance.demand, instance.fixedCost,
+                                                          instance.scalingCost, p)
+        return assignment, cost, lower
+    if formulation == 'budget':
+        lower, _ = budgetBounds(distances, instance.supply, instance.demand, instance.fixedCost, p)
+        assignment = budgetPlacement(distances, instance.supply, instance.demand, instance.fixedCost, p)
+    else:
+        # Half the farthest-first radius bounds the uncapacitated optimum, and so the capacitated one, from below
+        warehouses, radius = farthestFirst(distances, int(p))
+        lower = radius / 2
+        warehouses, _ = vertexSubstitution(distances, warehouses, objective='max')
+        if formulation == 'capacitated':
+            assignment = assignCapacitated(distances, instance.supply, instance.demand, warehouses)
+        else:
+            assignment = assignNearest(distances, warehouses)
+    if assignment is None:
+        return None, np.inf, lower
+    return assignment, float(distances[np.arange(N), assignment].max()), lower
+
+def _startExtra(instance, formulation, assignment):
+    # Continuous columns of the MIP start of an assignment: the max distance, or the capacity of every warehouse
+    if formulation == 'variable':
+        return np.bincount(assignment, instance.demand, len(assignment))
+    return instance.distances[np.arange(len(assignment)), assignment].max()
+
+def _member(name, spec, formulation, p, directory, incumbent, incumbent_assignment, events, tmpdir, gap):
+    # Body of a member process, it reports ('incumbent', ...), ('bound', ...) and ('done', ...) events
+    # Members have no time limit of their own, a solver stopped by one could not tell its incumbent from a proof
+    if hasattr(os, 'setpgrp'):
+        os.setpgrp()
+    # PuLP writes its model and solution files to TMPDIR, a private one is removed with the member
+    os.environ['TMPDIR'] = os.environ['TMP'] = tmpdir
+    start_time = time.perf_counter()
+    try:
+        instance = loadInstance(directory)
+        if spec["kind"] == 'heuristic':
+            assignment, obj, lower = heuristicPlacement(instance, formulation, p)
+            events.put(('bound', name, lower))
+            if assignment is not None:
+                events.put(('incumbent', name, obj, np.asarray(assignment).tolist()))
+            events.put(('done', name, 0, obj if assignment is not None else None, None, lower,
+                        time.perf_counter() - start_time))
+            return
+
+        model = FORMULATIONS[formulation](instance, p)
+        start = None
+        with incumbent.get_lock():
+            if spec["kind"] == 'cbc' and np.isfinite(incumbent.value):
+                assignment = np.array(incumbent_assignment[:], dtype=np.int64)
+                start = model.startVector(assignment, _startExtra(instance, formulation, assignment))
+        status, obj, x = model.solve(spec["kind"], start=start, gap=gap, options=spec.get("options"))
+        assignment = model.assignment(x).tolist() if status == 1 else None
+        bound = model.solve_stats.get("dual_bound") if spec["kind"] == 'highs' else None
+        events.put(('done', name, status, obj if status == 1 else None, assignment, bound,
+                    time.perf_counter() - start_time))
+    except Exception:
+        events.put(('error', name, traceback.format_exc()))
+
+def _kill(process):
+    # Stop a member and every process it started, SIGKILL when it does not exit within a second
+    # A member that has not called setpgrp yet has no group and no solver subprocess, it is killed on its own
+    if not process.is_alive():
+        return
+    if hasattr(os, 'killpg'):
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+            process.join(1.0)
+            if process.is_alive():
+                os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            process.kill()
+    else:
+        process.terminate()
+    process.join()
+
+def runPortfolio(formulation, p, members=DEFAULT_MEMBERS, directory='./Rajasthan', gap=0.0, time_limit=None,
+                 warm_wait=5.0, log=None):
+    # Race the members on the formulation with parameter p, gap is the relative gap at which the portfolio stops
+    # MIP start members wait up to warm_wait seconds for a heuristic incumbent before they start
+    # log(message) is called on every event. Returns a dict with the status (PuLP codes), the objective, the
+    # assignment, the member that found it, whether it is proven within the gap, and the result of every member
+    instance = loadInstance(directory)
+    N = instance.n_cities
+    ctx = mp.get_context()
+    events = ctx.Queue()
+    incumbent = ctx.Value('d', np.inf)
+    incumbent_assignment = ctx.Array('l', N, lock=False)
+    start_time = time.perf_counter()
+
+    processes, tmpdirs, results = {}, {}, {name: {"state": 'waiting'} for name in members}
+    best = {"objective": np.inf, "assignment": None, "member": None}
+    lower = -np.inf
+    outcome = None
+
+    def launch(name):
+        tmpdirs[name] = tempfile.mkdtemp(prefix=f'portfolio_{name}_')
+        processes[name] = ctx.Process(target=_member, daemon=True,
+                                      args=(name, MEMBERS[name], formulation, p, directory, incumbent,
+                                            incumbent_assignment, events, tmpdirs[name], gap))
+        processes[name].start()
+        results[name]["state"] = 'running'
+
+    def report(message):
+        if log is not None:
+            log(f"{time.perf_counter() - start_time:8.2f}s {message}")
+
+    def improve(name, obj, assignment):
+        # New best incumbent, shared with the members that start later
+        if obj < best["objective"]:
+            best.update(objective=obj, assignment=np.asarray(assignment), member=name)
+            with incumbent.get_lock():
+                incumbent_assignment[:] = [int(j) for j in assignment]
+                incumbent.value = obj
+            report(f"incumbent {obj:.6g} from {name}")
+
+    def withinGap():
+        return np.isfinite(best["objective"]) and \
+            best["objective"] - lower <= gap * max(abs(best["objective"]), 1e-9) + 1e-9
+
+    heuristics = [name for name in members if MEMBERS[name]["kind"] == 'heuristic']
+    deferred = [name for name in members if MEMBERS[name]["kind"] == 'cbc' and heuristics]
+    for name in members:
+        if name not in deferred:
+            launch(name)
+
+    try:
+        while outcome is None:
+            elapsed = time.perf_counter() - start_time
+            if deferred and (np.isfinite(best["objective"]) or elapsed > warm_wait or
+                             all(results[name]["state"] != 'running' for name in heuristics)):
+                for name in deferred:
+                    launch(name)
+                deferred = []
+            if time_limit is not None and elapsed > time_limit:
+                outcome = 'time limit'
+                break
+            try:
+                event = events.get(timeout=0.1)
+            except queue.Empty:
+                # A member that died without reporting counts as failed
+                for name, process in processes.items():
+                    if results[name]["state"] == 'running' and not process.is_alive() and events.empty():
+                        results[name]["state"] = 'error'
+                        report(f"{name} exited with code {process.exitcode}")
+                if not deferred and all(result["state"] != 'running' for result in results.values()):
+                    outcome = 'all members finished'
+                continue
+
+            kind, name = event[0], event[1]
+            if kind == 'incumbent':
+                improve(name, event[2], event[3])
+            elif kind == 'bound':
+                if event[2] is not None and event[2] > lower:
+                    lower = event[2]
+                    report(f"lower bound {lower:.6g} from {name}")
+            elif kind == 'error':
+                results[name]["state"] = 'error'
+                report(f"{name} failed\n{event[2]}")
+            elif kind == 'done':
+                _, _, status, obj, assignment, bound, seconds = event
+                results[name].update(state='done', status=status, objective=obj, time=seconds)
+                report(f"{name} finished in {seconds:.2f}s"
+                       + (f" with {obj:.6g}" if obj is not None else "") + f", status {status}")
+                if bound is not None and bound > lower:
+                    lower = bound
+                if MEMBERS[name]["kind"] == 'heuristic':
+                    pass
+                elif status == 1:
+                    # Solved to its gap, which is the portfolio gap
+                    improve(name, obj, assignment)
+                    lower = max(lower, best["objective"] - gap * max(abs(best["objective"]), 1e-9))
+                    outcome = f'proven by {name}'
+                elif status == -1:
+                    outcome = f'infeasible, proven by {name}'
+            if outcome is None and withinGap():
+                outcome = 'incumbent within gap of the lower bound'
+    finally:
+        # Members still running are killed, the ones that exited without their done event being read are stopped
+        for name, process in processes.items():
+            alive = process.is_alive()
+            _kill(process)
+            if results[name]["state"] == 'running':
+                results[name]["state"] = 'killed' if alive else 'stopped'
+        for tmpdir in tmpdirs.values():
+            shutil.rmtree(tmpdir, ignore_errors=True)
+        for name in deferred:
+            results[name]["state"] = 'not started'
+
+    report(outcome)
+    infeasible = outcome.startswith('infeasible')
+    found = best["assignment"] is not None and not infeasible
+    return {
+        "status": 1 if found else -1 if infeasible else 0,
+        "objective": float(best["objective"]) if found else None,
+        "assignment": best["assignment"] if found else None,
+        "member": best["member"] if found else None,
+        "proven": infeasible or (found and withinGap()),
+        "lower_bound": float(lower) if np.isfinite(lower) else None,
+        "outcome": outcome,
+        "time": time.perf_counter() - start_time,
+        "members": results,
+    }
+
+if __name__ == '__main__':
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description='Solver portfolio for the warehouse placement MILPs')
+    parser.add_argument('-f', '--formulation', choices=list(FORMULATIONS), default='variable',
+                        help='pcenter (warehouse_1.py), capacitated (warehouse_2.py), budget (warehouse_3.py) or variable (warehouse_4.py)')
+    parser.add_argument('-n', '--number', type=int, default=3,
+                        help='Number of warehouses of pcenter and capacitated')
+    parser.add_argument('-b', '--budget', type=float, default=10.0,
+                        help='Budget of budget and variable')
+    parser.add_argument('--members', nargs='+', choices=list(MEMBERS), default=DEFAULT_MEMBERS,
+                        help='Solvers of the portfolio, each runs in its own process')
+    parser.add_argument('-g', '--gap', type=float, default=0.0,
+                        help='Relative gap at which the portfolio stops')
+    parser.add_argument('-t', '--time-limit', type=float, default=None,
+                        help='Time limit in seconds, the best incumbent is returned')
+    parser.add_argument('--instance', default='./Rajasthan',
+                        help='Instance directory')
+    parser.add_argument('--assignment', metavar='PATH', default=None,
+                        help='Write the warehouse of every city as csv to PATH')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='Only print the result')
+    args = parser.parse_args()
+
+    p = args.number if args.formulation in ('pcenter', 'capacitated') else args.budget
+    result = runPortfolio(args.formulation, p, args.members, args.instance, args.gap, args.time_limit,
+                          log=None if args.quiet else print)
+
+    if result["status"] != 1:
+        print("Infeasible" if result["status"] == -1 else "No placement found")
+    else:
+        print("Objective: ", result["objective"])
+        print(f"Found by {result['member']}, {'proven' if result['proven'] else 'not proven'}"
+              + (f", lower bound {result['lower_bound']:.6g}" if result["lower_bound"] is not None else ""))
+    for name, member in result["members"].items():
+        print(f"{name:14s} {member['state']:12s}"
+              + (f" {member['time']:8.2f}s" if 'time' in member else ""))
+
+    if args.assignment and result["status"] == 1:
+        instance = loadInstance(args.instance)
+        writeAssignment(args.assignment, instance.cities, supplierDict(instance.cities, result["assignment"]))
@@ -0,0 +1,130 @@
+# Presolve of the min-max assignment models (warehouse_1.py, warehouse_2.py, warehouse_3.py)
+# A heuristic placement bounds the optimal max delivery distance from above, so every supplier[i][j] with
+# d_ij above the bound is fixed to 0 and never built. Sites that can never hold a warehouse, or that are dominated by
+# another site, lose their whole column, and cities left with a single possible warehouse are fixed to it
+
+import numpy as np
+from pulp import LpVariable
+from heuristics import farthestFirst, assignCapacitated, budgetPlacement, vertexSubstitution
+
+def _maxDistance(distances, assignment):
+    return float(distances[np.arange(len(distances)), assignment].max())
+
+def _lowerBound(distances, n_warehouses):
+    # Farthest-first picks n_warehouses + 1 cities pairwise at least its radius apart, two of them share a warehouse
+    # in any placement, so half the radius bounds the optimum of the uncapacitated problem from below
+    return farthestFirst(distances, n_warehouses)[1] / 2
+
+def pCenterBounds(distances, n_warehouses):
+    # warehouse_1.py: (lower, upper) bound on the max delivery distance, vertex substitution improves the upper one
+    warehouses, radius = farthestFirst(distances, n_warehouses)
+    return radius / 2, vertexSubstitution(distances, warehouses, objective='max')[1]
+
+def capacitatedBounds(distances, supply, demand, n_warehouses):
+    # warehouse_2.py: the uncapacitated problem gives the lower bound, a greedy capacitated assignment the upper
+    distances = np.asarray(distances)
+    warehouses, _ = farthestFirst(distances, n_warehouses)
+    assignment = assignCapacitated(distances, supply, demand, warehouses)
+    upper = np.inf if assignment is None else _maxDistance(distances, assignment)
+    return _lowerBound(distances, n_warehouses), upper
+
+def budgetBounds(distances, supply, demand, fixedCost, budget):
+    # warehouse_3.py: at most the cheapest sites that fit in the budget can be opened, which bounds the optimum from
+    # below, a budget feasible farthest-first placement gives the upper bound
+    distances = np.asarray(distances)
+    n_max = int((np.cumsum(np.sort(np.asarray(fixedCost, dtype=float))) <= budget).sum())
+    assignment = budgetPlacement(distances, supply, demand, fixedCost, budget)
+    upper = np.inf if assignment is None else _maxDistance(distances, assignment)
+    return _lowerBound(distances, max(n_max, 1)), upper
+
+def _dominatedSites(distances, keep, lower_bound, n_warehouses):
+    # Site j is dominated by site k when every city j can serve is at most as far from k, distances below the lower
+    # bound never decide the optimum and count as equal. Moving a warehouse from j to k, or dropping it when k is open
+    # and opening any other site instead, never increases the max delivery distance of the uncapacitated problem
+    # The relation is transitive, so the dominated sites are removed one by one while n_warehouses remain
+    N = len(distances)
+    capped = np.maximum(distances, lower_bound)
+    sites = np.ones(N, dtype=bool)
+    for j in range(N):
+        if sites.sum() <= n_warehouses:
+            break
+        rows = np.flatnonzero(keep[:, j])
+        others = np.flatnonzero(sites)
+        others = others[others != j]
+        if (capped[np.ix_(rows, others)] <= capped[rows, j][:, None]).all(axis=0).any():
+            sites[j] = False
+    return sites
+
+def presolveArcs(distances, upper_bound, lower_bound=0.0, n_warehouses=None, supply=None, demand=None,
+                 fixedCost=None, budget=None):
+    # Returns (keep, fixed, stats): keep[i, j] if supplier[i][j] stays in the model, fixed[i, j] if it is fixed to 1
+    # Without supply and demand the site dominance rule is applied, it needs n_warehouses
+    distances = np.asarray(distances, dtype=float)
+    N = len(distances)
+    diagonal = np.eye(N, dtype=bool)
+
+    # Arcs longer than the upper bound are never used by an optimal placement
+    keep = distances <= upper_bound
+    sites = np.ones(N, dtype=bool)
+
+    if supply is not None and demand is not None:
+        supply, demand = np.asarray(supply, dtype=float), np.asarray(demand, dtype=float)
+        # A warehouse always serves its own city, so it must cover that demand plus the demand of every other city
+        sites &= demand <= supply
+        keep &= diagonal | (demand[:, None] + demand[None, :] <= supply[None, :])
+    if fixedCost is not None and budget is not None:
+        sites &= np.asarray(fixedCost, dtype=float) <= budget
+    if supply is None and n_warehouses is not None:
+        sites &= _dominatedSites(distances, keep, lower_bound, n_warehouses)
+    keep &= sites[None, :]
+
+    # A city with a single arc left is fixed to that warehouse, which then has to serve itself
+    fixed = np.zeros((N, N), dtype=bool)
+    while True:
+        count = keep.sum(axis=1)
+        single = np.flatnonzero((count == 1) & ~fixed.any(axis=1))
+        if len(single) == 0 or (count == 0).any():
+            break
+        fixed[single, keep[single].argmax(axis=1)] = True
+        opened = np.flatnonzero(fixed.any(axis=0) & ~fixed[np.arange(N), np.arange(N)])
+        keep[opened] = False
+        keep[opened, opened] = True
+        fixed[opened, opened] = True
+
+    stats = {
+        "lower_bound": float(lower_bound),
+        "upper_bound": float(upper_bound),
+        "arcs": int(keep.sum()),
+        "total_arcs": N * N,
+        "sites": int(keep[np.arange(N), np.arange(N)].sum()),
+        "total_sites": N,
+        "fixed": int(fixed.sum()),
+    }
+    return keep, fixed, stats
+
+def presolveSummary(stats):
+    # One line report of how much the model shrank
+    return (f"Presolve: bounds [{stats['lower_bound']:.2f}, {stats['upper_bound']:.2f}], "
+            f"kept {stats['arcs']} of {stats['total_arcs']} supplier variables "
+            f"({100 * stats['arcs'] / stats['total_arcs']:.1f}%), "
+            f"{stats['sites']} of {stats['total_sites']} sites, {stats['fixed']} fixed to 1")
+
+def supplierVariables(cities, keep, fixed):
+    # supplier[city1][city2] like LpVariable.dicts("Supplier", (cities, cities)), removed arcs are the constant 0
+    return {
+        city1: {
+            city2: LpVariable(f"Supplier_{city1}_{city2}", lowBound=1 if fixed[i, j] else 0, cat='Binary')
+            if keep[i, j] else 0
+            for j, city2 in enumerate(cities)
+        }
+        for i, city1 in enumerate(cities)
+    }
+
+def restrictMatrixModel(model, keep, fixed, lower_bound=0.0, upper_bound=np.inf):
+    # Fix the removed supplier columns of a matrix_model to 0 and the fixed ones to 1, HiGHS and CBC drop fixed
+    # columns in their own presolve. The max distance column, the first one after the assignment block, is bounded
+    i, j = model.arcPairs()
+    model.ub[:model.n_arcs][~keep[i, j]] = 0
+    model.lb[:model.n_arcs][fixed[i, j]] = 1
+    model.lb[model.n_arcs], model.ub[model.n_arcs] = lower_bound, upper_bound
+    model.prob = None
@@ -0,0 +1,118 @@
+# On-disk store of solved placements, keyed by a hash of the instance data, the script, its formulation, solver and
+# options, the source of the script and the modules it solves with, and the solver package versions. A run with
+# byte-identical inputs and code gets the stored status, objective and assignment back without solving
+# Every result is one JSON file written to a temporary file and renamed into place, so concurrent writers never leave a
+# half written entry and readers never see one. Hits refresh the file time, the least recently used entries are
+# removed once the store grows beyond its size limit
+
+import hashlib
+import json
+import os
+from importlib import metadata
+import numpy as np
+
+CACHE_VERSION = 1
+RESULTS_DIR = os.path.join('.cache', 'results') # Inside the instance directory, next to the parsed instance cache
+MAX_BYTES = 64 * 2**20
+# Instance arrays that define a placement problem, every formulation reads a subset of them
+INSTANCE_ARRAYS = ('distances', 'demand', 'varianceDemand', 'supply', 'fixedCost', 'scalingCost')
+# Options that only change what is written or shown, never the result
+OUTPUT_OPTIONS = ('plot', 'assignment', 'metrics', 'no_cache')
+# Modules the scripts build and solve their models with, an edit to any of them invalidates the stored results
+SOURCES = ('utils', 'matrix_model', 'heuristics', 'presolve', 'knearest', 'lagrangian', 'frontier', 'result_cache')
+PACKAGES = ('pulp', 'scipy', 'numpy')
+
+def codeVersion(script):
+    # Hex digest of the source of the script and of SOURCES, and of the installed versions of PACKAGES
+    # Versions are read from the package metadata, so that a run on the PuLP path does not import scipy
+    directory = os.path.dirname(os.path.abspath(__file__))
+    h = hashlib.blake2b(digest_size=20)
+    for name in (script,) + SOURCES:
+        path = os.path.join(directory, f'{name}.py')
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                h.update(f'{name}:'.encode() + f.read())
+    for package in PACKAGES:
+        try:
+            h.update(f'{package}=={metadata.version(package)}'.encode())
+        except metadata.PackageNotFoundError:
+            pass
+    return h.hexdigest()
+
+class ResultCache:
+    def __init__(self, directory, max_bytes=MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def key(self, instance, formulation, options, version=''):
+        # Hex digest of the instance arrays, the city names, the formulation, a JSON-able dict of options and the code
+        # version of codeVersion
+        h = hashlib.blake2b(digest_size=20)
+        h.update(json.dumps([CACHE_VERSION, formulation, options, version], sort_keys=True, default=str).encode())
+        h.update('\0'.join(instance.cities).encode())
+        for name in INSTANCE_ARRAYS:
+            array = np.ascontiguousarray(getattr(instance, name))
+            h.update(f'{name}:{array.dtype.str}:{array.shape}'.encode())
+            h.update(array.data)
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.json')
+
+    def get(self, key):
+        # Stored result dict or None, an entry evicted or replaced while it is read is a miss
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                result = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return result
+
+    def put(self, key, result):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = f'{self._path(key)}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(result, f, default=float)
+        os.replace(tmp, self._path(key))
+        self.evict()
+
+    def store(self, key, status, objective, assignment, **extra):
+        # Only proven results are stored: optimal (1) or infeasible (-1)
+        if status not in (1, -1):
+            return
+        self.put(key, {"status": int(status), "objective": None if status != 1 else float(objective),
+                       "assignment": None if assignment is None else np.asarray(assignment).tolist(), **extra})
+
+    def evict(self):
+        # Remove the least recently used entries until the store fits max_bytes, entries another process removes
+        # first are skipped
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith('.json'):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+def scriptCache(script, args, instance, directory='./Rajasthan'):
+    # (cache, key, stored result or None) of a script run from its parsed arguments, (None, None, None) with
+    # --no-cache. A time limited run may stop before the proof, it neither reads nor writes the store
+    if getattr(args, 'no_cache', False) or getattr(args, 'time_limit', None) is not None:
+        return None, None, None
+    cache = ResultCache(os.path.join(directory, RESULTS_DIR))
+    options = {name: value for name, value in vars(args).items() if name not in OUTPUT_OPTIONS}
+    key = cache.key(instance, script, options, codeVersion(script))
+    return cache, key, cache.get(key)
@@ -0,0 +1,180 @@
+# Monte Carlo evaluation of warehouse placements under random demand
+# demand.csv gives the mean and variance of the demand of every city, thousands of demand scenarios are drawn at once
+# as a (scenarios, cities) array and the load of every warehouse follows from one sparse product per batch
+# A placement written by any warehouse script (--assignment) is checked for overload probability, expected shortfall
+# and percentiles of the share of demand served by each warehouse
+# The --saa mode solves the sample average approximation of warehouse_4.py on a reduced set of scenarios, then
+# evaluates its placement out of sample like any other
+
+import argparse
+import numpy as np
+from utils import loadInstance, readAssignment, supplierDict, writeAssignment
+
+DISTRIBUTIONS = ['normal', 'lognormal']
+
+def sampleDemand(mean, variance, n_scenarios, rng=None, distribution='normal'):
+    # (n_scenarios, N) demand draws with the mean and variance of every city
+    # Normal draws are cut at 0, lognormal ones have exactly the given mean and variance
+    rng = np.random.default_rng(rng)
+    mean = np.asarray(mean, dtype=float)
+    variance = np.asarray(variance, dtype=float)
+    if distribution == 'lognormal':
+        sigma2 = np.log1p(variance / np.maximum(mean, 1e-12) ** 2)
+        return np.exp(rng.normal(np.log(np.maximum(mean, 1e-12)) - sigma2 / 2, np.sqrt(sigma2),
+                                 (n_scenarios, len(mean)))) * (mean > 0)
+    return np.maximum(rng.normal(mean, np.sqrt(variance), (n_scenarios, len(mean))), 0.0)
+
+def warehouseLoads(assignment, scenarios):
+    # (warehouses, (S, W) loads): the warehouses of the assignment and the demand each of them serves in every scenario
+    import scipy.sparse as sp
+    assignment = np.asarray(assignment)
+    warehouses, column = np.unique(assignment, return_inverse=True)
+    serves = sp.csr_array((np.ones(len(assignment)), (np.arange(len(assignment)), column)),
+                          shape=(len(assignment), len(warehouses)))
+    return warehouses, np.asarray((serves.T @ np.asarray(scenarios, dtype=float).T).T)
+
+def simulateLoads(mean, variance, assignment, n_scenarios, rng=None, distribution='normal', batch_size=1000):
+    # Loads of warehouseLoads over n_scenarios draws, made batch_size scenarios at a time so only (S, W) is stored
+    rng = np.random.default_rng(rng)
+    loads = []
+    for start in range(0, n_scenarios, batch_size):
+        scenarios = sampleDemand(mean, variance, min(batch_size, n_scenarios - start), rng, distribution)
+        warehouses, batch = warehouseLoads(assignment, scenarios)
+        loads.append(batch)
+    return warehouses, np.concatenate(loads)
+
+def scenarioReport(loads, capacity, percentiles=(1, 5, 50)):
+    # Statistics of every warehouse over the scenarios (rows of loads): overload probability, expected shortfall and
+    # percentiles of the share of its demand served, plus the same for the whole network
+    loads = np.asarray(loads, dtype=float)
+    capacity = np.asarray(capacity, dtype=float)
+    shortfall = np.maximum(loads - capacity[None, :], 0.0)
+    served = np.where(loads > 0, 1 - shortfall / np.where(loads > 0, loads, 1.0), 1.0)
+    total = loads.sum(axis=1)
+    fill_rate = np.where(total > 0, 1 - shortfall.sum(axis=1) / np.where(total > 0, total, 1.0), 1.0)
+    return {
+        "scenarios": len(loads),
+        "capacity": capacity,
+        "mean_load": loads.mean(axis=0),
+        "overload_probability": (shortfall > 0).mean(axis=0),
+        "expected_shortfall": shortfall.mean(axis=0),
+        "service_level": {p: np.percentile(served, p, axis=0) for p in percentiles},
+        "any_overload_probability": float((shortfall > 0).any(axis=1).mean()),
+        "expected_total_shortfall": float(shortfall.sum(axis=1).mean()),
+        "fill_rate": {p: float(np.percentile(fill_rate, p)) for p in percentiles},
+    }
+
+def reduceScenarios(scenarios, n_keep, probabilities=None):
+    # Fast forward selection (Heitsch & Roemisch 2003): keep the scenario that most reduces the probability weighted
+    # distance of all scenarios to their nearest kept one, n_keep times. Every scenario hands its probability to the
+    # nearest kept scenario. Returns (kept indices, their probabilities)
+    scenarios = np.asarray(scenarios, dtype=float)
+    S = len(scenarios)
+    p = np.full(S, 1.0 / S) if probabilities is None else np.asarray(probabilities, dtype=float)
+    squared = (scenarios ** 2).sum(axis=1)
+    distance = np.sqrt(np.maximum(squared[:, None] + squared[None, :] - 2 * scenarios @ scenarios.T, 0.0))
+
+    kept = []
+    nearest = np.full(S, np.inf)
+    for _ in range(min(n_keep, S)):
+        cost = p @ np.minimum(nearest[:, None], distance)
+        cost[kept] = np.inf
+        u = int(cost.argmin())
+        kept.append(u)
+        np.minimum(nearest, distance[:, u], out=nearest)
+    kept = np.array(kept)
+    owner = distance[:, kept].argmin(axis=1)
+    return kept, np.bincount(owner, p, len(kept))
+
+def _printReport(cities, warehouses, assignment, report):
+    percentiles = list(report["service_level"])
+    print(f"{'warehouse':16s} {'cities':>6s} {'capacity':>9s} {'mean load':>9s} {'P(over)':>8s} {'shortfall':>9s} "
+          + ' '.join(f"{f'served p{p:g}':>10s}" for p in percentiles))
+    counts = np.bincount(np.unique(assignment, return_inverse=True)[1])
+    for k, j in enumerate(warehouses):
+        print(f"{cities[j]:16s} {counts[k]:6d} {report['capacity'][k]:9.3f} {report['mean_load'][k]:9.3f} "
+              f"{report['overload_probability'][k]:8.4f} {report['expected_shortfall'][k]:9.4f} "
+              + ' '.join(f"{report['service_level'][p][k]:10.4f}" for p in percentiles))
+    print(f"Scenarios: {report['scenarios']}")
+    print(f"Probability of any overloaded warehouse: {report['any_overload_probability']:.4f}")
+    print(f"Expected total shortfall: {report['expected_total_shortfall']:.4f}")
+    print("Network fill rate: " + ', '.join(f"p{p:g} {report['fill_rate'][p]:.4f}" for p in percentiles))
+
+if __name__ == '__main__':
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description='Stochastic demand evaluation of a warehouse placement')
+    parser.add_argument('-a', '--assignment', metavar='PATH', default=None,
+                        help='csv of a warehouse script (--assignment) with the warehouse of every city')
+    parser.add_argument('-c', '--capacity', choices=['supply', 'served'], default='supply',
+                        help='Warehouse capacity: the supply of its city, or the mean demand it serves as in warehouse_4.py')
+    parser.add_argument('-s', '--scenarios', type=int, default=10000,
+                        help='Number of demand scenarios of the evaluation')
+    parser.add_argument('--distribution', choices=DISTRIBUTIONS, default='normal',
+                        help='Demand distribution with the mean and variance of demand.csv')
+    parser.add_argument('--percentiles', type=float, nargs='+', default=[1, 5, 50],
+                        help='Percentiles of the share of demand served')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Random seed')
+    parser.add_argument('--saa', action='store_true',
+                        help='Solve the sample average approximation of warehouse_4.py, then evaluate its placement')
+    parser.add_argument('-b', '--budget', type=float, default=22.0,
+                        help='Budget of the --saa model')
+    parser.add_argument('--sample', type=int, default=1000,
+                        help='Number of scenarios drawn for the --saa model')
+    parser.add_argument('-r', '--reduce', type=int, default=20,
+                        help='Number of scenarios kept in the --saa model by forward selection')
+    parser.add_argument('--penalty', type=float, default=None,
+                        help='Cost of a unit of unmet demand in the --saa model, the largest distance by default')
+    parser.add_argument('--backend', choices=['highs', 'cbc'], default='highs',
+                        help='Solver of the --saa model')
+    parser.add_argument('-o', '--output', metavar='PATH', default=None,
+                        help='Write the warehouse of every city of the --saa placement as csv to PATH')
+    parser.add_argument('--instance', default='./Rajasthan',
+                        help='Instance directory')
+    args = parser.parse_args()
+
+    if args.saa == (args.assignment is not None):
+        parser.error("give either --assignment to evaluate or --saa to solve")
+    if args.output and not args.saa:
+        parser.error("--output writes the --saa placement")
+
+    instance = loadInstance(args.instance)
+    cities = instance.cities
+    rng = np.random.default_rng(args.seed)
+
+    if args.saa:
+        from matrix_model import buildStochasticCapacity
+        # Scenarios of the model, reduced so that the MILP keeps a few copies of the capacity rows
+        sample = sampleDemand(instance.demand, instance.varianceDemand, args.sample, rng, args.distribution)
+        kept, probabilities = reduceScenarios(sample, args.reduce)
+        penalty = args.penalty if args.penalty is not None else float(np.max(instance.distances))
+        model = buildStochasticCapacity(instance.distances, instance.demand, sample[kept], probabilities,
+                                        instance.fixedCost, instance.scalingCost, args.budget, penalty)
+        status, obj, x = model.solve(args.backend)
+        if status != 1:
+            print("Infeasible")
+            exit(1)
+        N = len(cities)
+        assignment = model.assignment(x)
+        capacity = x[model.n_arcs:model.n_arcs + N]
+        operating_cost = float(instance.demand @ instance.distances[np.arange(N), assignment])
+        print(f"SAA on {len(kept)} of {args.sample} scenarios, penalty {penalty:g}")
+        print("Objective: ", obj)
+        print("Operating cost: ", operating_cost)
+        print("Expected penalty in the model: ", obj - operating_cost)
+        if args.output:
+            writeAssignment(args.output, cities, supplierDict(cities, assignment))
+        warehouses = np.unique(assignment)
+        capacity = capacity[warehouses]
+    else:
+        assignment = readAssignment(args.assignment, cities)
+        warehouses = np.unique(assignment)
+        if args.capacity == 'supply':
+            capacity = instance.supply[warehouses]
+        else:
+            capacity = np.bincount(assignment, instance.demand, len(cities))[warehouses]
+
+    # Out of sample evaluation on fresh scenarios
+    _, loads = simulateLoads(instance.demand, instance.varianceDemand, assignment, args.scenarios, rng,
+                             args.distribution)
+    _printReport(cities, warehouses, assignment, scenarioReport(loads, capacity, args.percentiles))
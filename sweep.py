@@ -0,0 +1,70 @@
+# Sweep the number of warehouses in a single process
+# The instance is loaded once and every formulation keeps one model, only the warehouse count right hand side
+# changes between runs and the previous optimal placement, extended by one warehouse, is passed as MIP start
+
+import argparse
+import csv
+import sys
+import numpy as np
+from utils import loadInstance
+from matrix_model import buildPCenter, buildCapacitatedPCenter
+from heuristics import assignNearest, assignCapacitated
+
+FORMULATIONS = {
+    # warehouse_1.py, without demand and supply constraints
+    'pcenter': lambda instance, n: buildPCenter(instance.distances, n),
+    # warehouse_2.py, with demand and supply constraints
+    'capacitated': lambda instance, n: buildCapacitatedPCenter(instance.distances, instance.supply, instance.demand, n),
+}
+
+def _nextStart(instance, formulation, assignment, n_warehouses):
+    # Extend the previous placement with the cities farthest from it until there are n_warehouses warehouses
+    distances = np.asarray(instance.distances)
+    warehouses = list(np.unique(assignment))
+    while len(warehouses) < n_warehouses:
+        warehouses.append(int(distances[:, warehouses].min(axis=1).argmax()))
+    if formulation == 'capacitated':
+        return assignCapacitated(distances, instance.supply, instance.demand, warehouses)
+    return assignNearest(distances, warehouses)
+
+def sweepWarehouses(instance, formulation, counts, backend='cbc', time_limit=None):
+    # Solve the formulation for every warehouse count, yields (n, status, objective, assignment)
+    # status uses the PuLP codes, assignment[i] is the warehouse index of city i or None when not solved
+    model = None
+    start = None
+    for n in counts:
+        if model is None:
+            model = FORMULATIONS[formulation](instance, n)
+        else:
+            model.setBounds('n_warehouses', n, n)
+        status, obj, x = model.solve(backend, time_limit=time_limit,
+                                     start=None if start is None else model.startVector(start))
+
+        assignment = model.assignment(x) if status == 1 else None
+        yield n, status, obj if status == 1 else None, assignment
+
+        start = None if assignment is None else _nextStart(instance, formulation, assignment, n + 1)
+
+if __name__ == '__main__':
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description='Warehouse count sweep')
+    parser.add_argument('-n', '--number', type=int,
+                        default=32, help='Largest number of warehouses')
+    parser.add_argument('-f', '--formulations', nargs='+', choices=list(FORMULATIONS), default=list(FORMULATIONS),
+                        help='Formulations to sweep')
+    parser.add_argument('--backend', choices=['highs', 'cbc'], default='cbc',
+                        help='Solver backend, only cbc uses the MIP starts')
+    parser.add_argument('-t', '--time-limit', type=float, default=None,
+                        help='Time limit of every solve in seconds')
+    args = parser.parse_args()
+
+    instance = loadInstance('./Rajasthan')
+
+    # One csv row per solve: formulation, number of warehouses, objective (inf when infeasible)
+    writer = csv.writer(sys.stdout)
+    writer.writerow(['formulation', 'n_warehouses', 'max_distance'])
+    for formulation in args.formulations:
+        for n, status, obj, _ in sweepWarehouses(instance, formulation, range(1, args.number + 1), args.backend,
+                                                 args.time_limit):
+            writer.writerow([formulation, n, obj if status == 1 else float('inf')])
+            sys.stdout.flush()
@@ -0,0 +1,12 @@
+# Run with python -m pytest test_heuristics.py
+
+import numpy as np
+from heuristics import vertexSubstitution
+
+def test_vertex_substitution_max_tie_break():
+    # [1, 4] keeps the max delivery distance of [2, 4] at 10 and lowers the weighted distance from 13 to 12
+    x = np.array([0, 1, 2, 50, 60], dtype=float)
+    distances = np.abs(x[:, None] - x[None, :])
+    warehouses, max_distance = vertexSubstitution(distances, [2, 4], objective='max')
+    assert max_distance == 10
+    assert warehouses == [1, 4]
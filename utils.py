@@ -1,7 +1,6 @@
 import csv
-import geopandas as gpd
-import matplotlib.pyplot as plt
-import datetime
+import os
+import numpy as np
 
 def readDistances(filename):
     # Initialize the dictionary to store distances
@@ -29,19 +28,15 @@ def readDistances(filename):
     return distances
 
 def readCityNames(filename):
-    city_names = []
+    # A dict keeps the insertion order and makes the membership test O(1)
+    city_names = {}
     with open(filename, newline='') as csvfile:
         reader = csv.DictReader(csvfile)
         for row in reader:
-            start_city = row['start_city']
-            end_city = row['end_city']
+            city_names.setdefault(row['start_city'], None)
+            city_names.setdefault(row['end_city'], None)
 
-            if start_city not in city_names:
-                city_names.append(start_city)
-            if end_city not in city_names:
-                city_names.append(end_city)
-
-    return city_names
+    return list(city_names)
 
 def readSupply(filename):
     supply = {}
@@ -54,17 +49,19 @@ def readSupply(filename):
 
     return supply
 
-def readDemand(filename):
+def readDemand(filename, variance=False):
+    # Mean demand of every city, with variance also the (mean, variance) dicts
     demand = {}
+    varianceDemand = {}
     with open(filename, newline='') as csvfile:
         reader = csv.DictReader(csvfile)
         for row in reader:
             city = row['city']
             mean_demand = float(row['mean_demand'])
-            # variance_demand = float(row['variance_demand'])
             demand[city] = mean_demand
+            varianceDemand[city] = float(row['variance_demand'])
 
-    return demand
+    return (demand, varianceDemand) if variance else demand
 
 def readCost(filename):
     fixedCost = {}
@@ -78,105 +75,196 @@ def readCost(filename):
         
     return fixedCost, scalingCost
 
-def plotMap(cities, supplier, distances, obj, title, filename):
-    # Load the map of Rajasthan
-    map = gpd.read_file(filename=filename)
-
-    # Plot the map
-    map.plot()
-
-    # Plot the selected cities and warehouses
-    selected_cities = [
-        city for city in cities if supplier[city][city].value() == 1]
-    for city in cities:
-        city_data = map[map['district'] == city]
-        city_geom = city_data.geometry.values[0]
-        city_centroid = city_geom.centroid
-
-        if city in selected_cities:
-            plt.text(city_centroid.x, city_centroid.y, city, ha='center', va='bottom', fontsize=10, color='white',
-                        fontweight='bold', bbox=dict(facecolor='black', alpha=0.4, boxstyle='round,pad=0.2'))
-            plt.scatter(city_centroid.x, city_centroid.y,
-                        color='red', marker='s', label='Warehouse')
-        else:
-            plt.text(city_centroid.x, city_centroid.y, city,
-                        ha='center', va='bottom', fontsize=8)
-
-    # Draw lines between warehouses and cities
-    for city1 in cities:
-        for city2 in cities:
-            if supplier[city1][city2].value() == 1:
-                col = 'black'
-                # See if the distance is the largest
-                if abs(distances[city1][city2] - obj) < 1e-5:
-                    col = 'red'
-
-                city1_data = map[map['district'] == city1]
-                city2_data = map[map['district'] == city2]
-                city1_geom = city1_data.geometry.values[0]
-                city2_geom = city2_data.geometry.values[0]
-                plt.plot([city1_geom.centroid.x, city2_geom.centroid.x], [
-                            city1_geom.centroid.y, city2_geom.centroid.y], '-', lw=1.5, alpha=0.5, color=col)
-
-    plt.title(title)
-    plt.axis('off')
-    plt.text(0.5, 0.01, f"Max Delivery Distance: {obj:.2f}",
-                fontsize=12, color='black',
-                fontweight='bold',
-                horizontalalignment='center',
-                verticalalignment='center',
-                transform=plt.gca().transAxes)
-    plt.savefig('./Plots/' + 'plot_MILP_' + datetime.datetime.now().strftime("%Y%m%d_%H%M%S") + '.png')
-    plt.show()
-
-def plotMapPymoo(cities, supplier, distances, obj, title, filename):
-    # Load the map of Rajasthan
-    map = gpd.read_file(filename=filename)
-        
-    # Plot the map
-    map.plot()
-
-    # Plot the selected cities and warehouses
-    selected_cities = [
-        city for city in cities if supplier[city][city] == 1]
-    for city in cities:
-        city_data = map[map['district'] == city]
-        city_geom = city_data.geometry.values[0]
-        city_centroid = city_geom.centroid
-
-        if city in selected_cities:
-            plt.text(city_centroid.x, city_centroid.y, city, ha='center', va='bottom', fontsize=10, color='white',
-                        fontweight='bold', bbox=dict(facecolor='black', alpha=0.4, boxstyle='round,pad=0.2'))
-            plt.scatter(city_centroid.x, city_centroid.y,
-                        color='red', marker='s', label='Warehouse')
-        else:
-            plt.text(city_centroid.x, city_centroid.y, city,
-                        ha='center', va='bottom', fontsize=8)
-
-    # Draw lines between warehouses and cities
-    for city1 in cities:
-        for city2 in cities:
-            if supplier[city1][city2] == 1:
-                col = 'black'
-                # See if the distance is the largest
-                if abs(distances[city1][city2] - obj) < 1e-5:
-                    col = 'red'
-
-                city1_data = map[map['district'] == city1]
-                city2_data = map[map['district'] == city2]
-                city1_geom = city1_data.geometry.values[0]
-                city2_geom = city2_data.geometry.values[0]
-                plt.plot([city1_geom.centroid.x, city2_geom.centroid.x], [
-                            city1_geom.centroid.y, city2_geom.centroid.y], '-', lw=1.5, alpha=0.5, color=col)
-
-    plt.title(title)
-    plt.axis('off')
-    plt.text(0.5, 0.01, f"Max Delivery Distance: {obj:.2f}",
-                fontsize=12, color='black',
-                fontweight='bold',
-                horizontalalignment='center',
-                verticalalignment='center',
-                transform=plt.gca().transAxes)
-    # Add timestamp
-    plt.savefig('./Plots/' + 'plot_GA_' + datetime.datetime.now().strftime("%Y%m%d_%H%M%S") + '.png')
-    plt.show()
\ No newline at end of file
+CACHE_VERSION = 2
+INSTANCE_FILES = ('distances.csv', 'demand.csv', 'supply.csv', 'cost.csv')
+COORDINATES_FILE = 'coordinates.csv'
+
+class Instance:
+    # Dense, index-aligned view of a warehouse placement instance
+    # cities[i] is the name of city i, every vector and the distance matrix use the same ordering
+    # coordinates is a geo.Coordinates of the cities when the instance has them, an instance without distances.csv
+    # only computes its distance matrix from them when it is first used
+    def __init__(self, cities, distances, demand, varianceDemand, supply, fixedCost, scalingCost, coordinates=None):
+        self.cities = list(cities)
+        self.index = {city: i for i, city in enumerate(self.cities)}
+        self.n_cities = len(self.cities)
+        self._distances = distances
+        self.demand = demand
+        self.varianceDemand = varianceDemand
+        self.supply = supply
+        self.fixedCost = fixedCost
+        self.scalingCost = scalingCost
+        self.coordinates = coordinates
+
+    @property
+    def distances(self):
+        if self._distances is None and self.coordinates is not None:
+            self._distances = self.coordinates.matrix()
+        return self._distances
+
+    def distanceDict(self):
+        # Nested dict in the format returned by readDistances
+        rows = self.distances.tolist()
+        return {city1: dict(zip(self.cities, row)) for city1, row in zip(self.cities, rows)}
+
+    def vectorDict(self, vector):
+        # Map a city-aligned vector back to a {city: value} dict
+        return dict(zip(self.cities, np.asarray(vector).tolist()))
+
+def _fileSignature(directory):
+    # (size, mtime) of every source csv, used to validate the binary cache
+    signature = []
+    for name in INSTANCE_FILES:
+        stat = os.stat(os.path.join(directory, name))
+        signature.append([stat.st_size, stat.st_mtime_ns])
+    return np.array(signature, dtype=np.int64)
+
+def _readColumns(directory, name, columns, index):
+    # (len(columns), len(index)) values of a per city csv, aligned with the city index
+    values = np.full((len(columns), len(index)), np.nan)
+    with open(os.path.join(directory, name), newline='') as csvfile:
+        for row in csv.DictReader(csvfile):
+            if row['city'] in index:
+                for k, column in enumerate(columns):
+                    values[k, index[row['city']]] = float(row[column])
+    if np.isnan(values).any():
+        raise ValueError(f"{name} does not cover every city")
+    return values
+
+def _parseVectors(directory, index):
+    demand, varianceDemand = _readColumns(directory, 'demand.csv', ('mean_demand', 'variance_demand'), index)
+    supply, = _readColumns(directory, 'supply.csv', ('supply',), index)
+    fixedCost, scalingCost = _readColumns(directory, 'cost.csv', ('fixed_cost', 'scaling_cost'), index)
+    return demand, varianceDemand, supply, fixedCost, scalingCost
+
+def _parseInstance(directory, dtype):
+    with open(os.path.join(directory, 'distances.csv'), newline='') as csvfile:
+        reader = csv.reader(csvfile)
+        header = next(reader)
+        i_start, i_end, i_dist = header.index('start_city'), header.index('end_city'), header.index('distance_km')
+        rows = [(row[i_start], row[i_end], row[i_dist]) for row in reader]
+
+    index = {}
+    for start_city, end_city, _ in rows:
+        index.setdefault(start_city, len(index))
+        index.setdefault(end_city, len(index))
+    cities = list(index)
+    n = len(cities)
+
+    start = np.fromiter((index[row[0]] for row in rows), dtype=np.int64, count=len(rows))
+    end = np.fromiter((index[row[1]] for row in rows), dtype=np.int64, count=len(rows))
+    dist = np.fromiter((float(row[2]) for row in rows), dtype=np.float64, count=len(rows))
+
+    distances = np.full((n, n), np.inf, dtype=dtype)
+    distances[start, end] = dist
+    distances[end, start] = dist
+    np.fill_diagonal(distances, 0)
+    if np.isinf(distances).any():
+        missing = np.argwhere(np.isinf(distances))[0]
+        raise ValueError(f"Missing distance between {cities[missing[0]]} and {cities[missing[1]]}")
+
+    return Instance(cities, distances, *_parseVectors(directory, index))
+
+def _attachCoordinates(instance, directory):
+    # Coordinates of coordinates.csv aligned with the cities of the instance, left at None without the file
+    from geo import readCoordinates, alignCoordinates
+    filename = os.path.join(directory, COORDINATES_FILE)
+    if os.path.exists(filename):
+        instance.coordinates = alignCoordinates(instance.cities, *readCoordinates(filename))
+    return instance
+
+def loadInstance(directory='./Rajasthan', dtype=np.float64, cache=True, coordinates=False):
+    # Load distances, demand, supply and cost of an instance as dense numpy arrays
+    # The parsed arrays are stored in <directory>/.cache, later runs memory-map them without touching the csv files
+    # The shared instance.npz lists the dtypes whose distances_<dtype>.npy were written from the same csv files, a
+    # matrix of any other dtype is stale and rebuilt
+    # With coordinates the points of coordinates.csv are attached as instance.coordinates. An instance without
+    # distances.csv is read from coordinates.csv alone, its distances are computed from the coordinates when needed
+    dtype = np.dtype(dtype)
+    if not os.path.exists(os.path.join(directory, 'distances.csv')):
+        from geo import readCoordinates
+        cities, points = readCoordinates(os.path.join(directory, COORDINATES_FILE))
+        index = {city: i for i, city in enumerate(cities)}
+        return Instance(cities, None, *_parseVectors(directory, index), coordinates=points)
+    if not cache:
+        instance = _parseInstance(directory, dtype)
+        return _attachCoordinates(instance, directory) if coordinates else instance
+
+    cache_dir = os.path.join(directory, '.cache')
+    meta_file = os.path.join(cache_dir, 'instance.npz')
+    matrix_file = os.path.join(cache_dir, f'distances_{dtype.name}.npy')
+    signature = _fileSignature(directory)
+    matrices = [] # dtypes of the matrices that are current for this signature
+
+    if os.path.exists(meta_file):
+        try:
+            with np.load(meta_file) as meta:
+                if int(meta['version']) == CACHE_VERSION and np.array_equal(meta['signature'], signature):
+                    matrices = meta['matrices'].tolist()
+                if dtype.name in matrices and os.path.exists(matrix_file):
+                    cities = meta['cities'].tolist()
+                    distances = np.load(matrix_file, mmap_mode='r')
+                    if distances.shape == (len(cities), len(cities)) and distances.dtype == dtype:
+                        instance = Instance(cities, distances, meta['demand'], meta['varianceDemand'],
+                                            meta['supply'], meta['fixedCost'], meta['scalingCost'])
+                        return _attachCoordinates(instance, directory) if coordinates else instance
+        except (OSError, ValueError, KeyError):
+            pass # Corrupt or outdated cache, rebuild it below
+
+    instance = _parseInstance(directory, dtype)
+
+    # Write to temporary files first so concurrent runs never read a half written cache
+    os.makedirs(cache_dir, exist_ok=True)
+    pid = os.getpid()
+    with open(f'{matrix_file}.{pid}.tmp', 'wb') as f:
+        np.save(f, np.ascontiguousarray(instance.distances))
+    os.replace(f'{matrix_file}.{pid}.tmp', matrix_file)
+    matrices = sorted(set(matrices) | {dtype.name})
+    with open(f'{meta_file}.{pid}.tmp', 'wb') as f:
+        np.savez(f, version=CACHE_VERSION, signature=signature, matrices=np.array(matrices),
+                 cities=np.array(instance.cities), demand=instance.demand, varianceDemand=instance.varianceDemand,
+                 supply=instance.supply, fixedCost=instance.fixedCost, scalingCost=instance.scalingCost)
+    os.replace(f'{meta_file}.{pid}.tmp', meta_file)
+
+    return _attachCoordinates(instance, directory) if coordinates else instance
+
+def populationMatrix(X, n_vars, prefix):
+    # Convert a pymoo population of mixed variable dicts ({"w_0": 3, ...}) to a (pop, n_vars) array
+    X = np.asarray(X)
+    if X.dtype != object:
+        return X.reshape(len(X), n_vars)
+    keys = [f"{prefix}_{j}" for j in range(n_vars)]
+    return np.array([[x[key] for key in keys] for x in X], dtype=np.int64).reshape(len(X), n_vars)
+
+def supplierAssignment(cities, supplier):
+    # Warehouse index of every city from a supplier dict, its values are 0/1 or solved PuLP variables
+    from pulp import value
+    index = {city: k for k, city in enumerate(cities)}
+    return np.array([index[max(supplier[city1], key=lambda city2: value(supplier[city1][city2]) or 0)]
+                     for city1 in cities])
+
+def writeAssignment(filename, cities, supplier):
+    # csv with the warehouse of every city from a supplier dict
+    with open(filename, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(['city', 'warehouse'])
+        for city1, j in zip(cities, supplierAssignment(cities, supplier)):
+            writer.writerow([city1, cities[j]])
+
+def readAssignment(filename, cities):
+    # Warehouse index of every city from a csv of writeAssignment
+    index = {city: k for k, city in enumerate(cities)}
+    assignment = np.full(len(cities), -1)
+    with open(filename, newline='') as csvfile:
+        for row in csv.DictReader(csvfile):
+            assignment[index[row['city']]] = index[row['warehouse']]
+    if (assignment < 0).any():
+        raise ValueError(f"{filename} has no warehouse for {cities[int(np.argmax(assignment < 0))]}")
+    return assignment
+
+def supplierDict(cities, assignment):
+    # Adjacency dict {city1: {city2: 0/1}} of an assignment array, assignment[i] is the warehouse index of city i
+    supplier = {city1: {city2: 0 for city2 in cities} for city1 in cities}
+    for i, city in enumerate(cities):
+        supplier[city][cities[assignment[i]]] = 1
+    return supplier
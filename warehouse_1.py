@@ -7,9 +7,58 @@
 # Constraint: Number of warehouses
 # Constraint: A city can supply if there exists a warehouse in that city
 
-from pulp import LpProblem, LpVariable, lpSum, LpMinimize, LpSolverDefault, PULP_CBC_CMD, GUROBI_CMD
+from pulp import LpProblem, LpVariable, lpSum, LpMinimize, GUROBI_CMD
 import argparse
-from utils import readDistances, readCityNames, plotMap
+import numpy as np
+from utils import loadInstance, supplierDict, supplierAssignment, writeAssignment
+from matrix_model import buildPCenter
+from heuristics import farthestFirst, assignNearest, vertexSubstitution
+from metrics import Metrics
+from knearest import solveNearest, radiusCheck, nearestSummary
+from presolve import pCenterBounds, presolveArcs, presolveSummary, supplierVariables, restrictMatrixModel
+from result_cache import scriptCache
+
+def buildRadiusModel(cities, distances, n_warehouses, upper_bound=None):
+    # Radius indexed p-center model (Elloumi 2004, Calik & Tansel 2013)
+    # radius[k] = 1 if the max delivery distance is at least radii[k], radii are the sorted distinct distances
+    # A city needs a warehouse closer than radii[k] unless radius[k] = 1, so only N warehouse binaries remain
+    distances = np.asarray(distances)
+    if upper_bound is None:
+        upper_bound = distances.max()
+    radii = np.unique(distances)
+    radii = radii[radii <= upper_bound]
+
+    prob = LpProblem("Warehouse_Placement_Radius", LpMinimize)
+
+    # Decision variable: If a warehouse is placed in a city
+    warehouse = LpVariable.dicts("Warehouse", cities, cat='Binary')
+    # Decision variable: If the max delivery distance is at least radii[k]
+    radius = {k: LpVariable(f"Radius_{k}", cat='Binary') for k in range(1, len(radii))}
+
+    # Objective function: Minimize max delivery distance, the sum telescopes to the largest radius switched on
+    prob += radii[0] + lpSum((radii[k] - radii[k-1]) * radius[k] for k in radius)
+
+    # Constraint: Number of warehouses
+    prob += lpSum(warehouse[city] for city in cities) == n_warehouses
+
+    # Constraint: A larger radius implies all the smaller ones
+    for k in range(2, len(radii)):
+        prob += radius[k] <= radius[k-1]
+
+    # Constraint: Every city is covered within the chosen radius
+    for i, city in enumerate(cities):
+        order = np.argsort(distances[i], kind='stable')
+        row = distances[i][order]
+        # The set of close warehouses only changes at the distances of this city, the other radii are redundant
+        for d in np.unique(row[(row > 0) & (row <= upper_bound)]):
+            k = int(np.searchsorted(radii, d))
+            closer = order[:np.searchsorted(row, d, side='left')]
+            prob += radius[k] + lpSum(warehouse[cities[j]] for j in closer) >= 1
+        # No city can be further than the upper bound from its warehouse
+        within = order[:np.searchsorted(row, upper_bound, side='right')]
+        prob += lpSum(warehouse[cities[j]] for j in within) >= 1
+
+    return prob, warehouse
 
 if __name__ == '__main__':
     # Parse command line arguments
@@ -18,56 +67,171 @@ if __name__ == '__main__':
                         default=3, help='Number of warehouses')
     parser.add_argument('-p', '--plot', action='store_false',
                         help='Plot the warehouse placement')
+    parser.add_argument('-f', '--formulation', choices=['assignment', 'radius'], default='assignment',
+                        help='Assignment model with N^2 supplier binaries, or the compact radius indexed model')
+    parser.add_argument('-m', '--matrix', action='store_true',
+                        help='Build the assignment model as a sparse matrix and solve it in memory')
+    parser.add_argument('--backend', choices=['highs', 'cbc'], default='highs',
+                        help='Solver of the sparse matrix model, cbc goes through PuLP')
+    parser.add_argument('-k', '--nearest', type=int, default=None,
+                        help='Only let every city use its K nearest sites, K grows where the optimality check fails, needs --matrix')
+    parser.add_argument('--presolve', action='store_true',
+                        help='Remove the supplier variables a heuristic bound rules out before solving')
+    parser.add_argument('-s', '--start', action='store_true',
+                        help='Pass a local search placement as MIP start, needs --matrix with the cbc backend')
+    parser.add_argument('--assignment', metavar='PATH', default=None,
+                        help='Write the warehouse of every city as csv to PATH, scenarios.py evaluates it under random demand')
+    parser.add_argument('--metrics', metavar='PATH', default=None,
+                        help='Write phase timings, model size and solver statistics as JSON to PATH, - for stdout')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Solve even when a run with identical data and options is in the result cache, and do not store the result')
     args = parser.parse_args()
 
+    if args.matrix and args.formulation != 'assignment':
+        parser.error("--matrix only builds the assignment formulation")
+    if args.presolve and args.formulation != 'assignment':
+        parser.error("--presolve only applies to the assignment formulation")
+    if args.nearest is not None and (not args.matrix or args.presolve):
+        parser.error("--nearest needs --matrix and replaces --presolve")
+    if args.start and not (args.matrix and args.backend == 'cbc'):
+        parser.error("--start needs --matrix --backend cbc, HiGHS takes no MIP start")
+
     if args.number < 1:
         print("Number of warehouses should be at least 1")
         exit(1)
     N = args.number
+    metrics = Metrics('warehouse_1', args.metrics)
 
     # Dctionary to store distances
-    distances = readDistances('./Rajasthan/distances.csv')
-    cities = readCityNames('./Rajasthan/distances.csv')
+    metrics.mark('load')
+    instance = loadInstance('./Rajasthan')
+    cities = instance.cities
+    distances = instance.distanceDict()
 
-    # Create LP problem
-    prob = LpProblem("Warehouse_Placement", LpMinimize)
+    # A run with identical data and options gets the stored result without solving
+    metrics.mark('cache')
+    cache, key, cached = scriptCache('warehouse_1', args, instance)
 
-    # Define variable for total delivery time
-    max_distance = LpVariable("Max_Distance", lowBound=0, cat='Continuous')
+    if cached is not None:
+        metrics.set('solver', solver='cache')
+        status, obj = cached['status'], cached['objective']
+        if status == 1:
+            supplier = supplierDict(cities, cached['assignment'])
+    else:
+        # Every supplier variable is kept unless presolve rules it out
+        keep = np.ones((len(cities), len(cities)), dtype=bool)
+        fixed = np.zeros_like(keep)
+        lower_bound, upper_bound = 0, np.inf
+        if args.presolve:
+            metrics.mark('presolve')
+            lower_bound, upper_bound = pCenterBounds(instance.distances, N)
+            keep, fixed, stats = presolveArcs(instance.distances, upper_bound, lower_bound, n_warehouses=N)
+            print(presolveSummary(stats))
 
-    # Objective function: Minimize max delivery distance
-    prob += max_distance
+        metrics.mark('build')
+        if args.matrix:
+            # The models over the nearest sites are built in the solve phase, one per round
+            if args.nearest is None:
+                model = buildPCenter(instance.distances, N)
+                if args.presolve:
+                    restrictMatrixModel(model, keep, fixed, lower_bound, upper_bound)
+                metrics.matrixSize(model)
+        elif args.formulation == 'radius':
+            # A farthest-first placement bounds the radius, longer distances never appear in the model
+            _, upper_bound = farthestFirst(instance.distances, N)
+            prob, warehouse = buildRadiusModel(cities, instance.distances, N, upper_bound)
+        else:
+            # Create LP problem
+            prob = LpProblem("Warehouse_Placement", LpMinimize)
 
-    # Decision variable: If a city i is supplied by a warehouse at city j
-    supplier = LpVariable.dicts("Supplier", (cities, cities), cat='Binary')
+            # Define variable for total delivery time
+            max_distance = LpVariable("Max_Distance", lowBound=lower_bound,
+                                      upBound=upper_bound if np.isfinite(upper_bound) else None, cat='Continuous')
 
-    # Constraint: Max delivery distance of a city from the supplier
-    for city1 in cities:
-        for city2 in cities:
-            prob += max_distance >= distances[city1][city2] * supplier[city1][city2]
+            # Objective function: Minimize max delivery distance
+            prob += max_distance
 
-    # Constraint: Each city is covered by exactly one warehouse
-    for city1 in cities:
-        prob += lpSum(supplier[city1][city2] for city2 in cities) == 1
+            # Decision variable: If a city i is supplied by a warehouse at city j
+            # Removed pairs are the constant 0 and get no constraints
+            supplier = supplierVariables(cities, keep, fixed)
+
+            # Constraint: Max delivery distance of a city from the supplier
+            for i, city1 in enumerate(cities):
+                for j, city2 in enumerate(cities):
+                    if keep[i, j]:
+                        prob += max_distance >= distances[city1][city2] * supplier[city1][city2]
+
+            # Constraint: Each city is covered by exactly one warehouse
+            for i, city1 in enumerate(cities):
+                prob += lpSum(supplier[city1][city2] for j, city2 in enumerate(cities) if keep[i, j]) == 1
+
+            # Constraint: Number of warehouses
+            prob += lpSum(supplier[city][city] for j, city in enumerate(cities) if keep[j, j]) == N
+
+            # Constraint: A city can supply if there exists a warehouse in that city
+            for i, city1 in enumerate(cities):
+                for j, city2 in enumerate(cities):
+                    if keep[i, j] and i != j:
+                        prob += supplier[city1][city2] <= supplier[city2][city2]
+        if not args.matrix:
+            metrics.pulpSize(prob)
+
+        metrics.mark('solve')
+        if args.matrix:
+            start = None
+            if args.start:
+                # Farthest-first placement improved by vertex substitution, every city at its nearest warehouse
+                warehouses, radius = vertexSubstitution(instance.distances, farthestFirst(instance.distances, N)[0],
+                                                        objective='max')
+                start = (assignNearest(instance.distances, warehouses), radius)
+            if args.nearest is not None:
+                model, status, obj, x, rounds = solveNearest(lambda arcs: buildPCenter(instance.distances, N, arcs),
+                                                             instance.distances, args.nearest,
+                                                             radiusCheck(instance.distances), args.backend, start=start,
+                                                             log_path=metrics.cbcLogPath())
+                print(nearestSummary(rounds, len(cities)))
+                metrics.matrixSize(model)
+                metrics.set('model', nearest_rounds=rounds)
+            else:
+                status, obj, x = model.solve(args.backend, start=None if start is None else model.startVector(*start),
+                                             log_path=metrics.cbcLogPath())
+            metrics.matrixSolver(model, args.backend)
+            if status == 1:
+                supplier = supplierDict(cities, model.assignment(x))
+        else:
+            # Solve the problem
+            # prob.solve(GUROBI_CMD(msg=0))
+            prob.solve(metrics.cbcSolver(msg=0)) # Use this if you don't have Gurobi installed
+            metrics.cbcLog()
+            status = prob.status
+
+        if args.formulation == 'radius' and status == 1:
+            # Recover the assignment, every city goes to its nearest warehouse
+            warehouses = [j for j, city in enumerate(cities) if warehouse[city].value() > 0.5]
+            nearest = assignNearest(instance.distances, warehouses)
+            supplier = supplierDict(cities, nearest)
+            # Same as the objective, which PuLP leaves empty when every city gets a warehouse
+            obj = float(instance.distances[np.arange(len(cities)), nearest].max())
+        elif status == 1 and not args.matrix:
+            obj = prob.objective.value()
+
+    if cache is not None and cached is None:
+        cache.store(key, status, obj if status == 1 else None,
+                    supplierAssignment(cities, supplier) if status == 1 else None)
 
-    # Constraint: Number of warehouses
-    prob += lpSum(supplier[city][city] for city in cities) == N
-
-    # Constraint: A city can supply if there exists a warehouse in that city
-    for city1 in cities:
-        for city2 in cities:
-            prob += supplier[city1][city2] <= supplier[city2][city2]
-
-    # Solve the problem
-    solver = LpSolverDefault
-    # prob.solve(GUROBI_CMD(msg=0))
-    prob.solve(PULP_CBC_CMD(msg=0)) # Use this if you don't have Gurobi installed
-    
     # Check the status of the solution
-    if prob.status != 1:
+    metrics.mark('report')
+    if status != 1:
         print("Infeasible")
     else:
-        print(prob.objective.value())
+        print(obj)
+
+    if args.assignment and status == 1:
+        writeAssignment(args.assignment, cities, supplier)
+
+    if args.plot and status == 1:
+        metrics.mark('plot')
+        from plotting import plotMap
+        plotMap(cities, supplier, distances, obj, "Warehouse Placement using MLP", './Rajasthan/rajasthan_district.shp')
 
-    if args.plot and prob.status == 1:
-        plotMap(cities, supplier, distances, prob.objective.value(), "Warehouse Placement using MLP", './Rajasthan/rajasthan_district.shp')
\ No newline at end of file
+    metrics.write(status=status, objective=obj if status == 1 else None)
@@ -3,16 +3,18 @@
 # Objective function: Minimize the maximum delivery time
 # Decision variable: An array representing the indices of the warehouses
 
+import argparse
 import numpy as np
-from pymoo.core.problem import ElementwiseProblem
+from pymoo.core.problem import ElementwiseProblem, Problem
 from pymoo.core.mixed import MixedVariableGA
 from pymoo.termination.default import DefaultSingleObjectiveTermination
 from pymoo.optimize import minimize
-from utils import readDistances, readCityNames, plotMapPymoo
+from utils import loadInstance, populationMatrix, supplierDict, writeAssignment
+from fitness_cache import CachedProblem
+from parallel_eval import ParallelProblem
+from metrics import Metrics
 from pymoo.core.variable import Integer
 
-import matplotlib.pyplot as plt
-import geopandas as gpd
 
 # Define the warehouse placement problem as a pymoo problem
 class WarehousePlacement(ElementwiseProblem):
@@ -40,49 +42,143 @@ class WarehousePlacement(ElementwiseProblem):
         # Objective: Minimize the maximum delivery time
         out["F"] = max_delivery_distance
 
-# Dictionary to store distances
-distances = readDistances('./Rajasthan/distances.csv')
-cities = readCityNames('./Rajasthan/distances.csv')
-
-# Create the problem instance
-problem = WarehousePlacement(cities, distances, n_warehouses=5)
-
-# Configure the genetic algorithm
-algorithm = MixedVariableGA(pop_size=100)
-termination = DefaultSingleObjectiveTermination(
-    xtol=1e-8,
-    cvtol=1e-6,
-    ftol=1e-6,
-    period=100,
-    n_max_gen=10000000,
-    n_max_evals=10000000
-)
-
-# Perform optimization
-res = minimize(problem,
-               algorithm,
-               termination,
-               verbose=True,
-               seed=1)
-
-# Get the results
-best_solution = res.X
-max_delivery_distance = np.min(res.F)
-
-# A array cities where the warehouses are placed
-wharehouses = [cities[best_solution[f"w_{i}"]] for i in range(problem.n_warehouses)]
-print(wharehouses)
-
-# Create the adjacency matrix
-supplier = {
-    city1: {
-        city2: 0 for city2 in cities
-    }
-    for city1 in cities
-}
-for city1 in cities:
-    min_index = np.argmin([distances[city1][city2] for city2 in wharehouses])
-    supplier[city1][wharehouses[min_index]] = 1
-
-# Plot the results
-plotMapPymoo(cities, supplier, distances, max_delivery_distance, "Warehouse Placement", './Rajasthan/rajasthan_district.shp')
\ No newline at end of file
+# Same problem evaluated for the whole population at once on a dense distance matrix
+# With coordinates (geo.Coordinates) no matrix is needed, the nearest warehouses come from a KD-tree per individual
+class WarehousePlacementBatch(Problem):
+    def __init__(self, cities, distances, n_warehouses, coordinates=None):
+        self.cities = cities
+        self.n_cities = len(cities)
+        self.distances = None if distances is None else np.asarray(distances) # (n_cities, n_cities) matrix, e.g. loadInstance(...).distances
+        self.coordinates = coordinates
+        self.n_warehouses = n_warehouses
+        vars = {
+            f"w_{i}": Integer(bounds=(0, self.n_cities-1)) for i in range(self.n_warehouses)
+        }
+        super().__init__(vars=vars, n_obj=1, n_eq_constr=0, n_ieq_constr=0)
+
+    def _evaluate(self, X, out, *args, **kwargs):
+        W = populationMatrix(X, self.n_warehouses, "w") # (pop, n_warehouses)
+
+        if self.coordinates is not None:
+            out["F"] = np.array([self.coordinates.nearest(w)[1].max() for w in W])
+            return
+
+        # Gather the distance of every city to every warehouse: (n_cities, pop, n_warehouses)
+        min_distance = self.distances[:, W].min(axis=2)
+
+        # Objective: Minimize the maximum delivery time
+        out["F"] = min_distance.max(axis=0)
+
+if __name__ == '__main__':
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description='Warehouse Placement')
+    parser.add_argument('-e', '--elementwise', action='store_true',
+                        help='Evaluate one individual at a time instead of the whole population')
+    parser.add_argument('-c', '--cache-size', type=int, default=100000,
+                        help='Number of evaluated genomes to memoize, 0 disables the cache')
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help='Number of processes evaluating the population')
+    parser.add_argument('--coordinates', action='store_true',
+                        help='Compute distances from the city coordinates (coordinates.csv, else the district centroids of the shapefile) with KD-tree nearest warehouse queries')
+    parser.add_argument('--assignment', metavar='PATH', default=None,
+                        help='Write the warehouse of every city as csv to PATH, scenarios.py evaluates it under random demand')
+    parser.add_argument('--metrics', metavar='PATH', default=None,
+                        help='Write phase timings, generations, evaluations per second and cache hits as JSON to PATH, - for stdout')
+    args = parser.parse_args()
+
+    if args.workers > 1 and args.elementwise:
+        parser.error("--workers needs the batch evaluator, it cannot be combined with --elementwise")
+    if args.coordinates and args.elementwise:
+        parser.error("--coordinates needs the batch evaluator, it cannot be combined with --elementwise")
+
+    metrics = Metrics('warehouse_1_pymoo', args.metrics)
+
+    # Dictionary to store distances
+    metrics.mark('load')
+    instance = loadInstance('./Rajasthan', coordinates=args.coordinates)
+    cities = instance.cities
+    coordinates = None
+    if args.coordinates:
+        from geo import shapefileCoordinates
+        coordinates = instance.coordinates or shapefileCoordinates('./Rajasthan/rajasthan_district.shp', cities)
+    else:
+        distances = instance.distanceDict()
+
+    # Create the problem instance
+    metrics.mark('build')
+    if args.elementwise:
+        problem = WarehousePlacement(cities, distances, n_warehouses=5)
+    else:
+        problem = WarehousePlacementBatch(cities, None if args.coordinates else instance.distances, n_warehouses=5,
+                                          coordinates=coordinates)
+
+    if args.workers > 1:
+        problem = parallel = ParallelProblem(problem, n_workers=args.workers)
+    if args.cache_size > 0:
+        problem = CachedProblem(problem, max_size=args.cache_size)
+
+    metrics.set('model', variables=problem.n_var, constraints=problem.n_ieq_constr + problem.n_eq_constr)
+
+    # Configure the genetic algorithm
+    algorithm = MixedVariableGA(pop_size=100)
+    termination = DefaultSingleObjectiveTermination(
+        xtol=1e-8,
+        cvtol=1e-6,
+        ftol=1e-6,
+        period=100,
+        n_max_gen=10000000,
+        n_max_evals=10000000
+    )
+
+    # Perform optimization
+    metrics.mark('solve')
+    res = minimize(problem,
+                   algorithm,
+                   termination,
+                   callback=metrics.gaCallback(),
+                   verbose=True,
+                   seed=1)
+
+    metrics.mark('report')
+    metrics.gaResult(res, problem if args.cache_size > 0 else None)
+
+    if args.workers > 1:
+        parallel.close()
+    if args.cache_size > 0:
+        print("Fitness cache:", problem.stats())
+
+    # Get the results
+    best_solution = res.X
+    max_delivery_distance = np.min(res.F)
+
+    # A array cities where the warehouses are placed
+    wharehouses = [cities[best_solution[f"w_{i}"]] for i in range(problem.n_warehouses)]
+    print(wharehouses)
+
+    # Create the adjacency matrix
+    if args.coordinates:
+        # Nearest warehouse of every city from a KD-tree, distances are only kept for the assigned pairs
+        sites = np.array([instance.index[city] for city in wharehouses])
+        min_index, min_distance = coordinates.nearest(sites)
+        supplier = supplierDict(cities, sites[min_index])
+        distances = {city: {cities[sites[k]]: d} for city, k, d in zip(cities, min_index, min_distance)}
+    else:
+        supplier = {
+            city1: {
+                city2: 0 for city2 in cities
+            }
+            for city1 in cities
+        }
+        for city1 in cities:
+            min_index = np.argmin([distances[city1][city2] for city2 in wharehouses])
+            supplier[city1][wharehouses[min_index]] = 1
+
+    if args.assignment:
+        writeAssignment(args.assignment, cities, supplier)
+
+    # Plot the results
+    metrics.mark('plot')
+    from plotting import plotMapPymoo
+    plotMapPymoo(cities, supplier, distances, max_delivery_distance, "Warehouse Placement", './Rajasthan/rajasthan_district.shp')
+
+    metrics.write(objective=float(np.min(res.F)) if res.F is not None else None)
@@ -11,9 +11,106 @@
 # Constraint: A city can supply if there exists a warehouse in that city
 # Constraint: Each wharehouse must meet the demand of the cities it serves
 
-from pulp import LpProblem, LpVariable, lpSum, LpMinimize, LpSolverDefault, PULP_CBC_CMD, GUROBI_CMD
+from pulp import LpProblem, LpVariable, lpSum, LpMinimize, PULP_CBC_CMD, GUROBI_CMD
 import argparse
-from utils import readDistances, readCityNames, readSupply, readDemand, plotMap
+import numpy as np
+from utils import loadInstance, supplierDict, supplierAssignment, writeAssignment
+from matrix_model import buildCapacitatedPCenter
+from heuristics import farthestFirst, assignCapacitated, vertexSubstitution
+from presolve import capacitatedBounds, presolveArcs, presolveSummary, supplierVariables, restrictMatrixModel
+from metrics import Metrics
+from knearest import solveNearest, radiusCheck, nearestSummary
+from result_cache import scriptCache
+
+def buildFeasibilityModel(distances, supply, demand, n_warehouses, radius, relax=False):
+    # Capacitated assignment that only keeps the arcs not longer than radius, no objective
+    # supplier[i, i] doubles as the warehouse variable of city i, like in the full model
+    cat = 'Continuous' if relax else 'Binary'
+    arcs = list(zip(*np.nonzero(np.asarray(distances) <= radius)))
+
+    prob = LpProblem("Warehouse_Feasibility", LpMinimize)
+    supplier = {(i, j): LpVariable(f"Supplier_{i}_{j}", lowBound=0, upBound=1, cat=cat) for i, j in arcs}
+    prob += lpSum([])
+
+    served_by = {i: [] for i in range(len(distances))}
+    serves = {j: [] for j in range(len(distances))}
+    for i, j in arcs:
+        served_by[i].append(supplier[i, j])
+        serves[j].append((supplier[i, j], demand[i]))
+
+    # Constraint: Each city is covered by exactly one warehouse within the radius
+    for i, variables in served_by.items():
+        prob += lpSum(variables) == 1
+
+    # Constraint: Number of warehouses
+    prob += lpSum(supplier[j, j] for j in range(len(distances))) == n_warehouses
+
+    # Constraint: A city can supply if there exists a warehouse in that city
+    for i, j in arcs:
+        if i != j:
+            prob += supplier[i, j] <= supplier[j, j]
+
+    # Constraint: Each wharehouse must meet the demand of the cities it serves
+    for j, terms in serves.items():
+        prob += lpSum(d * x for x, d in terms) <= supply[j] * supplier[j, j]
+
+    return prob, supplier
+
+def solveBisection(distances, supply, demand, n_warehouses, solver):
+    # Binary search over the sorted distinct distances for the smallest radius with a feasible assignment
+    # Returns the max delivery distance and the warehouse of every city, or (None, None) if infeasible
+    distances = np.asarray(distances)
+    n_cities = len(distances)
+    if n_warehouses > n_cities:
+        return None, None
+    radii = np.unique(distances)
+
+    def maxDistance(assignment):
+        return distances[np.arange(n_cities), assignment].max()
+
+    def feasible(k, relax=False):
+        prob, supplier = buildFeasibilityModel(distances, supply, demand, n_warehouses, radii[k], relax)
+        prob.solve(solver)
+        if prob.status != 1:
+            return None
+        if relax:
+            return True
+        assignment = np.empty(n_cities, dtype=np.int64)
+        for (i, j), x in supplier.items():
+            if x.value() > 0.5:
+                assignment[i] = j
+        return assignment
+
+    # Upper bound: farthest-first placement with a greedy capacitated assignment
+    warehouses, _ = farthestFirst(distances, n_warehouses)
+    best = assignCapacitated(distances, supply, demand, warehouses)
+    hi = len(radii) - 1 if best is None else int(np.searchsorted(radii, maxDistance(best)))
+
+    # Lower bound: the smallest radius whose LP relaxation is feasible, the MILP is infeasible below it
+    lo, lp_hi = 0, hi
+    if not feasible(lp_hi, relax=True):
+        return None, None
+    while lo < lp_hi:
+        mid = (lo + lp_hi) // 2
+        if feasible(mid, relax=True):
+            lp_hi = mid
+        else:
+            lo = mid + 1
+
+    # Bisection on the integer feasibility problem between the two bounds
+    while lo < hi:
+        mid = (lo + hi) // 2
+        assignment = feasible(mid)
+        if assignment is not None:
+            hi, best = mid, assignment
+        else:
+            lo = mid + 1
+    if best is None:
+        best = feasible(hi)
+        if best is None:
+            return None, None
+
+    return maxDistance(best), best
 
 if __name__ == '__main__':
     # Parse command line arguments
@@ -22,63 +119,176 @@ if __name__ == '__main__':
                         default=3, help='Number of warehouses')
     parser.add_argument('-p', '--plot', action='store_false',
                         help='Plot the warehouse placement')
+    parser.add_argument('-f', '--formulation', choices=['assignment', 'bisection'], default='assignment',
+                        help='Single min-max assignment model, or a bisection over radii with small feasibility models')
+    parser.add_argument('-m', '--matrix', action='store_true',
+                        help='Build the assignment model as a sparse matrix and solve it in memory')
+    parser.add_argument('--backend', choices=['highs', 'cbc'], default='highs',
+                        help='Solver of the sparse matrix model, cbc goes through PuLP')
+    parser.add_argument('-k', '--nearest', type=int, default=None,
+                        help='Only let every city use its K nearest sites, K grows where the optimality check fails, needs --matrix')
+    parser.add_argument('--presolve', action='store_true',
+                        help='Remove the supplier variables a heuristic bound rules out before solving')
+    parser.add_argument('-s', '--start', action='store_true',
+                        help='Pass a local search placement as MIP start, needs --matrix with the cbc backend')
+    parser.add_argument('--assignment', metavar='PATH', default=None,
+                        help='Write the warehouse of every city as csv to PATH, scenarios.py evaluates it under random demand')
+    parser.add_argument('--metrics', metavar='PATH', default=None,
+                        help='Write phase timings, model size and solver statistics as JSON to PATH, - for stdout')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Solve even when a run with identical data and options is in the result cache, and do not store the result')
     args = parser.parse_args()
 
+    if args.matrix and args.formulation != 'assignment':
+        parser.error("--matrix only builds the assignment formulation")
+    if args.presolve and args.formulation != 'assignment':
+        parser.error("--presolve only applies to the assignment formulation")
+    if args.nearest is not None and (not args.matrix or args.presolve):
+        parser.error("--nearest needs --matrix and replaces --presolve")
+    if args.start and not (args.matrix and args.backend == 'cbc'):
+        parser.error("--start needs --matrix --backend cbc, HiGHS takes no MIP start")
+
     if args.number < 1:
         print("Number of warehouses should be at least 1")
         exit(1)
     N = args.number
+    metrics = Metrics('warehouse_2', args.metrics)
 
     # Dictionary to store distances
-    distances = readDistances('./Rajasthan/distances.csv')
-    cities = readCityNames('./Rajasthan/distances.csv')
-    supply = readSupply('./Rajasthan/supply.csv')
-    demand = readDemand('./Rajasthan/demand.csv')
+    metrics.mark('load')
+    instance = loadInstance('./Rajasthan')
+    cities = instance.cities
+    distances = instance.distanceDict()
+    supply = instance.vectorDict(instance.supply)
+    demand = instance.vectorDict(instance.demand)
 
-    # Create LP problem
-    prob = LpProblem("Warehouse_Placement", LpMinimize)
+    # A run with identical data and options gets the stored result without solving
+    metrics.mark('cache')
+    cache, key, cached = scriptCache('warehouse_2', args, instance)
 
-    # Define variable for total delivery time
-    max_distance = LpVariable("Max_Distance", lowBound=0, cat='Continuous')
+    # Every supplier variable is kept unless presolve rules it out
+    keep = np.ones((len(cities), len(cities)), dtype=bool)
+    fixed = np.zeros_like(keep)
+    lower_bound, upper_bound = 0, np.inf
+    if args.presolve and cached is None:
+        metrics.mark('presolve')
+        lower_bound, upper_bound = capacitatedBounds(instance.distances, instance.supply, instance.demand, N)
+        keep, fixed, stats = presolveArcs(instance.distances, upper_bound, lower_bound,
+                                          supply=instance.supply, demand=instance.demand)
+        print(presolveSummary(stats))
 
-    # Objective function: Minimize max delivery distance
-    prob += max_distance
+    if cached is not None:
+        metrics.set('solver', solver='cache')
+        status, obj = cached['status'], cached['objective']
+        if status == 1:
+            supplier = supplierDict(cities, cached['assignment'])
+    elif args.formulation == 'bisection':
+        # Every feasibility model is built and solved inside the bisection
+        metrics.mark('solve')
+        obj, assignment = solveBisection(instance.distances, instance.supply, instance.demand, N, PULP_CBC_CMD(msg=0))
+        status = 1 if assignment is not None else -1
+        if status == 1:
+            supplier = supplierDict(cities, assignment)
+    elif args.matrix:
+        metrics.mark('build')
+        # The models over the nearest sites are built in the solve phase, one per round
+        if args.nearest is None:
+            model = buildCapacitatedPCenter(instance.distances, instance.supply, instance.demand, N)
+            if args.presolve:
+                restrictMatrixModel(model, keep, fixed, lower_bound, upper_bound)
+            metrics.matrixSize(model)
+        metrics.mark('solve')
+        start = None
+        if args.start:
+            # Uncapacitated local search placement, used when the greedy capacitated assignment fits it
+            warehouses, _ = vertexSubstitution(instance.distances, farthestFirst(instance.distances, N)[0],
+                                               objective='max')
+            assignment = assignCapacitated(instance.distances, instance.supply, instance.demand, warehouses)
+            if assignment is not None:
+                radius = instance.distances[np.arange(len(cities)), assignment].max()
+                start = (assignment, radius)
+        if args.nearest is not None:
+            model, status, obj, x, rounds = solveNearest(
+                lambda arcs: buildCapacitatedPCenter(instance.distances, instance.supply, instance.demand, N, arcs),
+                instance.distances, args.nearest, radiusCheck(instance.distances), args.backend, start=start,
+                log_path=metrics.cbcLogPath())
+            print(nearestSummary(rounds, len(cities)))
+            metrics.matrixSize(model)
+            metrics.set('model', nearest_rounds=rounds)
+        else:
+            status, obj, x = model.solve(args.backend, start=None if start is None else model.startVector(*start),
+                                         log_path=metrics.cbcLogPath())
+        metrics.matrixSolver(model, args.backend)
+        if status == 1:
+            supplier = supplierDict(cities, model.assignment(x))
+    else:
+        # Create LP problem
+        metrics.mark('build')
+        prob = LpProblem("Warehouse_Placement", LpMinimize)
 
-    # Decision variable: If a city i is supplied by a warehouse at city j
-    supplier = LpVariable.dicts("Supplier", (cities, cities), cat='Binary')
+        # Define variable for total delivery time
+        max_distance = LpVariable("Max_Distance", lowBound=lower_bound,
+                                  upBound=upper_bound if np.isfinite(upper_bound) else None, cat='Continuous')
 
-    # Constraint: Max delivery distance of a city from the supplier
-    for city1 in cities:
-        for city2 in cities:
-            prob += max_distance >= distances[city1][city2] * supplier[city1][city2]
+        # Objective function: Minimize max delivery distance
+        prob += max_distance
 
-    # Constraint: Each city is covered by exactly one warehouse
-    for city1 in cities:
-        prob += lpSum(supplier[city1][city2] for city2 in cities) == 1
+        # Decision variable: If a city i is supplied by a warehouse at city j
+        # Removed pairs are the constant 0 and get no constraints
+        supplier = supplierVariables(cities, keep, fixed)
 
-    # Constraint: Number of warehouses
-    prob += lpSum(supplier[city][city] for city in cities) == N
+        # Constraint: Max delivery distance of a city from the supplier
+        for i, city1 in enumerate(cities):
+            for j, city2 in enumerate(cities):
+                if keep[i, j]:
+                    prob += max_distance >= distances[city1][city2] * supplier[city1][city2]
 
-    # Constraint: A city can supply if there exists a warehouse in that city
-    for city1 in cities:
-        for city2 in cities:
-            prob += supplier[city1][city2] <= supplier[city2][city2]
+        # Constraint: Each city is covered by exactly one warehouse
+        for i, city1 in enumerate(cities):
+            prob += lpSum(supplier[city1][city2] for j, city2 in enumerate(cities) if keep[i, j]) == 1
 
-    # Constraint: Each wharehouse must meet the demand of the cities it serves
-    for city2 in cities:
-        prob += lpSum(supplier[city1][city2] * demand[city1]
-                      for city1 in cities) <= supply[city2] * supplier[city2][city2]
+        # Constraint: Number of warehouses
+        prob += lpSum(supplier[city][city] for j, city in enumerate(cities) if keep[j, j]) == N
+
+        # Constraint: A city can supply if there exists a warehouse in that city
+        for i, city1 in enumerate(cities):
+            for j, city2 in enumerate(cities):
+                if keep[i, j] and i != j:
+                    prob += supplier[city1][city2] <= supplier[city2][city2]
+
+        # Constraint: Each wharehouse must meet the demand of the cities it serves
+        for j, city2 in enumerate(cities):
+            if keep[j, j]:
+                prob += lpSum(supplier[city1][city2] * demand[city1]
+                              for i, city1 in enumerate(cities) if keep[i, j]) <= supply[city2] * supplier[city2][city2]
+
+        metrics.pulpSize(prob)
 
-    # Solve the problem
-    solver = LpSolverDefault
-    # prob.solve(GUROBI_CMD(msg=0))
-    prob.solve(PULP_CBC_CMD(msg=0)) # Use this if you don't have Gurobi installed
+        # Solve the problem
+        metrics.mark('solve')
+        # prob.solve(GUROBI_CMD(msg=0))
+        prob.solve(metrics.cbcSolver(msg=0)) # Use this if you don't have Gurobi installed
+        metrics.cbcLog()
+        status = prob.status
+        obj = prob.objective.value()
+
+    if cache is not None and cached is None:
+        cache.store(key, status, obj if status == 1 else None,
+                    supplierAssignment(cities, supplier) if status == 1 else None)
 
     # Check the status of the solution
-    if prob.status != 1:
+    metrics.mark('report')
+    if status != 1:
         print("Infeasible")
     else:
-        print(prob.objective.value())
+        print(obj)
+
+    if args.assignment and status == 1:
+        writeAssignment(args.assignment, cities, supplier)
+
+    if args.plot and status == 1:
+        metrics.mark('plot')
+        from plotting import plotMap
+        plotMap(cities, supplier, distances, obj, "Warehouse Placement in Rajasthan with Demand and Supply Constraints using MLP", './Rajasthan/rajasthan_district.shp')
 
-    if args.plot and prob.status == 1:
-        plotMap(cities, supplier, distances, prob.objective.value(), "Warehouse Placement in Rajasthan with Demand and Supply Constraints using MLP", './Rajasthan/rajasthan_district.shp')
+    metrics.write(status=status, objective=obj if status == 1 else None)
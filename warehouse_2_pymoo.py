@@ -14,8 +14,9 @@
 # Each wharehouse must meet the demand of the cities it serves
 # The wharehouse placement is still optimized to minimize the maximum delivery time
 
+import argparse
 import numpy as np
-from pymoo.core.problem import ElementwiseProblem
+from pymoo.core.problem import ElementwiseProblem, Problem
 from pymoo.core.mixed import MixedVariableGA
 from pymoo.algorithms.moo.nsga2 import NSGA2
 from pymoo.operators.crossover.pntx import TwoPointCrossover
@@ -24,11 +25,12 @@ from pymoo.operators.sampling.rnd import BinaryRandomSampling
 from pymoo.termination.max_gen import MaximumGenerationTermination
 from pymoo.termination.default import DefaultSingleObjectiveTermination
 from pymoo.optimize import minimize
-from utils import readDistances, readCityNames, readDemand, readSupply, plotMapPymoo
+from utils import loadInstance, populationMatrix, supplierDict, writeAssignment
+from fitness_cache import CachedProblem
+from parallel_eval import ParallelProblem
+from metrics import Metrics
 from pymoo.core.variable import Binary, Integer
 
-import matplotlib.pyplot as plt
-import geopandas as gpd
 
 # Define the warehouse placement problem as a pymoo problem
 class WarehousePlacement(ElementwiseProblem):
@@ -70,58 +72,177 @@ class WarehousePlacement(ElementwiseProblem):
         # Constraint: Each wharehouse must meet the demand of the cities it serves
         out["G"] = demand - supply # demand - supply <= 0
                     
-# Dictionary to store distances
-distances = readDistances('./Rajasthan/distances.csv')
-cities = readCityNames('./Rajasthan/distances.csv')
-supply = readSupply('./Rajasthan/supply.csv')
-demand = readDemand('./Rajasthan/demand.csv')
-
-# Create the problem instance
-problem = WarehousePlacement(cities, distances, supply, demand, n_warehouses=7)
-
-# Configure the genetic algorithm
-algorithm = MixedVariableGA(pop_size=100)
-termination = DefaultSingleObjectiveTermination(
-    xtol=1e-8,
-    cvtol=1e-6,
-    ftol=1e-6,
-    period=1000,
-    n_max_gen=100000,
-    n_max_evals=1000000
-)
-
-# Perform optimization
-res = minimize(problem,
-               algorithm,
-               termination,
-               verbose=True,
-               seed=42,
-               save_history=True)
-
-# Get the results
-best_solution = res.X
-max_delivery_distance = np.min(res.F)
-
-# A array cities where the warehouses are placed
-wharehouses = [cities[best_solution[f"w_{i}"]] for i in range(problem.n_warehouses)]
-print(wharehouses)
-
-# Create the adjacency matrix
-supplier = {
-    city1: {
-        city2: 0 for city2 in cities
-    }
-    for city1 in cities
-}
-for city1 in cities:
-    min_index = np.argmin([distances[city1][city2] for city2 in wharehouses])
-    supplier[city1][wharehouses[min_index]] = 1
-
-# Plot the avg f over iterations
-plt.plot([algo.pop.get("F").mean() for algo in res.history])
-plt.xlabel("Iterations")
-plt.ylabel("Max Delivery Time")
-plt.title("Max Delivery Time Over Iterations (Genetic Algorithm, population=100)")
-
-# Plot the results
-plotMapPymoo(cities, supplier, distances, max_delivery_distance, "Warehouse Placement in Rajasthan with Demand and Supply Constraints Using Genetic Algorithms", './Rajasthan/rajasthan_district.shp')
\ No newline at end of file
+# Same problem evaluated for the whole population at once on dense distance, supply and demand arrays
+# With coordinates (geo.Coordinates) no matrix is needed, the nearest warehouses come from a KD-tree per individual
+class WarehousePlacementBatch(Problem):
+    def __init__(self, cities, distances, supply, demand, n_warehouses, coordinates=None):
+        self.cities = cities
+        self.n_cities = len(cities)
+        self.distances = None if distances is None else np.asarray(distances) # (n_cities, n_cities) matrix, e.g. loadInstance(...).distances
+        self.coordinates = coordinates
+        self.n_warehouses = n_warehouses
+        self.supply = np.asarray(supply) # Supply of each city, aligned with cities
+        self.demand = np.asarray(demand) # Demand of each city, aligned with cities
+
+        vars = {
+            f"w_{i}": Integer(bounds=(0, self.n_cities-1)) for i in range(self.n_warehouses)
+        }
+        super().__init__(vars=vars, n_obj=1, n_eq_constr=0, n_ieq_constr=self.n_warehouses)
+
+    def _evaluate(self, X, out, *args, **kwargs):
+        W = populationMatrix(X, self.n_warehouses, "w") # (pop, n_warehouses)
+        n_pop = len(W)
+
+        if self.coordinates is not None:
+            F = np.empty(n_pop)
+            G = np.empty((n_pop, self.n_warehouses))
+            for p, w in enumerate(W):
+                min_index, min_distance = self.coordinates.nearest(w)
+                F[p] = min_distance.max()
+                G[p] = np.bincount(min_index, weights=self.demand, minlength=self.n_warehouses) - self.supply[w]
+            out["F"] = F
+            out["G"] = G
+            return
+
+        # Distance of every city to every warehouse of every individual: (pop, n_cities, n_warehouses)
+        distance = self.distances[:, W].transpose(1, 0, 2)
+        # Nearest warehouse of each city, ties go to the first warehouse like in the element-wise loop
+        min_index = distance.argmin(axis=2)
+        min_distance = np.take_along_axis(distance, min_index[:, :, None], axis=2)[:, :, 0]
+
+        # Stack up the demand into the nearest warehouse, one bincount for the whole population
+        bins = (min_index + self.n_warehouses * np.arange(n_pop)[:, None]).ravel()
+        weights = np.broadcast_to(self.demand, (n_pop, self.n_cities)).ravel()
+        demand = np.bincount(bins, weights=weights, minlength=n_pop * self.n_warehouses).reshape(n_pop, self.n_warehouses)
+
+        # Objective: Minimize the maximum delivery time
+        out["F"] = min_distance.max(axis=1)
+
+        # Constraint: Each wharehouse must meet the demand of the cities it serves
+        out["G"] = demand - self.supply[W] # demand - supply <= 0
+
+if __name__ == '__main__':
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description='Warehouse Placement')
+    parser.add_argument('-e', '--elementwise', action='store_true',
+                        help='Evaluate one individual at a time instead of the whole population')
+    parser.add_argument('-c', '--cache-size', type=int, default=100000,
+                        help='Number of evaluated genomes to memoize, 0 disables the cache')
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help='Number of processes evaluating the population')
+    parser.add_argument('--coordinates', action='store_true',
+                        help='Compute distances from the city coordinates (coordinates.csv, else the district centroids of the shapefile) with KD-tree nearest warehouse queries')
+    parser.add_argument('--assignment', metavar='PATH', default=None,
+                        help='Write the warehouse of every city as csv to PATH, scenarios.py evaluates it under random demand')
+    parser.add_argument('--metrics', metavar='PATH', default=None,
+                        help='Write phase timings, generations, evaluations per second and cache hits as JSON to PATH, - for stdout')
+    args = parser.parse_args()
+
+    if args.workers > 1 and args.elementwise:
+        parser.error("--workers needs the batch evaluator, it cannot be combined with --elementwise")
+    if args.coordinates and args.elementwise:
+        parser.error("--coordinates needs the batch evaluator, it cannot be combined with --elementwise")
+
+    metrics = Metrics('warehouse_2_pymoo', args.metrics)
+
+    # Dictionary to store distances
+    metrics.mark('load')
+    instance = loadInstance('./Rajasthan', coordinates=args.coordinates)
+    cities = instance.cities
+    coordinates = None
+    if args.coordinates:
+        from geo import shapefileCoordinates
+        coordinates = instance.coordinates or shapefileCoordinates('./Rajasthan/rajasthan_district.shp', cities)
+    else:
+        distances = instance.distanceDict()
+    supply = instance.vectorDict(instance.supply)
+    demand = instance.vectorDict(instance.demand)
+
+    # Create the problem instance
+    metrics.mark('build')
+    if args.elementwise:
+        problem = WarehousePlacement(cities, distances, supply, demand, n_warehouses=7)
+    else:
+        problem = WarehousePlacementBatch(cities, None if args.coordinates else instance.distances, instance.supply,
+                                          instance.demand, n_warehouses=7, coordinates=coordinates)
+
+    if args.workers > 1:
+        problem = parallel = ParallelProblem(problem, n_workers=args.workers)
+    if args.cache_size > 0:
+        problem = CachedProblem(problem, max_size=args.cache_size)
+
+    metrics.set('model', variables=problem.n_var, constraints=problem.n_ieq_constr + problem.n_eq_constr)
+
+    # Configure the genetic algorithm
+    algorithm = MixedVariableGA(pop_size=100)
+    termination = DefaultSingleObjectiveTermination(
+        xtol=1e-8,
+        cvtol=1e-6,
+        ftol=1e-6,
+        period=1000,
+        n_max_gen=100000,
+        n_max_evals=1000000
+    )
+
+    # Perform optimization
+    metrics.mark('solve')
+    res = minimize(problem,
+                   algorithm,
+                   termination,
+                   callback=metrics.gaCallback(),
+                   verbose=True,
+                   seed=42,
+                   save_history=True)
+
+    metrics.mark('report')
+    metrics.gaResult(res, problem if args.cache_size > 0 else None)
+
+    if args.workers > 1:
+        parallel.close()
+    if args.cache_size > 0:
+        print("Fitness cache:", problem.stats())
+
+    # Get the results
+    best_solution = res.X
+    max_delivery_distance = np.min(res.F)
+
+    # A array cities where the warehouses are placed
+    wharehouses = [cities[best_solution[f"w_{i}"]] for i in range(problem.n_warehouses)]
+    print(wharehouses)
+
+    # Create the adjacency matrix
+    if args.coordinates:
+        # Nearest warehouse of every city from a KD-tree, distances are only kept for the assigned pairs
+        sites = np.array([instance.index[city] for city in wharehouses])
+        min_index, min_distance = coordinates.nearest(sites)
+        supplier = supplierDict(cities, sites[min_index])
+        distances = {city: {cities[sites[k]]: d} for city, k, d in zip(cities, min_index, min_distance)}
+    else:
+        supplier = {
+            city1: {
+                city2: 0 for city2 in cities
+            }
+            for city1 in cities
+        }
+        for city1 in cities:
+            min_index = np.argmin([distances[city1][city2] for city2 in wharehouses])
+            supplier[city1][wharehouses[min_index]] = 1
+
+    # The plotting stack is only loaded once the optimization is done
+    metrics.mark('plot')
+    import matplotlib.pyplot as plt
+    from plotting import plotMapPymoo
+
+    # Plot the avg f over iterations
+    plt.plot([algo.pop.get("F").mean() for algo in res.history])
+    plt.xlabel("Iterations")
+    plt.ylabel("Max Delivery Time")
+    plt.title("Max Delivery Time Over Iterations (Genetic Algorithm, population=100)")
+
+    if args.assignment:
+        writeAssignment(args.assignment, cities, supplier)
+
+    # Plot the results
+    plotMapPymoo(cities, supplier, distances, max_delivery_distance, "Warehouse Placement in Rajasthan with Demand and Supply Constraints Using Genetic Algorithms", './Rajasthan/rajasthan_district.shp')
+
+    metrics.write(objective=float(np.min(res.F)) if res.F is not None else None)
@@ -11,9 +11,18 @@
 # Constraint: A city can supply if there exists a warehouse in that city
 # Constraint: Each wharehouse must meet the demand of the cities it serves
 
-from pulp import LpProblem, LpVariable, lpSum, LpMinimize, LpSolverDefault, PULP_CBC_CMD, GUROBI_CMD
+from pulp import LpProblem, LpVariable, lpSum, LpMinimize, GUROBI_CMD
 import argparse
-from utils import readDistances, readCityNames, readSupply, readDemand, readCost, plotMap
+import csv
+import sys
+import numpy as np
+from utils import loadInstance, supplierDict, supplierAssignment, writeAssignment
+from frontier import budgetFrontier
+from matrix_model import buildBudgetPCenter
+from presolve import budgetBounds, presolveArcs, presolveSummary, supplierVariables, restrictMatrixModel
+from metrics import Metrics
+from knearest import solveNearest, radiusCheck, nearestSummary
+from result_cache import scriptCache
 
 if __name__ == '__main__':
     # Parse command line arguments
@@ -22,62 +31,181 @@ if __name__ == '__main__':
                         default=10.0, help='Budget constraint')
     parser.add_argument('-p', '--plot', action='store_false',
                         help='Plot the warehouse placement')
+    parser.add_argument('-m', '--matrix', action='store_true',
+                        help='Build the model as a sparse matrix and solve it in memory')
+    parser.add_argument('--backend', choices=['highs', 'cbc'], default='highs',
+                        help='Solver of the sparse matrix model, cbc goes through PuLP')
+    parser.add_argument('--frontier', action='store_true',
+                        help='Find every budget where the optimum changes instead of solving a single budget')
+    parser.add_argument('-k', '--nearest', type=int, default=None,
+                        help='Only let every city use its K nearest sites, K grows where the optimality check fails, needs --matrix')
+    parser.add_argument('--presolve', action='store_true',
+                        help='Remove the supplier variables a heuristic bound rules out before solving')
+    parser.add_argument('--assignment', metavar='PATH', default=None,
+                        help='Write the warehouse of every city as csv to PATH, scenarios.py evaluates it under random demand')
+    parser.add_argument('--metrics', metavar='PATH', default=None,
+                        help='Write phase timings, model size and solver statistics as JSON to PATH, - for stdout')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Solve even when a run with identical data and options is in the result cache, and do not store the result')
     args = parser.parse_args()
 
-    Budget = args.budget
-
-    # Dictionary to store distances
-    distances = readDistances('./Rajasthan/distances.csv')
-    cities = readCityNames('./Rajasthan/distances.csv')
-    supply = readSupply('./Rajasthan/supply.csv')
-    demand = readDemand('./Rajasthan/demand.csv')
-    fixedCost, _ = readCost('./Rajasthan/cost.csv')
-
-    # Create LP problem
-    prob = LpProblem("Warehouse_Placement", LpMinimize)
-
-    # Define variable for total delivery time
-    max_distance = LpVariable("Max_Distance", lowBound=0, cat='Continuous')
-
-    # Objective function: Minimize max delivery distance
-    prob += max_distance
-
-    # Decision variable: If a city i is supplied by a warehouse at city j
-    supplier = LpVariable.dicts("Supplier", (cities, cities), cat='Binary')
-
-    # Constraint: Max delivery distance of a city from the supplier
-    for city1 in cities:
-        for city2 in cities:
-            prob += max_distance >= distances[city1][city2] * supplier[city1][city2]
+    if args.presolve and args.frontier:
+        parser.error("--presolve bounds a single budget, it does not apply to --frontier")
+    if args.nearest is not None and (not args.matrix or args.presolve or args.frontier):
+        parser.error("--nearest needs --matrix, replaces --presolve and solves a single budget")
 
-    # Constraint: Each city is covered by exactly one warehouse
-    for city1 in cities:
-        prob += lpSum(supplier[city1][city2] for city2 in cities) == 1
+    if args.assignment and args.frontier:
+        parser.error("--assignment writes the placement of a single budget")
 
-    # Constraint: Total cost < Budget
-    prob += lpSum(supplier[city][city] * fixedCost[city]
-                  for city in cities) <= Budget
-
-    # Constraint: A city can supply if there exists a warehouse in that city
-    for city1 in cities:
-        for city2 in cities:
-            prob += supplier[city1][city2] <= supplier[city2][city2]
-
-    # Constraint: Each wharehouse must meet the demand of the cities it serves
-    for city2 in cities:
-        prob += lpSum(supplier[city1][city2] * demand[city1]
-                      for city1 in cities) <= supply[city2] * supplier[city2][city2]
+    Budget = args.budget
+    metrics = Metrics('warehouse_3', args.metrics)
 
-    # Solve the problem
-    solver = LpSolverDefault
-    # prob.solve(GUROBI_CMD(msg=0))
-    prob.solve(PULP_CBC_CMD(msg=0)) # Use this if you don't have Gurobi installed
+    # Dictionary to store distances
+    metrics.mark('load')
+    instance = loadInstance('./Rajasthan')
+    cities = instance.cities
+    distances = instance.distanceDict()
+    supply = instance.vectorDict(instance.supply)
+    demand = instance.vectorDict(instance.demand)
+    fixedCost = instance.vectorDict(instance.fixedCost)
+
+    if args.frontier:
+        # One csv row per breakpoint, the objective holds from this budget up to the previous row
+        metrics.mark('build')
+        model = buildBudgetPCenter(instance.distances, instance.supply, instance.demand, instance.fixedCost, Budget)
+        metrics.matrixSize(model)
+        metrics.mark('solve')
+        writer = csv.writer(sys.stdout)
+        writer.writerow(['budget', 'max_distance', 'n_warehouses', 'warehouses'])
+        budgets, objectives = [], []
+        for spent, obj, x in budgetFrontier(model, args.backend):
+            warehouses = [cities[j] for j in np.unique(model.assignment(x))]
+            writer.writerow([spent, obj, len(warehouses), ';'.join(warehouses)])
+            sys.stdout.flush()
+            budgets.append(spent)
+            objectives.append(obj)
+        metrics.set('solver', solver=args.backend, breakpoints=len(budgets))
+        if args.plot and budgets:
+            metrics.mark('plot')
+            from plotting import plotFrontier
+            plotFrontier(budgets, objectives, 'Max Delivery Distance', 'Max Delivery Distance vs Budget')
+        metrics.write(status=1 if budgets else -1, budgets=budgets, objectives=objectives)
+        exit(0)
+
+    # A run with identical data and options gets the stored result without solving
+    metrics.mark('cache')
+    cache, key, cached = scriptCache('warehouse_3', args, instance)
+
+    # Every supplier variable is kept unless presolve rules it out
+    keep = np.ones((len(cities), len(cities)), dtype=bool)
+    fixed = np.zeros_like(keep)
+    lower_bound, upper_bound = 0, np.inf
+    if args.presolve and cached is None:
+        metrics.mark('presolve')
+        lower_bound, upper_bound = budgetBounds(instance.distances, instance.supply, instance.demand,
+                                                instance.fixedCost, Budget)
+        keep, fixed, stats = presolveArcs(instance.distances, upper_bound, lower_bound, supply=instance.supply,
+                                          demand=instance.demand, fixedCost=instance.fixedCost, budget=Budget)
+        print(presolveSummary(stats))
+
+    metrics.mark('build')
+    if cached is not None:
+        metrics.set('solver', solver='cache')
+        status, obj = cached['status'], cached['objective']
+        if status == 1:
+            supplier = supplierDict(cities, cached['assignment'])
+    elif args.matrix and args.nearest is not None:
+        # The models over the nearest sites are built and solved in rounds
+        metrics.mark('solve')
+        model, status, obj, x, rounds = solveNearest(
+            lambda arcs: buildBudgetPCenter(instance.distances, instance.supply, instance.demand, instance.fixedCost,
+                                            Budget, arcs),
+            instance.distances, args.nearest, radiusCheck(instance.distances), args.backend,
+            log_path=metrics.cbcLogPath())
+        print(nearestSummary(rounds, len(cities)))
+        metrics.matrixSize(model)
+        metrics.set('model', nearest_rounds=rounds)
+        metrics.matrixSolver(model, args.backend)
+        if status == 1:
+            supplier = supplierDict(cities, model.assignment(x))
+    elif args.matrix:
+        model = buildBudgetPCenter(instance.distances, instance.supply, instance.demand, instance.fixedCost, Budget)
+        if args.presolve:
+            restrictMatrixModel(model, keep, fixed, lower_bound, upper_bound)
+        metrics.matrixSize(model)
+        metrics.mark('solve')
+        status, obj, x = model.solve(args.backend, log_path=metrics.cbcLogPath())
+        metrics.matrixSolver(model, args.backend)
+        if status == 1:
+            supplier = supplierDict(cities, model.assignment(x))
+    else:
+        # Create LP problem
+        prob = LpProblem("Warehouse_Placement", LpMinimize)
+
+        # Define variable for total delivery time
+        max_distance = LpVariable("Max_Distance", lowBound=lower_bound,
+                                  upBound=upper_bound if np.isfinite(upper_bound) else None, cat='Continuous')
+
+        # Objective function: Minimize max delivery distance
+        prob += max_distance
+
+        # Decision variable: If a city i is supplied by a warehouse at city j
+        # Removed pairs are the constant 0 and get no constraints
+        supplier = supplierVariables(cities, keep, fixed)
+
+        # Constraint: Max delivery distance of a city from the supplier
+        for i, city1 in enumerate(cities):
+            for j, city2 in enumerate(cities):
+                if keep[i, j]:
+                    prob += max_distance >= distances[city1][city2] * supplier[city1][city2]
+
+        # Constraint: Each city is covered by exactly one warehouse
+        for i, city1 in enumerate(cities):
+            prob += lpSum(supplier[city1][city2] for j, city2 in enumerate(cities) if keep[i, j]) == 1
+
+        # Constraint: Total cost < Budget
+        prob += lpSum(supplier[city][city] * fixedCost[city]
+                      for j, city in enumerate(cities) if keep[j, j]) <= Budget
+
+        # Constraint: A city can supply if there exists a warehouse in that city
+        for i, city1 in enumerate(cities):
+            for j, city2 in enumerate(cities):
+                if keep[i, j] and i != j:
+                    prob += supplier[city1][city2] <= supplier[city2][city2]
+
+        # Constraint: Each wharehouse must meet the demand of the cities it serves
+        for j, city2 in enumerate(cities):
+            if keep[j, j]:
+                prob += lpSum(supplier[city1][city2] * demand[city1]
+                              for i, city1 in enumerate(cities) if keep[i, j]) <= supply[city2] * supplier[city2][city2]
+
+        metrics.pulpSize(prob)
+
+        # Solve the problem
+        metrics.mark('solve')
+        # prob.solve(GUROBI_CMD(msg=0))
+        prob.solve(metrics.cbcSolver(msg=0)) # Use this if you don't have Gurobi installed
+        metrics.cbcLog()
+        status = prob.status
+        obj = prob.objective.value()
+
+    if cache is not None and cached is None:
+        cache.store(key, status, obj if status == 1 else None,
+                    supplierAssignment(cities, supplier) if status == 1 else None)
 
     # Check the status of the solution
-    if prob.status != 1:
+    metrics.mark('report')
+    if status != 1:
         print("Infeasible")
     else:
-        print(prob.objective.value())
+        print(obj)
+
+    if args.assignment and status == 1:
+        writeAssignment(args.assignment, cities, supplier)
+
+    if args.plot and status == 1:
+        metrics.mark('plot')
+        from plotting import plotMap
+        plotMap(cities, supplier, distances, obj, "Warehouse Placement in Rajasthan with Demand, Supply and\nBudget Constraint using MLP", './Rajasthan/rajasthan_district.shp')
 
-    if args.plot and prob.status == 1:
-        plotMap(cities, supplier, distances, prob.objective.value(), "Warehouse Placement in Rajasthan with Demand, Supply and\nBudget Constraint using MLP", './Rajasthan/rajasthan_district.shp')
\ No newline at end of file
+    metrics.write(status=status, objective=obj if status == 1 else None)
@@ -12,8 +12,9 @@
 # Each warehouse must meet the demand of the cities it serves
 # The warehouse placement is still optimized to minimize the maximum delivery time
 
+import argparse
 import numpy as np
-from pymoo.core.problem import ElementwiseProblem
+from pymoo.core.problem import ElementwiseProblem, Problem
 from pymoo.core.mixed import MixedVariableGA
 from pymoo.algorithms.moo.nsga2 import NSGA2
 from pymoo.operators.crossover.pntx import TwoPointCrossover
@@ -22,11 +23,12 @@ from pymoo.operators.sampling.rnd import BinaryRandomSampling
 from pymoo.termination.max_gen import MaximumGenerationTermination
 from pymoo.termination.default import DefaultSingleObjectiveTermination
 from pymoo.optimize import minimize
-from utils import readDistances, readCityNames, readDemand, readSupply, readCost, plotMapPymoo
+from utils import loadInstance, populationMatrix, supplierDict, writeAssignment
+from fitness_cache import CachedProblem
+from parallel_eval import ParallelProblem
+from metrics import Metrics
 from pymoo.core.variable import Binary, Integer
 
-import matplotlib.pyplot as plt
-import geopandas as gpd
 
 # Define the warehouse placement problem as a pymoo problem
 class WarehousePlacement(ElementwiseProblem):
@@ -76,61 +78,215 @@ class WarehousePlacement(ElementwiseProblem):
         [
             total_cost - self.budget # Total cost <= Budget
         ])
-                    
-# Dictionary to store distances
-distances = readDistances('./Rajasthan/distances.csv')
-cities = readCityNames('./Rajasthan/distances.csv')
-supply = readSupply('./Rajasthan/supply.csv')
-fixedCost, _ = readCost('./Rajasthan/cost.csv')
-demand = readDemand('./Rajasthan/demand.csv')
-
-# Create the problem instance
-problem = WarehousePlacement(cities, distances, supply, demand, fixedCost, budget=7)
-
-# Configure the genetic algorithm
-algorithm = MixedVariableGA(pop_size=100)
-termination = DefaultSingleObjectiveTermination(
-    xtol=1e-8,
-    cvtol=1e-6,
-    ftol=1e-6,
-    period=1000,
-    n_max_gen=1000,
-    n_max_evals=1000000
-)
-
-# Perform optimization
-res = minimize(problem,
-               algorithm,
-               termination,
-               verbose=True,
-               seed=42,
-               save_history=True)
-
-# Get the results
-best_solution = res.X
-max_delivery_distance = np.min(res.F)
-
-# A array cities where the warehouses are placed
-warehouses = [cities[i] for i in range(len(cities)) if best_solution[f"x_{i}"] == 1]
-print(warehouses)
-
-# Create the adjacency matrix
-supplier = {
-    city1: {
-        city2: 0 for city2 in cities
-    }
-    for city1 in cities
-}
-for city1 in cities:
-    min_index = np.argmin([distances[city1][city2] for city2 in warehouses])
-    supplier[city1][warehouses[min_index]] = 1
-
-# Plot the avg f over iterations
-plt.plot([algo.pop.get("F").mean() for algo in res.history])
-plt.xlabel("Iterations")
-plt.ylabel("Max Delivery Distance")
-plt.title("Max Delivery Distance Over Iterations (Genetic Algorithm, population=100)")
-plt.show()
-
-# Plot the results
-plotMapPymoo(cities, supplier, distances, max_delivery_distance, "Warehouse Placement in Rajasthan with Demand, Supply and\nBudget Constraints Using Genetic Algorithms", './Rajasthan/rajasthan_district.shp')
\ No newline at end of file
+
+def nearestOpen(problem, is_open):
+    # Nearest open warehouse of every city and its distance for a boolean (pop, n_cities) population, both (pop, n_cities)
+    # problem holds either coordinates or the sorted candidate lists order and sorted_distances, and chunk_size
+    # Individuals without any warehouse get city 0 at distance 0 on both paths, the callers penalize them
+    n_pop, n_cities = is_open.shape
+    nearest = np.zeros((n_pop, n_cities), dtype=np.int64)
+    min_distance = np.zeros((n_pop, n_cities))
+    if problem.coordinates is not None:
+        for p in np.flatnonzero(is_open.any(axis=1)):
+            sites = np.flatnonzero(is_open[p])
+            min_index, min_distance[p] = problem.coordinates.nearest(sites)
+            nearest[p] = sites[min_index]
+        return nearest, min_distance
+    step = max(1, problem.chunk_size // (n_cities * n_cities))
+    for start in range(0, n_pop, step):
+        chunk = is_open[start:start+step]
+        # Rank of the nearest open warehouse of each city: first open entry in its sorted candidate list
+        rank = chunk[:, problem.order].argmax(axis=2) # (chunk, n_cities)
+        nearest[start:start+step] = np.take_along_axis(problem.order[None], rank[:, :, None], axis=2)[:, :, 0]
+        min_distance[start:start+step] = np.take_along_axis(problem.sorted_distances[None], rank[:, :, None],
+                                                            axis=2)[:, :, 0]
+    # An all closed row ranks every city's own entry first, reset it to the same city 0 at distance 0
+    empty = ~is_open.any(axis=1)
+    nearest[empty], min_distance[empty] = 0, 0.0
+    return nearest, min_distance
+
+# Same problem evaluated for the whole population at once, the genome is handled as a boolean (pop, n_cities) matrix
+# With coordinates (geo.Coordinates) no matrix is needed, the nearest warehouses come from a KD-tree per individual
+class WarehousePlacementBatch(Problem):
+    def __init__(self, cities, distances, supply, demand, fixedCost, budget, chunk_size=2**24, coordinates=None):
+        self.cities = cities
+        self.distances = None if distances is None else np.asarray(distances) # (n_cities, n_cities) matrix, e.g. loadInstance(...).distances
+        self.coordinates = coordinates
+        self.supply = np.asarray(supply)
+        self.demand = np.asarray(demand)
+        self.fixedCost = np.asarray(fixedCost)
+        self.budget = budget
+        self.n_cities = len(cities)
+        # Maximum number of (individual, city, candidate) entries held in memory at once
+        self.chunk_size = chunk_size
+
+        if coordinates is not None:
+            # Finite penalty of an individual without any warehouse
+            self.max_distance = coordinates.diameterBound()
+        else:
+            # Candidate warehouses of every city sorted by distance, a stable sort keeps the lowest index first on ties
+            self.order = np.argsort(self.distances, axis=1, kind='stable')
+            self.sorted_distances = np.take_along_axis(self.distances, self.order, axis=1)
+            self.max_distance = self.distances.max()
+
+        # Decision variables: Binary array representing if a warehouse exists in a city
+        vars = {
+            f"x_{i}": Binary() for i in range(self.n_cities)
+        }
+        # Constraints: demand <= supply of every city, total cost <= budget, at least one warehouse
+        super().__init__(vars=vars, n_obj=1, n_eq_constr=0, n_ieq_constr=2+self.n_cities)
+
+    def _evaluate(self, X, out, *args, **kwargs):
+        is_open = populationMatrix(X, self.n_cities, "x").astype(bool) # (pop, n_cities)
+        n_pop = len(is_open)
+        has_warehouse = is_open.any(axis=1)
+
+        nearest, min_distance = nearestOpen(self, is_open)
+        max_delivery_distance = min_distance.max(axis=1)
+
+        # Stack up the demand into the nearest warehouse, individuals without any warehouse serve nobody
+        bins = (nearest + self.n_cities * np.arange(n_pop)[:, None])[has_warehouse].ravel()
+        weights = np.broadcast_to(self.demand, (n_pop, self.n_cities))[has_warehouse].ravel()
+        total_demand = np.bincount(bins, weights=weights, minlength=n_pop * self.n_cities).reshape(n_pop, self.n_cities)
+
+        total_cost = is_open @ self.fixedCost
+
+        # Without any warehouse the delivery distance is unbounded, use the largest distance as a finite penalty
+        max_delivery_distance[~has_warehouse] = self.max_distance
+
+        # Objective: Minimize the maximum delivery time
+        out["F"] = max_delivery_distance
+
+        out["G"] = np.column_stack([
+            total_demand - self.supply, # Demand <= Supply
+            total_cost - self.budget, # Total cost <= Budget
+            1 - is_open.sum(axis=1) # At least one warehouse
+        ])
+
+if __name__ == '__main__':
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description='Warehouse Placement')
+    parser.add_argument('-e', '--elementwise', action='store_true',
+                        help='Evaluate one individual at a time instead of the whole population')
+    parser.add_argument('-c', '--cache-size', type=int, default=100000,
+                        help='Number of evaluated genomes to memoize, 0 disables the cache')
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help='Number of processes evaluating the population')
+    parser.add_argument('--coordinates', action='store_true',
+                        help='Compute distances from the city coordinates (coordinates.csv, else the district centroids of the shapefile) with KD-tree nearest warehouse queries')
+    parser.add_argument('--assignment', metavar='PATH', default=None,
+                        help='Write the warehouse of every city as csv to PATH, scenarios.py evaluates it under random demand')
+    parser.add_argument('--metrics', metavar='PATH', default=None,
+                        help='Write phase timings, generations, evaluations per second and cache hits as JSON to PATH, - for stdout')
+    args = parser.parse_args()
+
+    if args.workers > 1 and args.elementwise:
+        parser.error("--workers needs the batch evaluator, it cannot be combined with --elementwise")
+    if args.coordinates and args.elementwise:
+        parser.error("--coordinates needs the batch evaluator, it cannot be combined with --elementwise")
+
+    metrics = Metrics('warehouse_3_pymoo', args.metrics)
+
+    # Dictionary to store distances
+    metrics.mark('load')
+    instance = loadInstance('./Rajasthan', coordinates=args.coordinates)
+    cities = instance.cities
+    coordinates = None
+    if args.coordinates:
+        from geo import shapefileCoordinates
+        coordinates = instance.coordinates or shapefileCoordinates('./Rajasthan/rajasthan_district.shp', cities)
+    else:
+        distances = instance.distanceDict()
+    supply = instance.vectorDict(instance.supply)
+    fixedCost = instance.vectorDict(instance.fixedCost)
+    demand = instance.vectorDict(instance.demand)
+
+    # Create the problem instance
+    metrics.mark('build')
+    if args.elementwise:
+        problem = WarehousePlacement(cities, distances, supply, demand, fixedCost, budget=7)
+    else:
+        problem = WarehousePlacementBatch(cities, None if args.coordinates else instance.distances, instance.supply,
+                                          instance.demand, instance.fixedCost, budget=7, coordinates=coordinates)
+
+    if args.workers > 1:
+        problem = parallel = ParallelProblem(problem, n_workers=args.workers)
+    if args.cache_size > 0:
+        problem = CachedProblem(problem, max_size=args.cache_size)
+
+    metrics.set('model', variables=problem.n_var, constraints=problem.n_ieq_constr + problem.n_eq_constr)
+
+    # Configure the genetic algorithm
+    algorithm = MixedVariableGA(pop_size=100)
+    termination = DefaultSingleObjectiveTermination(
+        xtol=1e-8,
+        cvtol=1e-6,
+        ftol=1e-6,
+        period=1000,
+        n_max_gen=1000,
+        n_max_evals=1000000
+    )
+
+    # Perform optimization
+    metrics.mark('solve')
+    res = minimize(problem,
+                   algorithm,
+                   termination,
+                   callback=metrics.gaCallback(),
+                   verbose=True,
+                   seed=42,
+                   save_history=True)
+
+    metrics.mark('report')
+    metrics.gaResult(res, problem if args.cache_size > 0 else None)
+
+    if args.workers > 1:
+        parallel.close()
+    if args.cache_size > 0:
+        print("Fitness cache:", problem.stats())
+
+    # Get the results
+    best_solution = res.X
+    max_delivery_distance = np.min(res.F)
+
+    # A array cities where the warehouses are placed
+    warehouses = [cities[i] for i in range(len(cities)) if best_solution[f"x_{i}"] == 1]
+    print(warehouses)
+
+    # Create the adjacency matrix
+    if args.coordinates:
+        # Nearest warehouse of every city from a KD-tree, distances are only kept for the assigned pairs
+        sites = np.array([instance.index[city] for city in warehouses])
+        min_index, min_distance = coordinates.nearest(sites)
+        supplier = supplierDict(cities, sites[min_index])
+        distances = {city: {cities[sites[k]]: d} for city, k, d in zip(cities, min_index, min_distance)}
+    else:
+        supplier = {
+            city1: {
+                city2: 0 for city2 in cities
+            }
+            for city1 in cities
+        }
+        for city1 in cities:
+            min_index = np.argmin([distances[city1][city2] for city2 in warehouses])
+            supplier[city1][warehouses[min_index]] = 1
+
+    # The plotting stack is only loaded once the optimization is done
+    metrics.mark('plot')
+    import matplotlib.pyplot as plt
+    from plotting import plotMapPymoo
+
+    # Plot the avg f over iterations
+    plt.plot([algo.pop.get("F").mean() for algo in res.history])
+    plt.xlabel("Iterations")
+    plt.ylabel("Max Delivery Distance")
+    plt.title("Max Delivery Distance Over Iterations (Genetic Algorithm, population=100)")
+    plt.show()
+
+    if args.assignment:
+        writeAssignment(args.assignment, cities, supplier)
+
+    # Plot the results
+    plotMapPymoo(cities, supplier, distances, max_delivery_distance, "Warehouse Placement in Rajasthan with Demand, Supply and\nBudget Constraints Using Genetic Algorithms", './Rajasthan/rajasthan_district.shp')
+
+    metrics.write(objective=float(np.min(res.F)) if res.F is not None else None)
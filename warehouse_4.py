@@ -6,11 +6,19 @@
 # Constraint: A city can supply if there exists a warehouse in that city
 # Constraint: Each warehouse must meet the demand of the cities it serves
 
-from pulp import LpProblem, LpVariable, lpSum, LpMinimize, LpSolverDefault, PULP_CBC_CMD, GUROBI_CMD
+from pulp import LpProblem, LpVariable, lpSum, LpMinimize, GUROBI_CMD, value
 import argparse
-from utils import readDistances, readCityNames, readDemand, readCost, plotMap
-import geopandas as gpd
-import matplotlib.pyplot as plt
+import csv
+import sys
+import numpy as np
+from utils import loadInstance, supplierDict, supplierAssignment, writeAssignment
+from frontier import budgetFrontier
+from matrix_model import buildVariableCapacity
+from heuristics import greedyAdd, vertexSubstitution, placementCost
+from lagrangian import lagrangianRelaxation
+from metrics import Metrics
+from knearest import solveNearest, lagrangianCheck, nearestSummary
+from result_cache import scriptCache
 
 if __name__ == '__main__':
     # Parse command line arguments
@@ -19,116 +27,236 @@ if __name__ == '__main__':
                         default=10.0, help='Budget constraint')
     parser.add_argument('-p', '--plot', action='store_false',
                         help='Plot the warehouse placement')
+    parser.add_argument('-m', '--matrix', action='store_true',
+                        help='Build the model as a sparse matrix and solve it in memory')
+    parser.add_argument('--backend', choices=['highs', 'cbc'], default='highs',
+                        help='Solver of the sparse matrix model, cbc goes through PuLP')
+    parser.add_argument('-k', '--nearest', type=int, default=None,
+                        help='Only let every city use its K nearest sites, K grows where the optimality check fails, needs --matrix')
+    parser.add_argument('--frontier', action='store_true',
+                        help='Find every budget where the optimum changes instead of solving a single budget')
+    parser.add_argument('-f', '--formulation', choices=['assignment', 'lagrangian'], default='assignment',
+                        help='Single MILP, or a Lagrangian relaxation with a lower bound and a heuristic placement')
+    parser.add_argument('-t', '--time-limit', type=float, default=None,
+                        help='Time limit in seconds of the Lagrangian relaxation')
+    parser.add_argument('-s', '--start', action='store_true',
+                        help='Pass a local search placement as MIP start, needs --matrix with the cbc backend')
+    parser.add_argument('--assignment', metavar='PATH', default=None,
+                        help='Write the warehouse of every city as csv to PATH, scenarios.py evaluates it under random demand')
+    parser.add_argument('--metrics', metavar='PATH', default=None,
+                        help='Write phase timings, model size and solver statistics as JSON to PATH, - for stdout')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Solve even when a run with identical data and options is in the result cache, and do not store the result')
     args = parser.parse_args()
 
+    if args.start and not (args.matrix and args.backend == 'cbc'):
+        parser.error("--start needs --matrix --backend cbc, HiGHS takes no MIP start")
+    if args.formulation == 'lagrangian' and (args.matrix or args.frontier):
+        parser.error("--formulation lagrangian solves a single budget without a MILP model")
+    if args.nearest is not None and (not args.matrix or args.frontier):
+        parser.error("--nearest needs --matrix and solves a single budget")
+    if args.time_limit is not None and args.formulation != 'lagrangian':
+        parser.error("--time-limit only applies to the lagrangian formulation")
+
+    if args.assignment and args.frontier:
+        parser.error("--assignment writes the placement of a single budget")
+
     Budget = args.budget
+    metrics = Metrics('warehouse_4', args.metrics)
 
     # Initialize the dictionary to store distances
-    distances = readDistances('./Rajasthan/distances.csv')
-    cities = readCityNames('./Rajasthan/distances.csv')
-    demand = readDemand('./Rajasthan/demand.csv')
-    fixedCost, scalingCost = readCost('./Rajasthan/cost.csv')
-    cities = readCityNames('./Rajasthan/distances.csv')
-
-    ## Create LP problem
-    prob = LpProblem("Warehouse_Placement", LpMinimize)
-    
-    ## Design variables
-    # If a city i is supplied by a warehouse at city j
-    supplier = LpVariable.dicts("Supplier", (cities, cities), cat='Binary')
-    # Variable capacity warehouse
-    supplierCapacity = LpVariable.dicts("SupplierCapacity", (cities), cat='Continuous', lowBound=0.0)
-    # Total fixed cost of building warehouses
-    total_fixed_cost = lpSum((supplier[city][city] * fixedCost[city] + supplierCapacity[city] * scalingCost[city]) for city in cities)
-    # Total cost of operating warehouses
-    total_operating_cost = lpSum(distances[city1][city2] * demand[city1] * supplier[city1][city2] for city1 in cities for city2 in cities)
-
-    ## Objective function: Minimize max delivery distance
-    prob += total_operating_cost
-    
-    
-    ## Constraints
-    # Constraint: Budget constraint
-    prob += total_fixed_cost <= Budget
-    
-    # Constraint: Each city is covered by exactly one warehouse
-    for city1 in cities:
-        prob += lpSum(supplier[city1][city2] for city2 in cities) == 1
-
-    # Constraint: A city can supply if there exists a warehouse in that city
-    for city1 in cities:
+    metrics.mark('load')
+    instance = loadInstance('./Rajasthan')
+    cities = instance.cities
+    distances = instance.distanceDict()
+    demand = instance.vectorDict(instance.demand)
+    fixedCost = instance.vectorDict(instance.fixedCost)
+    scalingCost = instance.vectorDict(instance.scalingCost)
+
+    if args.frontier:
+        # One csv row per breakpoint, the objective holds from this budget up to the previous row
+        metrics.mark('build')
+        model = buildVariableCapacity(instance.distances, instance.demand, instance.fixedCost, instance.scalingCost, Budget)
+        metrics.matrixSize(model)
+        metrics.mark('solve')
+        writer = csv.writer(sys.stdout)
+        writer.writerow(['budget', 'operating_cost', 'n_warehouses', 'warehouses'])
+        budgets, objectives = [], []
+        for spent, obj, x in budgetFrontier(model, args.backend):
+            warehouses = [cities[j] for j in np.unique(model.assignment(x))]
+            writer.writerow([spent, obj, len(warehouses), ';'.join(warehouses)])
+            sys.stdout.flush()
+            budgets.append(spent)
+            objectives.append(obj)
+        metrics.set('solver', solver=args.backend, breakpoints=len(budgets))
+        if args.plot and budgets:
+            metrics.mark('plot')
+            from plotting import plotFrontier
+            plotFrontier(budgets, objectives, 'Total Operating Cost', 'Operating Cost vs Budget')
+        metrics.write(status=1 if budgets else -1, budgets=budgets, objectives=objectives)
+        exit(0)
+
+    # A run with identical data and options gets the stored result without solving
+    # The Lagrangian heuristic proves neither optimality nor infeasibility, its runs are not stored
+    metrics.mark('cache')
+    if args.formulation == 'lagrangian':
+        cache, key, cached = None, None, None
+    else:
+        cache, key, cached = scriptCache('warehouse_4', args, instance)
+
+    if cached is not None:
+        metrics.set('solver', solver='cache')
+        status, obj = cached['status'], cached['objective']
+        if status == 1:
+            supplier = supplierDict(cities, cached['assignment'])
+            capacity = instance.vectorDict(cached['capacity'])
+            fixed_cost, operating_cost = cached['fixed_cost'], cached['operating_cost']
+    elif args.formulation == 'lagrangian':
+        metrics.mark('solve')
+        assignment, operating_cost, lower_bound, stats = lagrangianRelaxation(
+            instance.distances, instance.demand, instance.fixedCost, instance.scalingCost, Budget,
+            time_limit=args.time_limit)
+        metrics.set('solver', solver='lagrangian', **stats)
+        status = 1 if assignment is not None else -1
+        if status == 1:
+            # Every warehouse is built with exactly the capacity of the demand it serves
+            N = len(cities)
+            supplier = supplierDict(cities, assignment)
+            served = np.bincount(assignment, instance.demand, N)
+            capacity = instance.vectorDict(served)
+            fixed_cost = instance.fixedCost[np.unique(assignment)].sum() + served @ instance.scalingCost
+            obj = operating_cost
+    elif args.matrix:
+        metrics.mark('build')
+        # The models over the nearest sites are built in the solve phase, one per round
+        if args.nearest is None:
+            model = buildVariableCapacity(instance.distances, instance.demand, instance.fixedCost,
+                                          instance.scalingCost, Budget)
+            metrics.matrixSize(model)
+        metrics.mark('solve')
+        start = None
+        if args.start:
+            # Greedy ADD placement within the budget, improved by vertex substitution, capacity equals the served demand
+            warehouses = greedyAdd(instance.distances, instance.demand, fixedCost=instance.fixedCost,
+                                   scalingCost=instance.scalingCost, budget=Budget)
+            if warehouses is not None:
+                warehouses, _ = vertexSubstitution(instance.distances, warehouses, instance.demand,
+                                                   fixedCost=instance.fixedCost, scalingCost=instance.scalingCost,
+                                                   budget=Budget)
+                assignment, _, _ = placementCost(instance.distances, instance.demand, warehouses)
+                start = (assignment, np.bincount(assignment, instance.demand, len(cities)))
+        if args.nearest is not None:
+            model, status, obj, x, rounds = solveNearest(
+                lambda arcs: buildVariableCapacity(instance.distances, instance.demand, instance.fixedCost,
+                                                   instance.scalingCost, Budget, arcs),
+                instance.distances, args.nearest,
+                lagrangianCheck(instance.distances, instance.demand, instance.fixedCost, instance.scalingCost, Budget),
+                args.backend, start=start, log_path=metrics.cbcLogPath())
+            print(nearestSummary(rounds, len(cities)))
+            metrics.matrixSize(model)
+            metrics.set('model', nearest_rounds=rounds)
+        else:
+            status, obj, x = model.solve(args.backend, start=None if start is None else model.startVector(*start),
+                                         log_path=metrics.cbcLogPath())
+        metrics.matrixSolver(model, args.backend)
+        if status == 1:
+            N = len(cities)
+            assignment = model.assignment(x)
+            supplier = supplierDict(cities, assignment)
+            capacity = instance.vectorDict(x[model.n_arcs:])
+            is_open = np.zeros(N)
+            is_open[assignment] = 1
+            fixed_cost = is_open @ instance.fixedCost + x[model.n_arcs:] @ instance.scalingCost
+            operating_cost = obj
+    else:
+        ## Create LP problem
+        metrics.mark('build')
+        prob = LpProblem("Warehouse_Placement", LpMinimize)
+
+        ## Design variables
+        # If a city i is supplied by a warehouse at city j
+        supplier = LpVariable.dicts("Supplier", (cities, cities), cat='Binary')
+        # Variable capacity warehouse
+        supplierCapacity = LpVariable.dicts("SupplierCapacity", (cities), cat='Continuous', lowBound=0.0)
+        # Total fixed cost of building warehouses
+        total_fixed_cost = lpSum((supplier[city][city] * fixedCost[city] + supplierCapacity[city] * scalingCost[city]) for city in cities)
+        # Total cost of operating warehouses
+        total_operating_cost = lpSum(distances[city1][city2] * demand[city1] * supplier[city1][city2] for city1 in cities for city2 in cities)
+
+        ## Objective function: Minimize max delivery distance
+        prob += total_operating_cost
+
+
+        ## Constraints
+        # Constraint: Budget constraint
+        prob += total_fixed_cost <= Budget
+
+        # Constraint: Each city is covered by exactly one warehouse
+        for city1 in cities:
+            prob += lpSum(supplier[city1][city2] for city2 in cities) == 1
+
+        # Constraint: A city can supply if there exists a warehouse in that city
+        for city1 in cities:
+            for city2 in cities:
+                prob += supplier[city1][city2] <= supplier[city2][city2]
+
+        # Constraint: Each warehouse must meet the demand of the cities it serves
         for city2 in cities:
-            prob += supplier[city1][city2] <= supplier[city2][city2]
-
-    # Constraint: Each warehouse must meet the demand of the cities it serves
-    for city2 in cities:
-        prob += lpSum(supplier[city1][city2] * demand[city1]
-                      for city1 in cities) <= supplierCapacity[city2]
-
-    ## Solve the LP problem
-    solver = LpSolverDefault
-    # prob.solve(GUROBI_CMD(msg=0))
-    prob.solver(PULP_CBC_CMD(msg=0))
-    
+            prob += lpSum(supplier[city1][city2] * demand[city1]
+                          for city1 in cities) <= supplierCapacity[city2]
+
+        metrics.pulpSize(prob)
+
+        ## Solve the LP problem
+        metrics.mark('solve')
+        # prob.solve(GUROBI_CMD(msg=0))
+        prob.solve(metrics.cbcSolver(msg=0))
+        metrics.cbcLog()
+        status = prob.status
+        if status == 1:
+            obj = prob.objective.value()
+            fixed_cost = total_fixed_cost.value()
+            operating_cost = total_operating_cost.value()
+            capacity = {city: supplierCapacity[city].value() for city in cities}
+
+    if cache is not None and cached is None:
+        extra = {}
+        if status == 1:
+            extra.update(capacity=[capacity[city] for city in cities], fixed_cost=fixed_cost,
+                         operating_cost=operating_cost)
+        cache.store(key, status, obj if status == 1 else None,
+                    supplierAssignment(cities, supplier) if status == 1 else None, **extra)
+
     # Check the status of the solution
-    if prob.status != 1:
-        print("Infeasible")
+    metrics.mark('report')
+    if status != 1:
+        print("Infeasible" if args.formulation != 'lagrangian' or stats['infeasible'] else "No placement found within the budget")
     else:
-        print("Objective: ", prob.objective.value())
-        print("Fixed cost: ", total_fixed_cost.value())
-        print("Operating cost: ", total_operating_cost.value())
-        print("Total cost: ", total_fixed_cost.value() + total_operating_cost.value())
+        print("Objective: ", obj)
+        print("Fixed cost: ", fixed_cost)
+        print("Operating cost: ", operating_cost)
+        print("Total cost: ", fixed_cost + operating_cost)
         print("Budget: ", Budget)
+        if args.formulation == 'lagrangian':
+            print("Lower bound: ", lower_bound)
+            print("Gap: ", stats['gap'])
         # Print the supplier capacity
         for city in cities:
-            if supplierCapacity[city].value() > 0:
-                print(f"{city}: {supplierCapacity[city].value()}", supplier[city][city].value())
-        
-        obj = total_fixed_cost.value() + total_operating_cost.value()
+            if capacity[city] > 0:
+                print(f"{city}: {capacity[city]}", value(supplier[city][city]))
+        total_cost = fixed_cost + operating_cost
 
+    if args.assignment and status == 1:
+        writeAssignment(args.assignment, cities, supplier)
 
+    if args.plot and status == 1:
+        metrics.mark('plot')
+        from plotting import plotMap
+        plotMap(cities, supplier, distances, total_cost, 'Variable Capacity Warehouses\nand Budget Constraint using MILP',
+                './Rajasthan/rajasthan_district.shp', label='Total Operating Cost', highlight=False)
 
-    if args.plot and prob.status == 1:
-        # Load the map of Rajasthan
-        map = gpd.read_file(filename='./Rajasthan/rajasthan_district.shp')
-
-        # Plot the map
-        map.plot()
-
-        # Plot the selected cities and warehouses
-        selected_cities = [
-            city for city in cities if supplier[city][city].value() == 1]
-        for city in cities:
-            city_data = map[map['district'] == city]
-            city_geom = city_data.geometry.values[0]
-            city_centroid = city_geom.centroid
-
-            if city in selected_cities:
-                plt.text(city_centroid.x, city_centroid.y, city, ha='center', va='bottom', fontsize=10, color='white',
-                            fontweight='bold', bbox=dict(facecolor='black', alpha=0.4, boxstyle='round,pad=0.2'))
-                plt.scatter(city_centroid.x, city_centroid.y,
-                            color='red', marker='s', label='Warehouse')
-            else:
-                plt.text(city_centroid.x, city_centroid.y, city,
-                            ha='center', va='bottom', fontsize=8)
-
-        # Draw lines between warehouses and cities
-        for city1 in cities:
-            for city2 in cities:
-                if supplier[city1][city2].value() == 1:
-                    city1_data = map[map['district'] == city1]
-                    city2_data = map[map['district'] == city2]
-                    city1_geom = city1_data.geometry.values[0]
-                    city2_geom = city2_data.geometry.values[0]
-                    plt.plot([city1_geom.centroid.x, city2_geom.centroid.x], [
-                                city1_geom.centroid.y, city2_geom.centroid.y], 'k-', lw=1.5, alpha=0.5)
-
-        plt.title('Variable Capacity Warehouses\nand Budget Constraint using MILP')
-        plt.axis('off')
-        plt.text(0.5, 0.01, f"Total Operating Cost: {obj:.2f}",
-                    fontsize=12, color='black',
-                    fontweight='bold',
-                    horizontalalignment='center',
-                    verticalalignment='center',
-                    transform=plt.gca().transAxes)
-        plt.show()
\ No newline at end of file
+    if status == 1:
+        metrics.write(status=status, objective=obj, fixed_cost=fixed_cost, operating_cost=operating_cost,
+                      total_cost=total_cost)
+    else:
+        metrics.write(status=status, objective=None)
@@ -0,0 +1,249 @@
+# Three objective warehouse placement with NSGA-II, replaces the test.py prototype
+
+# Objective function: Minimize the maximum delivery distance
+# Objective function: Minimize the fixed plus capacity scaling cost, every warehouse is built with the capacity of
+# the demand it serves as in warehouse_4.py
+# Objective function: Minimize the operating cost, the demand weighted delivery distance of warehouse_4.py
+# Decision variable: An array of binary variables representing if a warehouse exists in a city
+# Constraint: Each warehouse can serve at most the supply of its city, pymoo ranks infeasible placements behind the
+# feasible ones by their total overload
+
+# The whole population is evaluated at once and the Pareto front found so far is written to csv while the
+# algorithm runs
+
+import argparse
+import csv
+import os
+import sys
+import numpy as np
+from pymoo.core.problem import Problem
+from pymoo.core.callback import Callback
+from pymoo.algorithms.moo.nsga2 import NSGA2
+from pymoo.operators.crossover.pntx import TwoPointCrossover
+from pymoo.operators.mutation.bitflip import BitflipMutation
+from pymoo.operators.sampling.rnd import BinaryRandomSampling
+from pymoo.operators.survival.rank_and_crowding import RankAndCrowding
+from pymoo.termination.max_gen import MaximumGenerationTermination
+from pymoo.util.nds.non_dominated_sorting import NonDominatedSorting
+from pymoo.optimize import minimize
+from utils import loadInstance, supplierDict, writeAssignment
+from warehouse_3_pymoo import nearestOpen
+from metrics import Metrics
+
+OBJECTIVES = ['max_distance', 'cost', 'operating_cost']
+
+class WarehousePlacementPareto(Problem):
+    def __init__(self, cities, distances, supply, demand, fixedCost, scalingCost, chunk_size=2**24, coordinates=None):
+        self.cities = cities
+        self.distances = None if distances is None else np.asarray(distances) # (n_cities, n_cities) matrix
+        self.coordinates = coordinates
+        self.supply = np.asarray(supply, dtype=float)
+        self.demand = np.asarray(demand, dtype=float)
+        self.fixedCost = np.asarray(fixedCost, dtype=float)
+        self.scalingCost = np.asarray(scalingCost, dtype=float)
+        self.n_cities = len(cities)
+        # Maximum number of (individual, city, candidate) entries held in memory at once
+        self.chunk_size = chunk_size
+
+        if coordinates is not None:
+            self.max_distance = coordinates.diameterBound()
+        else:
+            # Candidate warehouses of every city sorted by distance, see warehouse_3_pymoo.nearestOpen
+            self.order = np.argsort(self.distances, axis=1, kind='stable')
+            self.sorted_distances = np.take_along_axis(self.distances, self.order, axis=1)
+            self.max_distance = self.distances.max()
+
+        # Constraints: total overload of the warehouses, at least one warehouse
+        super().__init__(n_var=self.n_cities, n_obj=3, n_ieq_constr=2, xl=0, xu=1, vtype=bool)
+
+    def _evaluate(self, X, out, *args, **kwargs):
+        is_open = np.asarray(X).astype(bool) # (pop, n_cities)
+        n_pop = len(is_open)
+        has_warehouse = is_open.any(axis=1)
+
+        nearest, distance = nearestOpen(self, is_open)
+        # Without any warehouse every city is at the largest distance, a finite penalty
+        distance[~has_warehouse] = self.max_distance
+
+        # Demand served by every warehouse, individuals without any warehouse serve nobody
+        bins = (nearest + self.n_cities * np.arange(n_pop)[:, None])[has_warehouse].ravel()
+        weights = np.broadcast_to(self.demand, (n_pop, self.n_cities))[has_warehouse].ravel()
+        served = np.bincount(bins, weights=weights, minlength=n_pop * self.n_cities).reshape(n_pop, self.n_cities)
+
+        out["F"] = np.column_stack([
+            distance.max(axis=1), # Max delivery distance
+            is_open @ self.fixedCost + served @ self.scalingCost, # Fixed plus capacity scaling cost
+            distance @ self.demand, # Operating cost
+        ])
+        out["G"] = np.column_stack([
+            np.maximum(served - self.supply, 0.0).sum(axis=1), # Demand <= Supply
+            1 - is_open.sum(axis=1), # At least one warehouse
+        ])
+
+def nonDominatedFronts(F, n_stop_if_ranked=None, n_fronts=None, max_elements=2**22):
+    # Fronts of F (minimization) from a domination count computed in blocks of rows, O(n^2) vectorized work and an
+    # (n, n) boolean matrix instead of the python loops of the generic fast non-dominated sort
+    F = np.asarray(F, dtype=float)
+    n = len(F)
+    dominates = np.zeros((n, n), dtype=bool)
+    step = max(1, max_elements // max(n, 1))
+    for start in range(0, n, step):
+        # One objective at a time, numpy reduces slowly over a short last axis
+        block = F[start:start+step]
+        no_worse = np.ones((len(block), n), dtype=bool)
+        better = np.zeros((len(block), n), dtype=bool)
+        for m in range(F.shape[1]):
+            no_worse &= block[:, m, None] <= F[None, :, m]
+            better |= block[:, m, None] < F[None, :, m]
+        dominates[start:start+step] = no_worse & better
+
+    count = dominates.sum(axis=0) # Number of individuals dominating each one
+    remaining = np.ones(n, dtype=bool)
+    fronts, n_ranked = [], 0
+    while remaining.any() and (n_fronts is None or len(fronts) < n_fronts):
+        front = np.flatnonzero(remaining & (count == 0))
+        fronts.append(front)
+        remaining[front] = False
+        n_ranked += len(front)
+        if n_stop_if_ranked is not None and n_ranked >= n_stop_if_ranked:
+            break
+        count -= dominates[front].sum(axis=0)
+    return fronts
+
+class VectorizedNonDominatedSorting(NonDominatedSorting):
+    # Drop-in sorting of the NSGA-II survival based on nonDominatedFronts
+    def do(self, F, return_rank=False, only_non_dominated_front=False, n_stop_if_ranked=None, n_fronts=None,
+           **kwargs):
+        fronts = nonDominatedFronts(F, n_stop_if_ranked, 1 if only_non_dominated_front else n_fronts)
+        if only_non_dominated_front:
+            return fronts[0] if fronts else np.array([], dtype=int)
+        if return_rank:
+            rank = np.full(len(F), sys.maxsize, dtype=int)
+            for k, front in enumerate(fronts):
+                rank[front] = k
+            return fronts, rank
+        return fronts
+
+def paretoSorting():
+    # pymoo versions that rank through the compiled moocore package keep their own sorting, older ones get the
+    # vectorized sort instead of python loops that take seconds per generation with populations in the thousands
+    import pymoo.util.nds.non_dominated_sorting as nds
+    return NonDominatedSorting() if hasattr(nds, 'pareto_rank') else VectorizedNonDominatedSorting()
+
+class ParetoExport(Callback):
+    # Archive of every feasible non-dominated placement found so far, rewritten to a csv every `every` generations
+    # when it changed. The file is replaced atomically so it can be read while the algorithm runs
+    def __init__(self, path, cities, every=10, callback=None):
+        super().__init__()
+        self.path = path
+        self.cities = cities
+        self.every = every
+        self.callback = callback # Another callback notified every generation, e.g. Metrics.gaCallback()
+        self.X = np.zeros((0, len(cities)), dtype=bool)
+        self.F = np.zeros((0, 3))
+        self.changed = False
+
+    def notify(self, algorithm):
+        if self.callback is not None:
+            self.callback(algorithm)
+        pop = algorithm.pop
+        feasible = pop.get("feasible")[:, 0]
+        if feasible.any():
+            X = np.vstack([self.X, pop.get("X")[feasible].astype(bool)])
+            F = np.vstack([self.F, pop.get("F")[feasible]])
+            _, unique = np.unique(np.packbits(X, axis=1), axis=0, return_index=True)
+            X, F = X[unique], F[unique]
+            front = nonDominatedFronts(F, n_fronts=1)[0]
+            if len(front) != len(self.X) or not np.array_equal(np.sort(F[front], axis=0), np.sort(self.F, axis=0)):
+                self.X, self.F, self.changed = X[front], F[front], True
+        if self.changed and algorithm.n_gen % self.every == 0:
+            self.write()
+
+    def write(self):
+        order = np.lexsort(self.F.T[::-1])
+        with open(f'{self.path}.{os.getpid()}.tmp', 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(OBJECTIVES + ['n_warehouses', 'warehouses'])
+            for k in order:
+                warehouses = [self.cities[j] for j in np.flatnonzero(self.X[k])]
+                writer.writerow(list(self.F[k]) + [len(warehouses), ';'.join(warehouses)])
+        os.replace(f'{self.path}.{os.getpid()}.tmp', self.path)
+        self.changed = False
+
+if __name__ == '__main__':
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description='Three objective Warehouse Placement')
+    parser.add_argument('-p', '--plot', action='store_false',
+                        help='Plot the Pareto front')
+    parser.add_argument('--pop-size', type=int, default=200,
+                        help='Population size of NSGA-II')
+    parser.add_argument('-g', '--generations', type=int, default=300,
+                        help='Number of generations')
+    parser.add_argument('-o', '--output', metavar='PATH', default='pareto_front.csv',
+                        help='csv the Pareto front is written to while the algorithm runs')
+    parser.add_argument('--export-every', type=int, default=10,
+                        help='Generations between two writes of the Pareto front')
+    parser.add_argument('--coordinates', action='store_true',
+                        help='Compute distances from the city coordinates (coordinates.csv, else the district centroids of the shapefile) with KD-tree nearest warehouse queries')
+    parser.add_argument('--assignment', metavar='PATH', default=None,
+                        help='Write the warehouse of every city of the front placement with the lowest operating cost as csv to PATH')
+    parser.add_argument('--metrics', metavar='PATH', default=None,
+                        help='Write phase timings, generations and evaluations per second as JSON to PATH, - for stdout')
+    args = parser.parse_args()
+
+    metrics = Metrics('warehouse_pareto_pymoo', args.metrics)
+
+    metrics.mark('load')
+    instance = loadInstance('./Rajasthan', coordinates=args.coordinates)
+    cities = instance.cities
+    coordinates = None
+    if args.coordinates:
+        from geo import shapefileCoordinates
+        coordinates = instance.coordinates or shapefileCoordinates('./Rajasthan/rajasthan_district.shp', cities)
+
+    # Create the problem instance
+    metrics.mark('build')
+    problem = WarehousePlacementPareto(cities, None if args.coordinates else instance.distances, instance.supply,
+                                       instance.demand, instance.fixedCost, instance.scalingCost,
+                                       coordinates=coordinates)
+    metrics.set('model', variables=problem.n_var, constraints=problem.n_ieq_constr, objectives=problem.n_obj)
+
+    # Configure the genetic algorithm
+    algorithm = NSGA2(
+        pop_size=args.pop_size,
+        sampling=BinaryRandomSampling(),
+        crossover=TwoPointCrossover(),
+        mutation=BitflipMutation(),
+        survival=RankAndCrowding(nds=paretoSorting()),
+        eliminate_duplicates=True
+    )
+    export = ParetoExport(args.output, cities, args.export_every, callback=metrics.gaCallback())
+
+    # Perform optimization
+    metrics.mark('solve')
+    res = minimize(problem, algorithm, MaximumGenerationTermination(args.generations), callback=export, seed=1,
+                   verbose=False)
+    export.write()
+
+    metrics.mark('report')
+    metrics.gaResult(res)
+    print(f"Pareto front: {len(export.F)} placements, written to {args.output}")
+    if len(export.F) > 0:
+        for k, name in enumerate(OBJECTIVES):
+            best = export.F[:, k].argmin()
+            print(f"Best {name}: {export.F[best, k]:.2f} "
+                  f"({', '.join(f'{other} {export.F[best, m]:.2f}' for m, other in enumerate(OBJECTIVES) if m != k)}, "
+                  f"{int(export.X[best].sum())} warehouses)")
+
+    if args.assignment and len(export.F) > 0:
+        is_open = export.X[export.F[:, 2].argmin()][None]
+        nearest, _ = nearestOpen(problem, is_open)
+        writeAssignment(args.assignment, cities, supplierDict(cities, nearest[0]))
+
+    if args.plot and len(export.F) > 0:
+        metrics.mark('plot')
+        from plotting import plotParetoFront
+        plotParetoFront(export.F, ['Max Delivery Distance', 'Fixed + Scaling Cost', 'Operating Cost'],
+                        'Pareto Front of the Warehouse Placement (NSGA-II)')
+
+    metrics.write(front_size=len(export.F), front=export.F.tolist())
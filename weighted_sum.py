@@ -0,0 +1,141 @@
+# Weighted sum trade-off between the max delivery distance (warehouse_1.py to warehouse_3.py) and the operating cost
+# (warehouse_4.py), the loop of multi-objective.ipynb without building a new problem for every weight
+# ParametricModel builds the constraints once: a weight point only replaces the objective vector, a right hand side
+# change only the bounds of a named block, and every solve starts from the previous solution (MIP start of the cbc
+# backend, scipy's HiGHS has none). Every point is yielded as soon as it is solved
+
+import argparse
+import csv
+import sys
+import numpy as np
+from utils import loadInstance
+from matrix_model import buildPCenter, buildCapacitatedPCenter, buildBudgetPCenter
+
+FORMULATIONS = {
+    # warehouse_1.py constraints, the right hand side is the number of warehouses
+    'pcenter': lambda instance, rhs: buildPCenter(instance.distances, int(rhs)),
+    # warehouse_2.py constraints, with demand and supply
+    'capacitated': lambda instance, rhs: buildCapacitatedPCenter(instance.distances, instance.supply, instance.demand,
+                                                                 int(rhs)),
+    # warehouse_3.py constraints, the right hand side is the budget on the fixed cost
+    'budget': lambda instance, rhs: buildBudgetPCenter(instance.distances, instance.supply, instance.demand,
+                                                       instance.fixedCost, rhs),
+}
+# Named block and bounds of the right hand side of every formulation
+RHS = {
+    'pcenter': ('n_warehouses', lambda rhs: (int(rhs), int(rhs))),
+    'capacitated': ('n_warehouses', lambda rhs: (int(rhs), int(rhs))),
+    'budget': ('budget', lambda rhs: (-np.inf, rhs)),
+}
+OBJECTIVES = ['max_distance', 'operating_cost']
+
+class ParametricModel:
+    def __init__(self, model, objectives, scale=None, evaluate=None):
+        # model is a MatrixModel, objectives maps every objective name to its vector over the model columns
+        # scale divides every objective before weighting, evaluate(x) returns the objective values of a solution and
+        # defaults to the objective vectors times x
+        self.model = model
+        self.objectives = {name: np.asarray(c, dtype=float) for name, c in objectives.items()}
+        self.scale = {name: 1.0 for name in objectives} if scale is None else dict(scale)
+        self.evaluate = evaluate
+        self.weights = None
+        self.x = None # Last solution found, MIP start of the next solve
+
+    def setWeights(self, weights):
+        # Objective sum_k weights[k] * objective_k / scale_k, the constraints are left as they are
+        self.weights = dict(weights)
+        self.model.setObjective(sum(w / self.scale[name] * self.objectives[name] for name, w in self.weights.items()))
+
+    def setRhs(self, name, lower, upper):
+        # New bounds of a named constraint block, the previous solution stays as MIP start even if it is now
+        # infeasible, CBC then drops it
+        self.model.setBounds(name, lower, upper)
+
+    def values(self, x):
+        if self.evaluate is not None:
+            return self.evaluate(x)
+        return {name: float(c @ x) for name, c in self.objectives.items()}
+
+    def solve(self, backend='cbc', time_limit=None, msg=False, warm_start=True):
+        # Returns (status, objective values, x) with PuLP status codes, values is None when not solved
+        start = self.x if warm_start else None
+        status, _, x = self.model.solve(backend, time_limit=time_limit, msg=msg, start=start)
+        if status != 1:
+            return status, None, None
+        self.x = x
+        return status, self.values(x), x
+
+def placementModel(instance, formulation, rhs):
+    # ParametricModel of the formulation with its max delivery distance and the operating cost of warehouse_4.py
+    # Both are scaled by the largest value they can take, so that a weight of 1/2 balances them
+    distances = np.asarray(instance.distances, dtype=float)
+    demand = np.asarray(instance.demand, dtype=float)
+    model = FORMULATIONS[formulation](instance, rhs)
+    i, j = model.arcPairs()
+    max_distance = np.zeros(model.n_vars)
+    max_distance[model.n_arcs] = 1
+    operating_cost = np.zeros(model.n_vars)
+    operating_cost[:model.n_arcs] = distances[i, j] * demand[i]
+    N = model.n_cities
+
+    def evaluate(x):
+        # From the assignment, the max distance column is only an upper bound while its weight is 0
+        served = distances[np.arange(N), model.assignment(x)]
+        return {'max_distance': float(served.max()), 'operating_cost': float(demand @ served)}
+
+    scale = {'max_distance': max(distances.max(), 1e-12),
+             'operating_cost': max(demand @ distances.max(axis=1), 1e-12)}
+    return ParametricModel(model, {'max_distance': max_distance, 'operating_cost': operating_cost}, scale, evaluate)
+
+def weightedSum(parametric, alphas, first='max_distance', second='operating_cost', epsilon=1e-4, backend='cbc',
+                time_limit=None):
+    # Minimize alpha * first + (1 - alpha) * second for every alpha, each solve starting from the previous solution
+    # Weights stay above epsilon so that the ends are Pareto optimal instead of only weakly
+    # Yields (alpha, status, values, x) in the order of alphas
+    for alpha in alphas:
+        parametric.setWeights({first: max(alpha, epsilon), second: max(1 - alpha, epsilon)})
+        status, values, x = parametric.solve(backend, time_limit=time_limit)
+        yield alpha, status, values, x
+
+if __name__ == '__main__':
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description='Weighted sum of the max delivery distance and the operating cost')
+    parser.add_argument('-f', '--formulation', choices=list(FORMULATIONS), default='pcenter',
+                        help='Constraints of the model')
+    parser.add_argument('-r', '--rhs', type=float, nargs='+', default=None,
+                        help='Number of warehouses (pcenter, capacitated) or budgets (budget) to sweep, the model is '
+                             'built once and only its right hand side changes. Default 3 warehouses or a budget of 10')
+    parser.add_argument('-s', '--step', type=float, default=0.05,
+                        help='Step of the weight alpha of the max delivery distance between 0 and 1')
+    parser.add_argument('--backend', choices=['highs', 'cbc'], default='cbc',
+                        help='Solver backend, only cbc uses the previous solution as MIP start')
+    parser.add_argument('-t', '--time-limit', type=float, default=None,
+                        help='Time limit of every solve in seconds')
+    parser.add_argument('-o', '--output', metavar='PATH', default=None,
+                        help='Write the csv rows to PATH instead of stdout')
+    args = parser.parse_args()
+
+    instance = loadInstance('./Rajasthan')
+    rhs_values = args.rhs or [3 if args.formulation != 'budget' else 10.0]
+    alphas = np.round(np.linspace(0, 1, int(round(1 / args.step)) + 1), 10)
+
+    # One csv row per solve, streamed as the sweep runs: objectives are inf when infeasible
+    out = open(args.output, 'w', newline='') if args.output else sys.stdout
+    writer = csv.writer(out)
+    writer.writerow(['formulation', RHS[args.formulation][0], 'alpha'] + OBJECTIVES + ['warehouses'])
+    parametric = None
+    for rhs in rhs_values:
+        if parametric is None:
+            parametric = placementModel(instance, args.formulation, rhs)
+        else:
+            parametric.setRhs(RHS[args.formulation][0], *RHS[args.formulation][1](rhs))
+        for alpha, status, values, x in weightedSum(parametric, alphas, backend=args.backend,
+                                                    time_limit=args.time_limit):
+            if status == 1:
+                warehouses = ';'.join(instance.cities[j] for j in np.unique(parametric.model.assignment(x)))
+                writer.writerow([args.formulation, f'{rhs:g}', alpha] + [values[name] for name in OBJECTIVES] + [warehouses])
+            else:
+                writer.writerow([args.formulation, f'{rhs:g}', alpha] + [float('inf')] * len(OBJECTIVES) + [''])
+            out.flush()
+    if out is not sys.stdout:
+        out.close()